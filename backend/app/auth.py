@@ -3,17 +3,53 @@
 Vendors and customers use the same machinery with different idle windows.
 Sessions slide: every authenticated request pushes the expiry forward, so a
 session dies from *inactivity* rather than from a fixed clock started at login.
+
+Slides are written behind: a request records the new expiry in memory and
+`flush_session_slides` writes every pending one in a batched UPDATE, on an
+interval and at shutdown. A worker killed without shutting down loses at most
+one interval of slides — each session then has up to that much less idle time
+left than it was told, never more.
+
+With SESSION_SIGNING_KEY set, new logins get signed tokens instead (see
+`signed_tokens.py`): no row, no lookup, and a slide is a reissued token.
+Opaque tokens from before keep working until they expire.
 """
 
 import os
+import threading
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Type, Union
+from typing import Optional, Type
 
+import structlog
 from fastapi import Depends, Header, HTTPException, Response
+from sqlalchemy import Engine, bindparam, delete, update
 from sqlmodel import Session, select
 
 from .db import engine
-from .models import CustomerAccount, CustomerSession, StoreProfile, VendorSession
+from .models import (
+    CustomerAccount,
+    CustomerSession,
+    SessionRevocation,
+    StoreProfile,
+    VendorSession,
+)
+from .security import generate_session_token
+from .session_cache import OWNERS, Owner, SessionRow, owner_cache, session_cache
+from .signed_tokens import (
+    TOKEN_HEADER,
+    TokenClaims,
+    is_signed,
+    issue_token,
+    new_token_id,
+    read_token,
+    revocations,
+    revoke,
+    signing_enabled,
+    sweep_revocations,
+)
+
+logger = structlog.get_logger()
 
 VENDOR_IDLE_MINUTES = int(os.getenv("VENDOR_IDLE_MINUTES", "20"))
 CUSTOMER_IDLE_MINUTES = int(os.getenv("CUSTOMER_IDLE_MINUTES", "60"))
@@ -33,7 +69,23 @@ TOUCH_INTERVAL_SECONDS = 60
 
 SESSION_HEADER = "X-Session-Expires-At"
 
-SessionRow = Union[VendorSession, CustomerSession]
+# How each kind of session is named inside a signed token, and its idle window.
+KINDS = {VendorSession: "vendor", CustomerSession: "customer"}
+IDLE_MINUTES = {VendorSession: VENDOR_IDLE_MINUTES, CustomerSession: CUSTOMER_IDLE_MINUTES}
+
+SESSION_FLUSH_INTERVAL_SECONDS = float(os.getenv("SESSION_FLUSH_INTERVAL_SECONDS", "5"))
+
+SESSION_SWEEP_INTERVAL_SECONDS = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "600"))
+SESSION_SWEEP_BATCH_SIZE = int(os.getenv("SESSION_SWEEP_BATCH_SIZE", "500"))
+
+# Each sweep batch is its own short write transaction; the pause between them
+# lets queued request writes take the SQLite lock first.
+SESSION_SWEEP_PAUSE_SECONDS = 0.05
+
+# A row is only swept this long after its stored expiry. Another worker may
+# hold a slide for it that it hasn't flushed yet, and that is never more than
+# one flush interval old.
+SESSION_SWEEP_GRACE = timedelta(minutes=5)
 
 
 def get_session():
@@ -55,10 +107,76 @@ def new_expiration(now: datetime, idle_minutes: int) -> datetime:
     return now + idle_window(idle_minutes)
 
 
-def slide_expiration(row: SessionRow, idle_minutes: int, now: datetime) -> datetime:
+def expiry_ceiling(created_at: datetime) -> datetime:
+    return created_at + timedelta(days=ABSOLUTE_TTL_DAYS)
+
+
+def slide_expiration(created_at: datetime, idle_minutes: int, now: datetime) -> datetime:
     """Where the expiry should sit after activity at `now`, capped absolutely."""
-    ceiling = row.created_at + timedelta(days=ABSOLUTE_TTL_DAYS)
-    return min(now + idle_window(idle_minutes), ceiling)
+    return min(now + idle_window(idle_minutes), expiry_ceiling(created_at))
+
+
+def start_session(
+    session: Session, model: Type[SessionRow], owner_id: int, now: datetime
+) -> tuple[str, datetime]:
+    """A new login: its token and when it expires if left idle."""
+    expires_at = new_expiration(now, IDLE_MINUTES[model])
+    if signing_enabled():
+        claims = TokenClaims(KINDS[model], owner_id, now, expires_at, new_token_id())
+        return issue_token(claims), expires_at
+
+    token = generate_session_token()
+    owner_field = OWNERS[model][1]
+    session.add(
+        model(**{owner_field: owner_id}, token=token, created_at=now, expires_at=expires_at)
+    )
+    session.commit()
+    return token, expires_at
+
+
+class PendingSlides:
+    """Expiries extended in memory and not yet written, per session row."""
+
+    def __init__(self) -> None:
+        self._expiries: dict[tuple[type, int], datetime] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._expiries)
+
+    def add(self, model: type, row_id: int, expires_at: datetime) -> None:
+        with self._lock:
+            key = (model, row_id)
+            current = self._expiries.get(key)
+            if current is None or expires_at > current:
+                self._expiries[key] = expires_at
+
+    def get(self, model: type, row_id: int) -> Optional[datetime]:
+        return self._expiries.get((model, row_id))
+
+    def discard(self, model: type, row_id: int) -> None:
+        with self._lock:
+            self._expiries.pop((model, row_id), None)
+
+    def drain(self) -> dict[tuple[type, int], datetime]:
+        """Take everything pending and leave the buffer empty."""
+        with self._lock:
+            expiries, self._expiries = self._expiries, {}
+        return expiries
+
+    def restore(self, expiries: dict[tuple[type, int], datetime]) -> None:
+        """Put back slides whose flush failed; a later slide since wins."""
+        for (model, row_id), expires_at in expiries.items():
+            self.add(model, row_id, expires_at)
+
+
+pending_slides = PendingSlides()
+
+
+def session_expiry(row: SessionRow) -> datetime:
+    """The expiry as of this worker: stored, or pushed further by a pending slide."""
+    pending = pending_slides.get(type(row), row.id)
+    return max(row.expires_at, pending) if pending is not None else row.expires_at
 
 
 def touch_session(
@@ -68,24 +186,124 @@ def touch_session(
     now: datetime,
     force: bool = False,
 ) -> bool:
-    """Push the idle window forward. Returns True when a write happened.
+    """Push the idle window forward. Returns True when the expiry moved.
 
-    Comparing the target against the *stored* expiry is what lets this work
+    Comparing the target against the current expiry is what lets this work
     without a `last_seen_at` column — adding one would mean altering an existing
     table, which `create_all` cannot do.
+
+    The slide is queued for the next flush. `force` writes it now instead, so
+    an explicit keep-alive is durable before it answers.
     """
-    target = slide_expiration(row, idle_minutes, now)
-    if not force and (target - row.expires_at) < timedelta(seconds=TOUCH_INTERVAL_SECONDS):
+    target = slide_expiration(row.created_at, idle_minutes, now)
+    if not force and (target - session_expiry(row)) < timedelta(seconds=TOUCH_INTERVAL_SECONDS):
         return False
+    if not force:
+        pending_slides.add(type(row), row.id, target)
+        return True
+    pending_slides.discard(type(row), row.id)
     row.expires_at = target
     session.add(row)
     session.commit()
     return True
 
 
+def _slide_statement(model: Type[SessionRow]):
+    table = model.__table__
+    return (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        # Never pull back an expiry written since, e.g. by a forced touch.
+        .where(table.c.expires_at < bindparam("slid_to"))
+        .values(expires_at=bindparam("slid_to"))
+    )
+
+
+_slide = {model: _slide_statement(model) for model in OWNERS}
+
+
+def flush_session_slides(bind: Engine) -> int:
+    """Write every pending slide in one transaction; returns sessions touched.
+
+    Core statements, so the session cache hook doesn't see them; the rows are
+    dropped from the cache explicitly instead, once written. On failure the
+    slides go back in the buffer for the next flush.
+    """
+    expiries = pending_slides.drain()
+    if not expiries:
+        return 0
+
+    batches: dict[type, list[dict]] = {}
+    for (model, row_id), expires_at in expiries.items():
+        batches.setdefault(model, []).append({"row_id": row_id, "slid_to": expires_at})
+    try:
+        with bind.begin() as connection:
+            for model, rows in batches.items():
+                connection.execute(_slide[model], rows)
+    except Exception:
+        pending_slides.restore(expiries)
+        raise
+
+    for model, row_id in expiries:
+        session_cache.forget_row(model, row_id)
+    logger.info("session_slides_flushed", sessions=len(expiries))
+    return len(expiries)
+
+
+def sweep_expired_sessions(
+    bind: Engine, now: datetime, batch_size: int = SESSION_SWEEP_BATCH_SIZE
+) -> dict[str, int]:
+    """Delete sessions that expired before `now` minus the grace, a bounded
+    batch per transaction. Returns the rows swept per table.
+
+    This worker's pending slides are flushed first, so a session it just
+    extended is never judged by its stale stored expiry.
+    """
+    flush_session_slides(bind)
+    cutoff = now - SESSION_SWEEP_GRACE
+    swept: dict[str, int] = {}
+    for model in OWNERS:
+        table = model.__table__
+        expired = (
+            select(table.c.id)
+            .where(table.c.expires_at < cutoff)
+            .limit(batch_size)
+            .scalar_subquery()
+        )
+        statement = delete(table).where(table.c.id.in_(expired))
+        total = 0
+        while True:
+            with bind.begin() as connection:
+                removed = connection.execute(statement).rowcount
+            total += removed
+            if removed < batch_size:
+                break
+            time.sleep(SESSION_SWEEP_PAUSE_SECONDS)
+        swept[table.name] = total
+    swept[SessionRevocation.__tablename__] = sweep_revocations(bind, now)
+
+    logger.info("expired_sessions_swept", **swept)
+    return swept
+
+
 def revoke_token(session: Session, model: Type[SessionRow], token: Optional[str]) -> bool:
     if not token:
         return False
+    if is_signed(token):
+        claims = read_token(token)
+        if claims is None or claims.kind != KINDS[model]:
+            return False
+        # Reissues share the token id and may run to the absolute ceiling.
+        revoke(
+            session,
+            SessionRevocation(
+                kind=claims.kind,
+                owner_id=claims.owner_id,
+                token_id=claims.token_id,
+                expires_at=expiry_ceiling(claims.created_at),
+            ),
+        )
+        return True
     row = session.exec(select(model).where(model.token == token)).first()
     if not row:
         return False
@@ -100,37 +318,172 @@ def revoke_other_sessions(
     owner_field,
     owner_id: int,
     keep_token: str,
+    response: Optional[Response] = None,
 ) -> int:
-    rows = session.exec(select(model).where(owner_field == owner_id)).all()
-    removed = 0
-    for row in rows:
-        if row.token != keep_token:
-            session.delete(row)
-            removed += 1
+    """End every session of the owner but `keep_token`'s.
+
+    One DELETE, however long the owner's login history: no row is loaded,
+    and the count comes back from the statement. A bulk delete skips the
+    Session hooks, so the owner's cached tokens are dropped here instead —
+    all of them, the kept one included, which just costs it one query.
+
+    Signed tokens can't be singled out, so all of the owner's are cut off by
+    creation time; if `keep_token` is one of them, a fresh token for the same
+    owner goes out in TOKEN_HEADER on `response` in its place.
+    """
+    statement = (
+        delete(model)
+        .where(owner_field == owner_id)
+        .where(model.token != keep_token)
+        .execution_options(synchronize_session=False)
+    )
+    removed = session.execute(statement).rowcount
     session.commit()
+    session_cache.forget_owner(OWNERS[model][0], owner_id)
+
+    if signing_enabled():
+        now = datetime.utcnow()
+        revoke(
+            session,
+            SessionRevocation(
+                kind=KINDS[model],
+                owner_id=owner_id,
+                revoked_before=now,
+                expires_at=expiry_ceiling(now),
+            ),
+        )
+        if is_signed(keep_token) and response is not None:
+            token, expires_at = start_session(session, model, owner_id, now)
+            response.headers[TOKEN_HEADER] = token
+            response.headers[SESSION_HEADER] = expires_at.isoformat() + "Z"
     return removed
 
 
+# The owner state a session needs to open anything. Checked in SQL on a miss,
+# so a token of a deactivated vivero never hydrates the store.
+OWNER_ALLOWED = {StoreProfile: StoreProfile.is_active, CustomerAccount: CustomerAccount.is_verified}
+
+
+def load_session(session: Session, model: Type[SessionRow], token: str, now: datetime):
+    """The session row and its owner for `token`, from the cache when it can.
+
+    A hit costs no queries: both come back merged into `session` without
+    loading. A miss is one query — the session joined to its owner on the
+    primary key, found by the unique token index, with expiry and the owner's
+    standing checked in the WHERE — and caches the pair it finds. A rejected
+    token comes back as (None, None) either way.
+
+    Expiry is judged by the stored value here. A pending slide only outruns
+    it if flushing has failed for a whole idle window.
+    """
+    cached = session_cache.get(model, token)
+    if cached is not None:
+        return session.merge(cached.row, load=False), session.merge(cached.owner, load=False)
+
+    generation = session_cache.generation
+    owner_model, owner_field = OWNERS[model]
+    found = session.exec(
+        select(model, owner_model)
+        .join(owner_model, owner_model.id == getattr(model, owner_field))
+        .where(model.token == token)
+        .where(model.expires_at >= now)
+        .where(OWNER_ALLOWED[owner_model] == True)  # noqa: E712
+    ).first()
+    if found is None:
+        return None, None
+    row, owner = found
+    session_cache.put(row, owner, generation)
+    return row, owner
+
+
+def load_owner(session: Session, model: type, owner_id: int) -> Optional[Owner]:
+    """A signed token's owner, from the owner cache when it can; None if it
+    is gone or no longer allowed in."""
+    cached = owner_cache.get(model, owner_id)
+    if cached is not None:
+        return session.merge(cached, load=False)
+    generation = owner_cache.generation
+    owner = session.exec(
+        select(model).where(model.id == owner_id).where(OWNER_ALLOWED[model] == True)  # noqa: E712
+    ).first()
+    if owner is not None:
+        owner_cache.put(owner, generation)
+    return owner
+
+
+def signed_claims(model: Type[SessionRow], token: str, now: datetime) -> TokenClaims:
+    claims = read_token(token)
+    if (
+        claims is None
+        or claims.kind != KINDS[model]
+        or claims.expires_at < now
+        or revocations.is_revoked(claims)
+    ):
+        raise HTTPException(status_code=401, detail="Session expired or invalid")
+    return claims
+
+
+def slide_signed(
+    claims: TokenClaims, idle_minutes: int, now: datetime, response: Response, force: bool
+) -> datetime:
+    """touch_session for a signed token: past the threshold, or when forced,
+    the slid token goes out in TOKEN_HEADER. Returns the expiry in force."""
+    target = slide_expiration(claims.created_at, idle_minutes, now)
+    if not force and (target - claims.expires_at) < timedelta(seconds=TOUCH_INTERVAL_SECONDS):
+        return claims.expires_at
+    response.headers[TOKEN_HEADER] = issue_token(claims._replace(expires_at=target))
+    return target
+
+
 def _resolve(
     session: Session,
     model: Type[SessionRow],
     token: Optional[str],
     idle_minutes: int,
     response: Response,
-) -> SessionRow:
+) -> Optional[Owner]:
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
-
-    row = session.exec(select(model).where(model.token == token)).first()
     now = datetime.utcnow()
-    if not row or row.expires_at < now:
-        raise HTTPException(status_code=401, detail="Session expired or invalid")
 
-    touch_session(session, row, idle_minutes, now)
+    if is_signed(token):
+        claims = signed_claims(model, token, now)
+        expires_at = slide_signed(claims, idle_minutes, now, response, force=False)
+        owner = load_owner(session, OWNERS[model][0], claims.owner_id)
+    else:
+        row, owner = load_session(session, model, token, now)
+        if not row or session_expiry(row) < now:
+            raise HTTPException(status_code=401, detail="Session expired or invalid")
+        touch_session(session, row, idle_minutes, now)
+        expires_at = session_expiry(row)
+
     # Lets the browser re-sync its idle clock — important after a laptop sleep,
     # where the client's own timer has no idea how much wall time passed.
-    response.headers[SESSION_HEADER] = row.expires_at.isoformat() + "Z"
-    return row
+    response.headers[SESSION_HEADER] = expires_at.isoformat() + "Z"
+    return owner
+
+
+def renew_session(
+    session: Session,
+    model: Type[SessionRow],
+    token: Optional[str],
+    idle_minutes: int,
+    response: Response,
+) -> datetime:
+    """Slide the window now, whatever the write threshold says."""
+    now = datetime.utcnow()
+    if token and is_signed(token):
+        expires_at = slide_signed(
+            signed_claims(model, token, now), idle_minutes, now, response, True
+        )
+    else:
+        row = session.exec(select(model).where(model.token == token)).first()
+        if not row:
+            raise HTTPException(status_code=401, detail="Session expired or invalid")
+        touch_session(session, row, idle_minutes, now, force=True)
+        expires_at = row.expires_at
+    response.headers[SESSION_HEADER] = expires_at.isoformat() + "Z"
+    return expires_at
 
 
 def get_current_store(
@@ -138,10 +491,9 @@ def get_current_store(
     authorization: Optional[str] = Header(default=None),
     session: Session = Depends(get_session),
 ) -> StoreProfile:
-    row = _resolve(
+    store = _resolve(
         session, VendorSession, bearer_token(authorization), VENDOR_IDLE_MINUTES, response
     )
-    store = session.get(StoreProfile, row.store_id)
     if not store or not store.is_active:
         raise HTTPException(status_code=401, detail="Vendor account inactive")
     return store
@@ -152,10 +504,9 @@ def get_current_customer(
     authorization: Optional[str] = Header(default=None),
     session: Session = Depends(get_session),
 ) -> CustomerAccount:
-    row = _resolve(
+    customer = _resolve(
         session, CustomerSession, bearer_token(authorization), CUSTOMER_IDLE_MINUTES, response
     )
-    customer = session.get(CustomerAccount, row.customer_id)
     if not customer or not customer.is_verified:
         raise HTTPException(status_code=401, detail="Customer account inactive")
     return customer
@@ -0,0 +1,33 @@
+"""Periodic jobs run alongside the app, started and stopped by its lifespan.
+
+Jobs are plain synchronous functions — they talk to the database through the
+same blocking Session/Engine as the handlers — so each run goes to a worker
+thread and never stalls the event loop.
+"""
+
+import asyncio
+from typing import Callable
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+async def run_every(interval_seconds: float, job: Callable[[], object], name: str) -> None:
+    """Run `job` every `interval_seconds` until cancelled.
+
+    A failing run is logged and the schedule carries on; one bad flush must
+    not stop every later one.
+    """
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(job)
+        except Exception:
+            logger.exception("background_job_failed", job=name)
+
+
+async def stop(tasks: list[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,150 @@
+"""`resolve_pricing` for a whole column of listings at once.
+
+Same rule, same rounding, same floor — only the shape differs. Listings become
+NumPy columns once (list prices in integer cents, percents, window bounds as
+epoch microseconds), and pricing them at a given `now` is a handful of array
+operations instead of a Python call with datetime comparisons per listing.
+
+Pure like `pricing.py`: no FastAPI, no Session. `tests/test_pricing.py` runs
+the shared rounding vectors and the precedence cases through both paths.
+"""
+
+from datetime import datetime, timedelta
+from typing import Iterable, NamedTuple, Optional
+
+import numpy as np
+
+from .models import InventoryItem, StoreProfile
+from .pricing import MIN_PRICE_CENTS, Pricing
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# A blank bound is open-ended; these stand in for "no bound" so the window test
+# needs no null handling.
+NO_START = np.iinfo(np.int64).min
+NO_END = np.iinfo(np.int64).max
+
+# Values of BatchPricing.source.
+SOURCE_NONE, SOURCE_ITEM, SOURCE_STORE = 0, 1, 2
+SOURCES = (None, "item", "store")
+
+
+def epoch_micros(moment: Optional[datetime], blank: int) -> int:
+    return blank if moment is None else (moment - EPOCH) // MICROSECOND
+
+
+class BatchPricing(NamedTuple):
+    """One entry per listing, in column order."""
+
+    price: np.ndarray
+    """float64: what the shopper pays."""
+
+    percent: np.ndarray
+    """int64: the percent applied, 0 when none is."""
+
+    source: np.ndarray
+    """int8: SOURCE_NONE, SOURCE_ITEM or SOURCE_STORE."""
+
+    list_price: np.ndarray
+
+    def pricing(self, at: int) -> Pricing:
+        """Entry `at` as the scalar path's Pricing, None where it has None."""
+        if not self.percent[at]:
+            return Pricing(float(self.price[at]), None, None, None)
+        return Pricing(
+            float(self.price[at]),
+            float(self.list_price[at]),
+            int(self.percent[at]),
+            SOURCES[self.source[at]],
+        )
+
+    def pricings(self) -> list[Pricing]:
+        return [self.pricing(at) for at in range(len(self.price))]
+
+
+class PriceColumns(NamedTuple):
+    """Everything `resolve_pricing` reads, one array per field."""
+
+    list_price: np.ndarray
+    price_cents: np.ndarray
+    item_percent: np.ndarray
+    item_starts: np.ndarray
+    item_ends: np.ndarray
+    store_percent: np.ndarray
+    store_starts: np.ndarray
+    store_ends: np.ndarray
+
+    @classmethod
+    def from_rows(
+        cls, rows: Iterable[tuple[InventoryItem, Optional[StoreProfile]]]
+    ) -> "PriceColumns":
+        """A missing store contributes no store discount, as in the scalar path."""
+        # Stores repeat across many rows; read each one's discount once.
+        no_store = (0, NO_START, NO_END)
+        store_terms: dict[int, tuple[int, int, int]] = {}
+
+        list_price, item_percent, item_starts, item_ends, store_rows = [], [], [], [], []
+        for item, store in rows:
+            list_price.append(item.price)
+            item_percent.append(item.discount_percent or 0)
+            starts, ends = item.discount_starts_at, item.discount_ends_at
+            # Inlined `epoch_micros`: this loop runs once per listing.
+            item_starts.append(NO_START if starts is None else (starts - EPOCH) // MICROSECOND)
+            item_ends.append(NO_END if ends is None else (ends - EPOCH) // MICROSECOND)
+            if store is None:
+                store_rows.append(no_store)
+                continue
+            terms = store_terms.get(id(store))
+            if terms is None:
+                terms = store_terms[id(store)] = (
+                    store.store_discount_percent or 0,
+                    epoch_micros(store.store_discount_starts_at, NO_START),
+                    epoch_micros(store.store_discount_ends_at, NO_END),
+                )
+            store_rows.append(terms)
+
+        store_columns = np.array(store_rows, dtype=np.int64).reshape(-1, 3)
+        prices = np.array(list_price, dtype=np.float64)
+        return cls(
+            list_price=prices,
+            # np.rint and round() both send float halves to even, so this is
+            # `apply_percent`'s `round(price * 100)` element for element.
+            price_cents=np.rint(prices * 100).astype(np.int64),
+            item_percent=np.array(item_percent, dtype=np.int64),
+            item_starts=np.array(item_starts, dtype=np.int64),
+            item_ends=np.array(item_ends, dtype=np.int64),
+            store_percent=store_columns[:, 0],
+            store_starts=store_columns[:, 1],
+            store_ends=store_columns[:, 2],
+        )
+
+    def resolve(self, now: datetime) -> BatchPricing:
+        """`resolve_pricing` for every row at `now`; see it for the rules."""
+        at = epoch_micros(now, 0)
+
+        item_live = (self.item_percent > 0) & (self.item_starts <= at) & (at <= self.item_ends)
+        store_live = (
+            ~item_live
+            & (self.store_percent > 0)
+            & (self.store_starts <= at)
+            & (at <= self.store_ends)
+        )
+        percent = np.where(
+            item_live, self.item_percent, np.where(store_live, self.store_percent, 0)
+        )
+
+        effective = (
+            np.maximum((self.price_cents * (100 - percent) + 50) // 100, MIN_PRICE_CENTS) / 100
+        )
+        # A discount that rounds away to nothing is not advertised.
+        discounted = (percent > 0) & (effective < self.list_price)
+
+        return BatchPricing(
+            price=np.where(discounted, effective, self.list_price),
+            percent=np.where(discounted, percent, 0),
+            source=np.where(
+                discounted, np.where(item_live, SOURCE_ITEM, SOURCE_STORE), SOURCE_NONE
+            ).astype(np.int8),
+            list_price=self.list_price,
+        )
@@ -0,0 +1,133 @@
+"""Process-local cache versions, and the write hook that moves them.
+
+Every in-memory cache in the app records the version it was built from and
+rebuilds once that version moves. Versions move from a SQLAlchemy session hook
+rather than from each handler, so a write path added later — or the seed
+script, or a test fixture writing rows directly — cannot forget to invalidate.
+
+The hook only sees writes made through an ORM Session in *this* process. Bulk
+`update()`/`delete()` statements bypass it, and so does another uvicorn
+worker; caches that must tolerate either also carry a max age.
+
+Also home to the conditional-GET helpers. ETags are built from content, never
+from these versions, because versions are per process and an ETag has to mean
+the same thing whichever worker answers the revalidation.
+"""
+
+import os
+import threading
+from datetime import datetime
+from itertools import chain
+from typing import Optional
+
+from fastapi import Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .models import InventoryItem, Promotion, StoreProfile
+
+
+class CacheVersion:
+    """A counter that only goes up. Reading it is lock-free."""
+
+    def __init__(self) -> None:
+        self._value = 0
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+# Listings and the stores that own them: names, addresses, store-wide
+# discounts, and is_active all change what a shopper sees.
+catalog_version = CacheVersion()
+
+# Store rows alone. The carousel shows store names and hides inactive stores,
+# and an inventory edit changes neither.
+stores_version = CacheVersion()
+
+# Promotion rows written through the ORM. Counter increments are Core UPDATEs
+# (see promotion_events.py) and deliberately don't move this.
+promotions_version = CacheVersion()
+
+WATCHED: dict[type, tuple[CacheVersion, ...]] = {
+    InventoryItem: (catalog_version,),
+    StoreProfile: (catalog_version, stores_version),
+    Promotion: (promotions_version,),
+}
+
+_PENDING_KEY = "cache_versions_pending"
+
+# Cache, but ask every time: revalidation is a 304 with no body, and the answer
+# is never staler than the last write.
+REVALIDATE = "no-cache"
+
+# The most a priced response may be reused without asking, even when no
+# discount edge is near. A vivero's own edit can take this long to reach a
+# browser that already holds the page; a sale starting or ending never does,
+# because max-age stops at the next edge.
+PRICED_MAX_AGE_SECONDS = int(os.getenv("CATALOG_MAX_AGE_SECONDS", "30"))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_writes(session: Session, flush_context) -> None:
+    # `new`/`dirty`/`deleted` still hold their pre-flush contents here.
+    pending: set[CacheVersion] = session.info.setdefault(_PENDING_KEY, set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        pending.update(WATCHED.get(type(instance), ()))
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_committed(session: Session) -> None:
+    # Bump only once the rows are durable; a reader that rebuilds in between
+    # would otherwise cache the old rows under the new version.
+    for version in session.info.pop(_PENDING_KEY, ()):
+        version.bump()
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 9110 If-None-Match: weak comparison against any listed tag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag for candidate in if_none_match.split(",")
+    )
+
+
+def max_age_until(next_change: Optional[datetime], now: datetime) -> int:
+    """Whole seconds a response priced at `now` stays right, capped.
+
+    Rounded down, so a cached copy always expires at or before the edge.
+    """
+    if next_change is None:
+        return PRICED_MAX_AGE_SECONDS
+    remaining = int((next_change - now).total_seconds())
+    return max(0, min(PRICED_MAX_AGE_SECONDS, remaining))
+
+
+def cache_control(max_age: int) -> str:
+    return f"max-age={max_age}" if max_age > 0 else REVALIDATE
+
+
+def not_modified(etag: str, max_age: int = 0) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": cache_control(max_age)}
+    )
+
+
+def set_validators(response: Response, etag: str, max_age: int = 0) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = cache_control(max_age)
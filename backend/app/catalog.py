@@ -1,30 +1,43 @@
 """Public storefront catalog — no authentication.
 
 Serves the inventory that viveros manage in their portal to the customer-facing
-shop. Returns the whole catalog in one response so the storefront can filter,
-sort, and paginate instantly; swap to server-side paging once inventory grows
-beyond a few hundred items.
+shop. Two modes on the same route:
+
+- Legacy: no query parameters returns the whole catalog plus facets in one
+  response, which is what the storefront was built around.
+- Paged: `?limit=` and/or `?cursor=` (or any filter) returns one keyset page,
+  newest first, filtered server-side. The first page costs O(page), not
+  O(catalog), however many viveros there are.
 """
 
-from collections import defaultdict
+import base64
+import binascii
+import hashlib
+import threading
 from datetime import datetime
+from typing import NamedTuple, Optional, Union
 
 import structlog
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import and_, case, or_
 from sqlmodel import Session, select
 
+from .cache import cache_control, etag_matches, max_age_until, not_modified, set_validators
+from .compression import EncodedBody, accepted_encoding, variant_etag
 from .db import engine
+from .fts import fts_enabled, search_ids
 from .models import (
     CatalogDetail,
-    CatalogFacets,
     CatalogItem,
+    CatalogPage,
     CatalogPricing,
     CatalogResponse,
-    CatalogVivero,
+    CatalogSearchResponse,
     InventoryItem,
     StoreProfile,
 )
-from .pricing import resolve_pricing
+from .pricing import Pricing, next_price_change, resolve_pricing
+from .snapshot import CatalogSnapshot, current_snapshot, peek_snapshot
 
 logger = structlog.get_logger()
 
@@ -35,19 +48,40 @@ RELATED_LIMIT = 4
 # A cart that large is pathological; the cap keeps the query bounded.
 MAX_PRICING_IDS = 50
 
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Keyset batches start at a page and double up to this while the exact
+# pricing check keeps dropping rows the SQL bounds let through.
+MAX_PAGE_BATCH = 800
+
+# The effective price is rounded half-up to the cent, so it can sit up to
+# about a cent above the unrounded discount the SQL bound computes.
+PRICE_BOUND_SLACK = 0.01
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_QUERY_LENGTH = 100
+
 
 def get_session():
     with Session(engine) as session:
         yield session
 
 
-def build_catalog_item(item: InventoryItem, store: StoreProfile, now: datetime) -> CatalogItem:
+def build_catalog_item(
+    item: InventoryItem,
+    store: StoreProfile,
+    now: datetime,
+    pricing: Optional[Pricing] = None,
+) -> CatalogItem:
     """The one place an InventoryItem becomes a shopper-facing listing.
 
     `now` is passed in rather than read here so every item in a response is
-    priced at the same instant.
+    priced at the same instant. Callers pricing many items at once pass the
+    batch result for this one as `pricing`, resolved at that same `now`.
     """
-    pricing = resolve_pricing(item, store, now)
+    if pricing is None:
+        pricing = resolve_pricing(item, store, now)
     return CatalogItem(
         id=item.id,
         plant_name=item.plant_name,
@@ -69,62 +103,270 @@ def build_catalog_item(item: InventoryItem, store: StoreProfile, now: datetime)
     )
 
 
-def load_active_catalog(
+class CatalogFilters(NamedTuple):
+    genus: Optional[str] = None
+    category: Optional[str] = None
+    vivero: Optional[int] = None
+    on_sale: bool = False
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+
+    def any(self) -> bool:
+        return self != CatalogFilters()
+
+
+def encode_cursor(created_at: datetime, item_id: int) -> str:
+    """Opaque on purpose: clients pass it back verbatim and never build one."""
+    raw = f"{created_at.isoformat()}|{item_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, item_id = raw.split("|")
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as error:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from error
+
+
+def window_live(starts_at, ends_at, now: datetime):
+    """SQL twin of `pricing.window_open`: blank bounds are open, edges inclusive."""
+    return and_(
+        or_(starts_at.is_(None), starts_at <= now),
+        or_(ends_at.is_(None), ends_at >= now),
+    )
+
+
+def live_percent(now: datetime):
+    """SQL twin of `resolve_pricing`'s precedence: the percent taken off each
+    row at `now` — a live item discount, else a live store one, else 0."""
+    return case(
+        (
+            and_(
+                InventoryItem.discount_percent > 0,
+                window_live(InventoryItem.discount_starts_at, InventoryItem.discount_ends_at, now),
+            ),
+            InventoryItem.discount_percent,
+        ),
+        (
+            and_(
+                StoreProfile.store_discount_percent > 0,
+                window_live(
+                    StoreProfile.store_discount_starts_at,
+                    StoreProfile.store_discount_ends_at,
+                    now,
+                ),
+            ),
+            StoreProfile.store_discount_percent,
+        ),
+        else_=0,
+    )
+
+
+def matches_pricing(listing: CatalogItem, filters: CatalogFilters) -> bool:
+    if filters.on_sale and listing.original_price is None:
+        return False
+    if filters.min_price is not None and listing.price < filters.min_price:
+        return False
+    if filters.max_price is not None and listing.price > filters.max_price:
+        return False
+    return True
+
+
+def load_catalog_page(
     session: Session,
-) -> tuple[list[InventoryItem], dict[int, StoreProfile]]:
-    """Every inventory item belonging to an active vivero, plus its store."""
-    stores = session.exec(
-        select(StoreProfile).where(StoreProfile.is_active == True)  # noqa: E712
-    ).all()
-    store_lookup = {store.id: store for store in stores}
-    if not store_lookup:
-        return [], {}
-
-    # Paused listings are hidden from customers entirely; sold-out ones are not.
-    items = session.exec(
-        select(InventoryItem)
-        .where(InventoryItem.store_id.in_(store_lookup.keys()))
+    filters: CatalogFilters,
+    after: Optional[tuple[datetime, int]],
+    limit: int,
+    now: datetime,
+) -> tuple[list[CatalogItem], Optional[str]]:
+    """One page of active listings, newest first, strictly after `after`.
+
+    Everything that can be said in SQL is: store and item visibility, genus,
+    category, vivero, and on-sale / price bounds that can only over-select —
+    the maximum against the live discount, unrounded, with a cent of slack.
+    `resolve_pricing` then makes the exact call on each row, so a
+    rounded-away discount or an effective price outside the range is dropped
+    here rather than disagreeing with the price the shopper sees. The few rows
+    that can still be dropped that way rarely cost a second batch; when they
+    do, batches double rather than crawl a page at a time.
+    """
+    statement = (
+        select(InventoryItem, StoreProfile)
+        .join(StoreProfile, StoreProfile.id == InventoryItem.store_id)
+        .where(StoreProfile.is_active == True)  # noqa: E712
         .where(InventoryItem.is_active == True)  # noqa: E712
-        .order_by(InventoryItem.created_at.desc())
-    ).all()
-    return items, store_lookup
-
+    )
+    if filters.genus:
+        statement = statement.where(InventoryItem.genus == filters.genus)
+    if filters.category:
+        statement = statement.where(InventoryItem.category == filters.category)
+    if filters.vivero is not None:
+        statement = statement.where(InventoryItem.store_id == filters.vivero)
+    if filters.on_sale:
+        statement = statement.where(
+            or_(
+                and_(
+                    InventoryItem.discount_percent > 0,
+                    window_live(
+                        InventoryItem.discount_starts_at, InventoryItem.discount_ends_at, now
+                    ),
+                ),
+                and_(
+                    StoreProfile.store_discount_percent > 0,
+                    window_live(
+                        StoreProfile.store_discount_starts_at,
+                        StoreProfile.store_discount_ends_at,
+                        now,
+                    ),
+                ),
+            )
+        )
+    if filters.min_price is not None:
+        # A discount only ever lowers a price, so the list price is an upper
+        # bound on the effective one.
+        statement = statement.where(InventoryItem.price >= filters.min_price)
+    if filters.max_price is not None:
+        discounted = InventoryItem.price * (100 - live_percent(now)) / 100
+        statement = statement.where(discounted <= filters.max_price + PRICE_BOUND_SLACK)
+    statement = statement.order_by(InventoryItem.created_at.desc(), InventoryItem.id.desc())
+
+    # One extra row answers "is there another page?" without a COUNT.
+    batch_size = limit + 1
+    page: list[CatalogItem] = []
+    position = after
+    while len(page) <= limit:
+        batch = statement
+        if position is not None:
+            created_at, item_id = position
+            batch = batch.where(
+                or_(
+                    InventoryItem.created_at < created_at,
+                    and_(InventoryItem.created_at == created_at, InventoryItem.id < item_id),
+                )
+            )
+        rows = session.exec(batch.limit(batch_size)).all()
+        for item, store in rows:
+            position = (item.created_at, item.id)
+            listing = build_catalog_item(item, store, now)
+            if matches_pricing(listing, filters):
+                page.append(listing)
+                if len(page) > limit:
+                    break
+        if len(rows) < batch_size:
+            break
+        batch_size = min(batch_size * 2, MAX_PAGE_BATCH)
+
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(page[-1].created_at, page[-1].id)
+    return page, next_cursor
+
+
+@router.get("", response_model=Union[CatalogResponse, CatalogPage])
+def list_catalog(
+    cursor: Optional[str] = Query(default=None, description="Opaque; from next_cursor"),
+    limit: Optional[int] = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    genus: Optional[str] = None,
+    category: Optional[str] = None,
+    vivero: Optional[int] = Query(default=None, description="Store id"),
+    on_sale: bool = False,
+    min_price: Optional[float] = Query(default=None, ge=0),
+    max_price: Optional[float] = Query(default=None, ge=0),
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None),
+    session: Session = Depends(get_session),
+):
+    filters = CatalogFilters(genus, category, vivero, on_sale, min_price, max_price)
+    if cursor is None and limit is None and not filters.any():
+        snapshot = current_snapshot(session)
+        now = datetime.utcnow()
+        encoding = accepted_encoding(accept_encoding)
+        etag = variant_etag(snapshot.etag(now), encoding)
+        max_age = max_age_until(snapshot.next_price_change(now), now)
+        if etag_matches(if_none_match, etag):
+            not_modified_response = not_modified(etag, max_age)
+            not_modified_response.headers["Vary"] = "Accept-Encoding"
+            return not_modified_response
+        # Already-encoded bytes, returned as a Response so FastAPI neither
+        # validates nor re-serializes them; see `priced_full_catalog`.
+        return priced_full_catalog(snapshot, now).response(
+            encoding, {"ETag": etag, "Cache-Control": cache_control(max_age)}
+        )
 
-@router.get("", response_model=CatalogResponse)
-def list_catalog(session: Session = Depends(get_session)):
-    items, store_lookup = load_active_catalog(session)
+    # An empty cursor is the first page, so clients can always send the param.
+    after = decode_cursor(cursor) if cursor else None
     now = datetime.utcnow()
+    items, next_cursor = load_catalog_page(session, filters, after, limit or DEFAULT_PAGE_SIZE, now)
+    logger.info("catalog_page_listed", count=len(items), more=next_cursor is not None)
+    return CatalogPage(items=items, next_cursor=next_cursor)
+
+
+class PricedCatalog(NamedTuple):
+    snapshot: CatalogSnapshot
+    priced_at: datetime
+    expires_at: Optional[datetime]
+    """The next discount edge after `priced_at`; None if there is none."""
+    body: EncodedBody
+
+    def valid_at(self, snapshot: CatalogSnapshot, now: datetime) -> bool:
+        return (
+            self.snapshot is snapshot
+            and self.priced_at <= now
+            and (self.expires_at is None or now < self.expires_at)
+        )
 
-    catalog_items = [build_catalog_item(item, store_lookup[item.store_id], now) for item in items]
 
-    genera = sorted({item.genus for item in items if item.genus})
-    categories = sorted({item.category for item in items if item.category})
+_priced_catalog: Optional[PricedCatalog] = None
+_priced_lock = threading.Lock()
 
-    counts: dict[int, int] = defaultdict(int)
-    for item in items:
-        counts[item.store_id] += 1
-    viveros = [
-        CatalogVivero(
-            id=store.id,
-            name=store.name,
-            location=store.address,
-            item_count=counts[store.id],
-        )
-        for store in sorted(store_lookup.values(), key=lambda s: s.name)
-        if counts[store.id] > 0
+
+def priced_full_catalog(snapshot: CatalogSnapshot, now: datetime) -> EncodedBody:
+    """The legacy response, priced, serialized and compressed once, then reused
+    until a price can change.
+
+    Between two discount edges every price is the same, so re-resolving,
+    re-encoding and re-compressing the whole catalog per request bought
+    nothing. A new snapshot or the next edge retires the cached copy.
+
+    One build at a time, as in `snapshot.current_snapshot`: a burst of
+    requests at an edge waits for the first one's encoding rather than each
+    compressing the whole catalog itself.
+    """
+    global _priced_catalog
+
+    cached = _priced_catalog
+    if cached is not None and cached.valid_at(snapshot, now):
+        return cached.body
+
+    with _priced_lock:
+        cached = _priced_catalog
+        if cached is not None and cached.valid_at(snapshot, now):
+            return cached.body
+        body = EncodedBody(list_full_catalog(snapshot, now).model_dump_json().encode())
+        _priced_catalog = PricedCatalog(snapshot, now, snapshot.next_price_change(now), body)
+    return body
+
+
+def list_full_catalog(snapshot: CatalogSnapshot, now: datetime) -> CatalogResponse:
+    """The legacy whole-catalog response, facets included."""
+    priced = snapshot.price_columns.resolve(now)
+    catalog_items = [
+        build_catalog_item(item, snapshot.stores[item.store_id], now, priced.pricing(at))
+        for at, item in enumerate(snapshot.items)
     ]
 
     logger.info("catalog_listed", count=len(catalog_items))
-    return CatalogResponse(
-        total=len(catalog_items),
-        items=catalog_items,
-        facets=CatalogFacets(genera=genera, categories=categories, viveros=viveros),
-    )
+    return CatalogResponse(total=len(catalog_items), items=catalog_items, facets=snapshot.facets)
 
 
 @router.get("/pricing", response_model=list[CatalogPricing])
 def get_pricing(
+    response: Response,
     ids: str = Query(..., description="Comma-separated inventory item ids"),
+    if_none_match: Optional[str] = Header(default=None),
     session: Session = Depends(get_session),
 ):
     """Current price and stock for a set of listings, for re-pricing a cart.
@@ -146,60 +388,146 @@ def get_pricing(
     if not wanted:
         return []
 
-    items, store_lookup = load_active_catalog(session)
     now = datetime.utcnow()
+    snapshot = peek_snapshot()
+    if snapshot is not None:
+        rows = [
+            (item, snapshot.stores[item.store_id])
+            for item in map(snapshot.items_by_id.get, wanted)
+            if item is not None
+        ]
+    else:
+        # Never rebuild the snapshot for a cart: that would make re-pricing
+        # O(catalog) again right after every vendor edit.
+        rows = load_pricing_rows(session, wanted)
 
     priced = []
-    for item in items:
-        if item.id not in wanted:
-            continue
-        pricing = resolve_pricing(item, store_lookup[item.store_id], now)
+    for item, store in sorted(rows, key=lambda row: row[0].id):
+        pricing = resolve_pricing(item, store, now)
         priced.append(
-            CatalogPricing(
-                id=item.id,
-                price=pricing.price,
-                original_price=pricing.original_price,
-                discount_percent=pricing.discount_percent,
-                stock=item.stock,
-            )
+            (item.id, pricing.price, pricing.original_price, pricing.discount_percent, item.stock)
         )
-    return priced
 
+    # From the priced values themselves, so both paths above (and every
+    # worker) agree on the tag for the same answer.
+    etag = f'"cp-{hashlib.blake2b(repr(priced).encode(), digest_size=12).hexdigest()}"'
+    max_age = max_age_until(next_price_change(rows, now), now)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, max_age)
+    set_validators(response, etag, max_age)
+
+    return [
+        CatalogPricing(
+            id=item_id,
+            price=price,
+            original_price=original_price,
+            discount_percent=discount_percent,
+            stock=stock,
+        )
+        for item_id, price, original_price, discount_percent, stock in priced
+    ]
 
-@router.get("/{item_id}", response_model=CatalogDetail)
-def get_catalog_item(item_id: int, session: Session = Depends(get_session)):
-    item = session.get(InventoryItem, item_id)
-    if not item or not item.is_active:
-        raise HTTPException(status_code=404, detail="Item not found")
 
-    store = session.get(StoreProfile, item.store_id)
-    if not store or not store.is_active:
-        raise HTTPException(status_code=404, detail="Item not found")
+def load_pricing_rows(session: Session, ids: set[int]) -> list[tuple[InventoryItem, StoreProfile]]:
+    """Just the requested listings, visible ones only, in one primary-key query.
 
-    all_items, store_lookup = load_active_catalog(session)
+    Scales with the cart, not the catalog.
+    """
+    return session.exec(
+        select(InventoryItem, StoreProfile)
+        .join(StoreProfile, StoreProfile.id == InventoryItem.store_id)
+        .where(InventoryItem.id.in_(ids))
+        .where(InventoryItem.is_active == True)  # noqa: E712
+        .where(StoreProfile.is_active == True)  # noqa: E712
+    ).all()
 
-    def relevance(candidate: InventoryItem) -> int:
-        """Same genus first, then same vivero, then anything else."""
-        if candidate.genus and candidate.genus == item.genus:
-            return 0
-        if candidate.store_id == item.store_id:
-            return 1
-        return 2
 
-    related = sorted(
-        (
-            candidate
-            for candidate in all_items
-            if candidate.id != item.id and candidate.category == item.category
-        ),
-        key=relevance,
-    )[:RELATED_LIMIT]
+@router.get("/search", response_model=CatalogSearchResponse)
+def search_catalog(
+    response: Response,
+    q: str = Query(..., max_length=MAX_QUERY_LENGTH),
+    limit: int = Query(default=DEFAULT_SEARCH_LIMIT, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(default=None),
+    session: Session = Depends(get_session),
+):
+    """Ranked like the storefront's own search; see `app/search.py`.
+
+    Declared before `/{item_id}` for the same reason as `/pricing`.
+    """
+    if fts_enabled():
+        return search_with_fts(session, q, limit)
 
+    snapshot = current_snapshot(session)
     now = datetime.utcnow()
+    etag = snapshot.etag(now)
+    max_age = max_age_until(snapshot.next_price_change(now), now)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, max_age)
+    set_validators(response, etag, max_age)
+
+    results = snapshot.search_index.search(q, limit)
+    logger.info("catalog_searched", count=results.total)
+    return CatalogSearchResponse(
+        total=results.total,
+        items=[
+            build_catalog_item(item, snapshot.stores[item.store_id], now)
+            for item, _score in results.hits
+        ],
+    )
+
+
+def search_with_fts(session: Session, q: str, limit: int) -> CatalogSearchResponse:
+    """The shared-index path: no snapshot, so no per-worker rebuild after a write.
+
+    Costs the FTS query plus one lookup for the page of ids it returned.
+    """
+    ids, total = search_ids(session.connection(), q, limit)
+    rows = []
+    if ids:
+        rows = session.exec(
+            select(InventoryItem, StoreProfile)
+            .join(StoreProfile, StoreProfile.id == InventoryItem.store_id)
+            .where(InventoryItem.id.in_(ids))
+        ).all()
+    found = {item.id: (item, store) for item, store in rows}
+
+    now = datetime.utcnow()
+    logger.info("catalog_searched", count=total, backend="fts5")
+    return CatalogSearchResponse(
+        total=total,
+        items=[build_catalog_item(*found[item_id], now) for item_id in ids if item_id in found],
+    )
+
+
+@router.get("/{item_id}", response_model=CatalogDetail)
+def get_catalog_item(
+    item_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    session: Session = Depends(get_session),
+):
+    snapshot = current_snapshot(session)
+    # The snapshot holds only active items of active stores, so one lookup
+    # covers unknown, paused, and hidden-vivero alike.
+    item = snapshot.items_by_id.get(item_id)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Item not found")
+    store = snapshot.stores[item.store_id]
+
+    now = datetime.utcnow()
+    related = snapshot.related.related(item, RELATED_LIMIT)
+    shown = [(row, snapshot.stores[row.store_id]) for row in (item, *related)]
+
+    etag = snapshot.etag(now)
+    max_age = max_age_until(next_price_change(shown, now), now)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, max_age)
+    set_validators(response, etag, max_age)
+
     return CatalogDetail(
         item=build_catalog_item(item, store, now),
         related=[
-            build_catalog_item(candidate, store_lookup[candidate.store_id], now)
+            build_catalog_item(candidate, snapshot.stores[candidate.store_id], now)
             for candidate in related
         ],
     )
@@ -0,0 +1,86 @@
+"""Response bodies encoded once and served as-is.
+
+For responses that are the same bytes for every caller until the data moves —
+the full catalog above all. The JSON is serialized once and compressed once
+per encoding at build time, so a request costs a header parse and a copy.
+"""
+
+import gzip
+from typing import Optional
+
+import brotli
+from fastapi import Response
+
+# Slow settings are fine: each body is compressed once and served many times.
+# Brotli's top quality, 11, is avoided all the same; on a multi-megabyte
+# catalog it takes seconds for a few percent.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 9
+
+# Best first, for when a client accepts several equally.
+COMPRESSIONS = ("br", "gzip")
+
+
+def accepted_encoding(accept_encoding: Optional[str]) -> str:
+    """The compression the client ranks highest, or identity if it takes none.
+
+    RFC 9110 §12.5.3 q-values rank the codings, COMPRESSIONS' order breaks ties, `q=0`
+    refuses, and `*` covers anything not named. Identity is the fallback
+    rather than a contender: a client that accepts gzip at all would rather
+    have it than the uncompressed catalog.
+    """
+    weights: dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip().lower() == "q":
+            try:
+                q = float(value)
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+
+    ranked = [(weights.get(coding, weights.get("*", 0.0)), coding) for coding in COMPRESSIONS]
+    best, coding = max(ranked, key=lambda pair: pair[0])
+    return coding if best > 0 else "identity"
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """`etag` for the body as sent in `encoding`.
+
+    A strong validator names exact bytes, and the gzip and br bodies are
+    different bytes from the JSON (RFC 9110 §8.8.3), so each coding gets its
+    own tag. Identity keeps the plain one.
+    """
+    if encoding == "identity":
+        return etag
+    return etag.removesuffix('"') + f'-{encoding}"'
+
+
+class EncodedBody:
+    """One JSON body in every encoding we serve. Immutable once built."""
+
+    def __init__(self, identity: bytes) -> None:
+        self.variants = {
+            "identity": identity,
+            "gzip": gzip.compress(identity, compresslevel=GZIP_LEVEL, mtime=0),
+            "br": brotli.compress(identity, quality=BROTLI_QUALITY),
+        }
+
+    @property
+    def identity(self) -> bytes:
+        return self.variants["identity"]
+
+    def response(self, encoding: str, headers: dict[str, str]) -> Response:
+        """The body in `encoding`, from `accepted_encoding`. Any ETag in
+        `headers` should already be that variant's."""
+        headers = {**headers, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(
+            content=self.variants[encoding], media_type="application/json", headers=headers
+        )
@@ -14,7 +14,7 @@ from datetime import datetime
 from typing import Optional
 
 import structlog
-from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
 from sqlmodel import Session, select
 
 from .auth import (
@@ -22,11 +22,13 @@ from .auth import (
     bearer_token,
     get_current_customer,
     get_session,
-    new_expiration,
+    renew_session,
     revoke_other_sessions,
     revoke_token,
-    touch_session,
+    start_session,
 )
+from .kdf import hash_password, rehash_if_outdated, verify_password
+from .login_throttle import client_address, login_throttle
 from .models import (
     ChangePasswordRequest,
     CustomerAccount,
@@ -52,12 +54,9 @@ from .models import (
 from .pricing import resolve_pricing
 from .security import (
     MIN_PASSWORD_LENGTH,
-    generate_session_token,
     generate_verification_code,
-    hash_password,
     hash_verification_code,
     verification_expiration_time,
-    verify_password,
 )
 
 logger = structlog.get_logger()
@@ -239,23 +238,28 @@ def resend_verification(payload: CustomerResendRequest, session: Session = Depen
 
 
 @router.post("/login", response_model=CustomerLoginResponse)
-def login(payload: CustomerLogin, session: Session = Depends(get_session)):
+def login(payload: CustomerLogin, request: Request, session: Session = Depends(get_session)):
+    address = client_address(request)
+    login_throttle.check(payload.email, address)
     customer = session.exec(
         select(CustomerAccount).where(CustomerAccount.email == payload.email)
     ).first()
 
     if not customer or not verify_password(payload.password, customer.password_hash):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    login_throttle.succeeded(payload.email, address)
 
     # A distinct status so the sign-in modal can jump straight to the code pane
     # instead of showing "wrong password" for a correct one.
     if not customer.is_verified:
         raise HTTPException(status_code=403, detail="email_not_verified")
 
-    token = generate_session_token()
-    expires_at = new_expiration(datetime.utcnow(), CUSTOMER_IDLE_MINUTES)
-    session.add(CustomerSession(customer_id=customer.id, token=token, expires_at=expires_at))
-    session.commit()
+    if rehash_if_outdated(customer, payload.password):
+        session.add(customer)
+        session.commit()
+        logger.info("customer_password_rehashed", customer_id=customer.id)
+
+    token, expires_at = start_session(session, CustomerSession, customer.id, datetime.utcnow())
 
     logger.info("customer_logged_in", customer_id=customer.id)
     return CustomerLoginResponse(
@@ -276,6 +280,7 @@ def logout(
 
 @router.post("/session/touch", response_model=SessionWindow)
 def touch(
+    response: Response,
     authorization: Optional[str] = Header(default=None),
     customer: CustomerAccount = Depends(get_current_customer),
     session: Session = Depends(get_session),
@@ -285,13 +290,10 @@ def touch(
     The dependency already slid the window, but only if it had drifted past the
     write threshold. force=True guarantees the user sees a full fresh window.
     """
-    row = session.exec(
-        select(CustomerSession).where(CustomerSession.token == bearer_token(authorization))
-    ).first()
-    if not row:
-        raise HTTPException(status_code=401, detail="Session expired or invalid")
-    touch_session(session, row, CUSTOMER_IDLE_MINUTES, datetime.utcnow(), force=True)
-    return SessionWindow(expires_at=row.expires_at)
+    expires_at = renew_session(
+        session, CustomerSession, bearer_token(authorization), CUSTOMER_IDLE_MINUTES, response
+    )
+    return SessionWindow(expires_at=expires_at)
 
 
 # --- profile --------------------------------------------------------------------
@@ -321,6 +323,7 @@ def update_me(
 @router.post("/change-password", status_code=204)
 def change_password(
     payload: ChangePasswordRequest,
+    response: Response,
     authorization: Optional[str] = Header(default=None),
     customer: CustomerAccount = Depends(get_current_customer),
     session: Session = Depends(get_session),
@@ -344,6 +347,7 @@ def change_password(
         CustomerSession.customer_id,
         customer.id,
         bearer_token(authorization) or "",
+        response,
     )
     logger.info("customer_password_changed", customer_id=customer.id)
 
@@ -13,3 +13,8 @@ engine = create_engine(DATABASE_URL, echo=False, connect_args=connect_args)
 
 def init_db() -> None:
     SQLModel.metadata.create_all(engine)
+    # create_all skips a table that already exists, and with it any index added
+    # to the model since. checkfirst makes this a no-op once they are there.
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
@@ -0,0 +1,112 @@
+"""The full product feed for partners and marketplace aggregators.
+
+`/api/catalog` builds the whole response in memory before sending a byte. The
+feed instead walks active listings by id in fixed-size batches, prices each
+batch at one shared `now`, writes it out, and forgets it — memory stays flat
+however large the catalog is.
+
+The walk runs in its own Session. FastAPI closes request-scoped dependencies
+before a streaming body is sent, so the request's Session is gone by the time
+the first batch is read.
+
+Its own router, included ahead of the catalog's so `/feed` is never parsed as
+an item id by `/{item_id}`.
+"""
+
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Iterator, Literal
+
+import structlog
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from .catalog import build_catalog_item, get_session
+from .models import CatalogItem, InventoryItem, StoreProfile
+
+logger = structlog.get_logger()
+
+router = APIRouter(prefix="/api/catalog", tags=["catalog"])
+
+FEED_BATCH_SIZE = int(os.getenv("CATALOG_FEED_BATCH_SIZE", "1000"))
+
+FEED_COLUMNS = tuple(CatalogItem.model_fields)
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def feed_batches(bind: Engine) -> Iterator[list[tuple[InventoryItem, StoreProfile]]]:
+    """Active listings of active viveros, ascending id, FEED_BATCH_SIZE at a time.
+
+    Keyset on the primary key, so every batch is an index range scan however
+    deep the walk is, and rows inserted behind the cursor are never repeated.
+    """
+    statement = (
+        select(InventoryItem, StoreProfile)
+        .join(StoreProfile, StoreProfile.id == InventoryItem.store_id)
+        .where(StoreProfile.is_active == True)  # noqa: E712
+        .where(InventoryItem.is_active == True)  # noqa: E712
+        .order_by(InventoryItem.id)
+        .limit(FEED_BATCH_SIZE)
+    )
+    last_id = 0
+    with Session(bind) as session:
+        while True:
+            rows = session.exec(statement.where(InventoryItem.id > last_id)).all()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0].id
+            # The identity map would otherwise keep every row ever read.
+            session.expunge_all()
+            if len(rows) < FEED_BATCH_SIZE:
+                return
+
+
+def ndjson_lines(listings: list[CatalogItem]) -> str:
+    return "".join(listing.model_dump_json() + "\n" for listing in listings)
+
+
+def csv_lines(listings: list[CatalogItem], header: bool) -> str:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(FEED_COLUMNS)
+    for listing in listings:
+        row = listing.model_dump(mode="json")
+        writer.writerow("" if row[column] is None else row[column] for column in FEED_COLUMNS)
+    return buffer.getvalue()
+
+
+def stream_feed(bind: Engine, feed_format: str) -> Iterator[str]:
+    """One chunk per batch, every listing priced at the same instant."""
+    now = datetime.utcnow()
+    count = 0
+    if feed_format == "csv":
+        # The header goes out even for an empty catalog.
+        yield csv_lines([], header=True)
+    for rows in feed_batches(bind):
+        listings = [build_catalog_item(item, store, now) for item, store in rows]
+        count += len(listings)
+        yield ndjson_lines(listings) if feed_format == "ndjson" else csv_lines(listings, False)
+    logger.info("catalog_feed_exported", format=feed_format, count=count)
+
+
+@router.get("/feed")
+def export_feed(
+    format: Literal["ndjson", "csv"] = Query(default="ndjson"),
+    session: Session = Depends(get_session),
+):
+    """Every visible listing, priced like the storefront, streamed in batches."""
+    return StreamingResponse(
+        stream_feed(session.get_bind(), format),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="plantera-feed.{format}"'},
+    )
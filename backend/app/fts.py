@@ -0,0 +1,159 @@
+"""Optional SQLite FTS5 index behind `/api/catalog/search`.
+
+The in-memory index in `search.py` is built per process, so N uvicorn workers
+hold N copies and each rebuilds it after every write. With
+CATALOG_SEARCH_BACKEND=fts5 the index lives in the database instead: one copy,
+shared by every worker, ranked by bm25 with the storefront's field weights.
+
+Kept in sync by triggers, one row at a time. Editing a listing rewrites only
+that listing's index row, and only when a searchable column changed — a stock
+or price edit never touches the index. Renaming a vivero rewrites its own
+listings' rows and nothing else.
+
+Matching differs from the in-memory index in one way: FTS5 matches whole
+tokens and token prefixes, so "mons" finds "Monstera" but "stera" does not.
+Accent folding is the tokenizer's `remove_diacritics`.
+"""
+
+import os
+
+from sqlalchemy import Engine, text
+from sqlalchemy.engine import Connection
+
+from .search import WEIGHTS, tokenize
+
+SEARCH_BACKEND = os.getenv("CATALOG_SEARCH_BACKEND", "memory")
+
+FTS_TABLE = "inventory_fts"
+
+# Index column -> its key in search.WEIGHTS. The order fixes the order of
+# bm25's weight arguments.
+FTS_WEIGHT_KEYS = {
+    "plant_name": "name",
+    "genus": "genus",
+    "tags": "tags",
+    "vivero": "vivero",
+    "description": "description",
+}
+FTS_COLUMNS = tuple(FTS_WEIGHT_KEYS)
+BM25_WEIGHTS = ", ".join(str(WEIGHTS[key]) for key in FTS_WEIGHT_KEYS.values())
+
+CREATE_TABLE = f"""
+CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+    {", ".join(FTS_COLUMNS)},
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# Tags are stored comma-separated; spaces keep "sombra,grande" two tokens.
+ROW_VALUES = """
+    {row}.plant_name,
+    coalesce({row}.genus, ''),
+    replace(coalesce({row}.tags, ''), ',', ' '),
+    coalesce((SELECT name FROM storeprofile WHERE id = {row}.store_id), ''),
+    coalesce({row}.description, '')
+"""
+
+TRIGGERS = (
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON inventoryitem BEGIN
+        INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {ROW_VALUES.format(row="new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON inventoryitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+    AFTER UPDATE OF plant_name, genus, tags, description, store_id ON inventoryitem BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE} (rowid, {", ".join(FTS_COLUMNS)})
+        VALUES (new.id, {ROW_VALUES.format(row="new")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_store_rename
+    AFTER UPDATE OF name ON storeprofile BEGIN
+        UPDATE {FTS_TABLE} SET vivero = new.name
+        WHERE rowid IN (SELECT id FROM inventoryitem WHERE store_id = new.id);
+    END
+    """,
+)
+
+
+def fts_enabled() -> bool:
+    return SEARCH_BACKEND == "fts5"
+
+
+def ensure_fts_index(engine: Engine) -> None:
+    """Create the table and triggers if missing, filling the table on creation.
+
+    Idempotent, so it runs on every startup. Once it exists the triggers keep
+    it current and this never rebuilds it.
+    """
+    if engine.dialect.name != "sqlite":
+        raise RuntimeError("CATALOG_SEARCH_BACKEND=fts5 requires SQLite")
+
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": FTS_TABLE},
+        ).first()
+        if not exists:
+            connection.execute(text(CREATE_TABLE))
+            rebuild_fts_index(connection)
+        for trigger in TRIGGERS:
+            connection.execute(text(trigger))
+
+
+def rebuild_fts_index(connection: Connection) -> None:
+    """Repopulate from scratch. Only for creation, or after writes that
+    bypassed the triggers (a restore, a bulk import with triggers dropped)."""
+    connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    connection.execute(
+        text(
+            f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(FTS_COLUMNS)}) "
+            f"SELECT item.id, {ROW_VALUES.format(row='item')} FROM inventoryitem AS item"
+        )
+    )
+
+
+def match_expression(query: str) -> str:
+    """Every token must match, each as a prefix — the storefront's AND rule.
+
+    Tokens are quoted so FTS5 operators typed by a shopper (NEAR, OR, `-`)
+    are searched for rather than obeyed.
+    """
+    return " ".join('"{}"*'.format(token.replace('"', '""')) for token in tokenize(query))
+
+
+def search_ids(connection: Connection, query: str, limit: int) -> tuple[list[int], int]:
+    """Ids of active listings at active viveros, best first, and the match count."""
+    expression = match_expression(query)
+    if not expression:
+        return [], 0
+
+    visible = f"""
+        FROM {FTS_TABLE}
+        JOIN inventoryitem AS item ON item.id = {FTS_TABLE}.rowid
+        JOIN storeprofile AS store ON store.id = item.store_id
+        WHERE {FTS_TABLE} MATCH :expression AND item.is_active AND store.is_active
+    """
+    ranked = (
+        connection.execute(
+            text(
+                f"SELECT item.id {visible} "
+                f"ORDER BY bm25({FTS_TABLE}, {BM25_WEIGHTS}), item.is_featured DESC LIMIT :limit"
+            ),
+            {"expression": expression, "limit": limit},
+        )
+        .scalars()
+        .all()
+    )
+    total = connection.execute(
+        text(f"SELECT count(*) {visible}"), {"expression": expression}
+    ).scalar_one()
+    return ranked, total
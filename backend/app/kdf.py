@@ -0,0 +1,220 @@
+"""Password hashing in its own small process pool, with a bounded queue.
+
+Every login, signup and password change runs 200,000 PBKDF2 iterations. Done
+inline, they sit in FastAPI's shared threadpool, and a burst of logins holds
+the threads the catalog needs. Here the work goes to KDF_WORKERS processes;
+the handler's thread only waits. At most KDF_MAX_QUEUE calls may wait beyond
+the ones running, so a burst can never hold more threads than that — the
+next call fails fast with a 503 and a Retry-After instead of queueing behind
+it.
+
+`security.py` keeps the pure functions; these wrappers are what handlers
+call. KDF_WORKERS=0 runs the KDF on the calling thread, as before.
+
+The cost is chosen per deployment: PASSWORD_HASH_ITERATIONS fixes it, or
+PASSWORD_HASH_TARGET_MS has `configure_hashing` time this host at startup
+and pick the iterations that take that long. Every hash records its own
+cost, so a change needs no migration — `rehash_if_outdated` re-hashes a
+password at the current cost on its next successful login. A fixed cost
+below MIN_PBKDF2_ITERATIONS is raised to it.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+
+import structlog
+from fastapi import HTTPException
+
+from . import security
+
+logger = structlog.get_logger()
+
+KDF_WORKERS = int(os.getenv("KDF_WORKERS", str(min(2, os.cpu_count() or 1))))
+KDF_MAX_QUEUE = int(os.getenv("KDF_MAX_QUEUE", "16"))
+
+PASSWORD_HASH_ITERATIONS = os.getenv("PASSWORD_HASH_ITERATIONS")
+PASSWORD_HASH_TARGET_MS = os.getenv("PASSWORD_HASH_TARGET_MS")
+
+# The cost new hashes get. Set once at startup by configure_hashing, and read
+# here in the app process: workers are told it with every call.
+hash_iterations = security.PBKDF2_ITERATIONS
+
+RETRY_AFTER_SECONDS = 1
+
+# Workers are started from a process that already runs threads (uvicorn's
+# threadpool, the background jobs), where a plain fork can copy a held lock
+# into the child and deadlock it. Python 3.12 warns about exactly that.
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _timed(fn: Callable, args: tuple, submitted_at: float):
+    """Runs in the worker: the result, seconds spent queued, seconds computing.
+
+    Wall-clock time, since the two ends are in different processes.
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started_at - submitted_at, time.perf_counter() - started
+
+
+class KdfSaturated(HTTPException):
+    """The pool's queue is full. A 503 to the client; callers for whom the
+    KDF call is optional catch it instead."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503,
+            detail="Too many sign-ins at once; try again shortly",
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        )
+
+
+class KdfPool:
+    """Admission-controlled executor for KDF calls, with running totals."""
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self._slots = threading.BoundedSemaphore(max(workers, 1) + max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counts = {
+            "completed": 0,
+            "rejected": 0,
+            "in_flight": 0,
+            "wait_seconds_total": 0.0,
+            "compute_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "restarts": 0,
+        }
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Started on first use, so importing the app (tests, seed) forks nothing.
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context(START_METHOD),
+                )
+            return self._executor
+
+    def _discard(self, broken: ProcessPoolExecutor) -> None:
+        """Drop an executor whose worker died, so the next call starts a new one.
+
+        Several callers may see the same breakage; only the first replaces it.
+        """
+        with self._lock:
+            if self._executor is not broken:
+                return
+            self._executor = None
+            self._counts["restarts"] += 1
+        logger.warning("kdf_pool_restarted")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _submit(self, fn: Callable, args: tuple):
+        # A dead worker (OOM kill, segfault) breaks the executor for good:
+        # replace it and try once more, then give up with the 503.
+        for _attempt in range(2):
+            executor = self._pool()
+            try:
+                return executor.submit(_timed, fn, args, time.time()).result()
+            except BrokenProcessPool:
+                self._discard(executor)
+        raise KdfSaturated()
+
+    def run(self, fn: Callable, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._counts["rejected"] += 1
+            logger.warning("kdf_rejected", max_queue=self.max_queue)
+            raise KdfSaturated()
+        with self._lock:
+            self._counts["in_flight"] += 1
+        try:
+            if self.workers > 0:
+                result, waited, computed = self._submit(fn, args)
+            else:
+                result, waited, computed = _timed(fn, args, time.time())
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._counts["in_flight"] -= 1
+
+        with self._lock:
+            self._counts["completed"] += 1
+            self._counts["wait_seconds_total"] += waited
+            self._counts["compute_seconds_total"] += computed
+            self._counts["wait_seconds_max"] = max(self._counts["wait_seconds_max"], waited)
+        return result
+
+    def metrics(self) -> dict[str, float]:
+        with self._lock:
+            return {"workers": self.workers, "max_queue": self.max_queue, **self._counts}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+kdf_pool = KdfPool(KDF_WORKERS, KDF_MAX_QUEUE)
+
+
+def configure_hashing() -> int:
+    """Settle the cost for new hashes from the environment. Returns it."""
+    global hash_iterations
+
+    if PASSWORD_HASH_ITERATIONS:
+        try:
+            requested = int(PASSWORD_HASH_ITERATIONS)
+        except ValueError:
+            raise RuntimeError(
+                f"PASSWORD_HASH_ITERATIONS must be a whole number, not {PASSWORD_HASH_ITERATIONS!r}"
+            ) from None
+        # The same floor calibration keeps: a typo must not weaken every hash.
+        hash_iterations = max(security.MIN_PBKDF2_ITERATIONS, requested)
+        if hash_iterations != requested:
+            logger.warning("kdf_iterations_raised", requested=requested, iterations=hash_iterations)
+        logger.info("kdf_configured", iterations=hash_iterations, source="fixed")
+    elif PASSWORD_HASH_TARGET_MS:
+        target = float(PASSWORD_HASH_TARGET_MS) / 1000
+        hash_iterations = security.calibrate_iterations(target)
+        logger.info(
+            "kdf_configured",
+            iterations=hash_iterations,
+            source="calibrated",
+            target_ms=float(PASSWORD_HASH_TARGET_MS),
+        )
+    return hash_iterations
+
+
+def hash_password(password: str) -> str:
+    return kdf_pool.run(security.hash_password, password, hash_iterations)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    return kdf_pool.run(security.verify_password, password, stored)
+
+
+def rehash_if_outdated(owner, password: str) -> bool:
+    """After a successful verify: give `owner` a hash at the current cost if
+    its stored one is off. True when the caller has a change to commit.
+
+    Best-effort: the password has already checked out, so a full queue skips
+    the rehash — the next login will try again — rather than fail the login.
+    """
+    if not security.needs_rehash(owner.password_hash, hash_iterations):
+        return False
+    try:
+        owner.password_hash = hash_password(password)
+    except KdfSaturated:
+        logger.info("kdf_rehash_skipped")
+        return False
+    return True
@@ -0,0 +1,144 @@
+"""Login throttling, decided before any password is hashed.
+
+Every guess at a login costs a full PBKDF2 run, so credential stuffing turns
+the login endpoints into a CPU amplifier. Each attempt takes a token from two
+buckets — one for the email it names, one for the client address — and an
+attempt finding either empty gets a 429 without reaching `verify_password`.
+Buckets refill continuously. A successful login gives its tokens back, so
+people who sign in correctly, however often, and offices behind one address
+are never throttled by their own successes.
+
+Memory is bounded: each limiter keeps at most LOGIN_THROTTLE_MAX_KEYS
+buckets, least recently used first out. A bucket that has refilled is the
+same as no bucket, so those are dropped whenever they are come across.
+Process-local, like the other caches: each worker throttles on its own.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import structlog
+from fastapi import HTTPException, Request
+
+logger = structlog.get_logger()
+
+LOGIN_EMAIL_BURST = int(os.getenv("LOGIN_EMAIL_BURST", "5"))
+LOGIN_EMAIL_PER_MINUTE = float(os.getenv("LOGIN_EMAIL_PER_MINUTE", "2"))
+LOGIN_IP_BURST = int(os.getenv("LOGIN_IP_BURST", "30"))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", "10"))
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", "50000"))
+
+
+class TokenBuckets:
+    """One token bucket per key: `capacity` tokens, refilled at `per_second`."""
+
+    def __init__(self, capacity: int, per_second: float, max_keys: int) -> None:
+        self.capacity = capacity
+        self.per_second = per_second
+        self.max_keys = max_keys
+        # key -> (tokens, as of monotonic time)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def tokens(self, key: str, now: float) -> float:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return float(self.capacity)
+        tokens, as_of = bucket
+        return min(float(self.capacity), tokens + (now - as_of) * self.per_second)
+
+    def seconds_until_token(self, key: str, now: float) -> float:
+        missing = 1 - self.tokens(key, now)
+        return max(0.0, missing / self.per_second) if self.per_second > 0 else float("inf")
+
+    def add(self, key: str, amount: float, now: float) -> None:
+        tokens = min(float(self.capacity), self.tokens(key, now) + amount)
+        if tokens >= self.capacity:
+            self._buckets.pop(key, None)
+            return
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        # Refilled buckets at the cold end cost nothing to drop; past the
+        # bound, the least recently used go whatever they hold.
+        while self._buckets:
+            oldest = next(iter(self._buckets))
+            if len(self._buckets) <= self.max_keys and self.tokens(oldest, now) < self.capacity:
+                return
+            del self._buckets[oldest]
+
+
+def client_address(request: Request) -> str:
+    """The peer address. Behind a proxy, run uvicorn with --proxy-headers so
+    this is the client's rather than the proxy's."""
+    return request.client.host if request.client else "unknown"
+
+
+class LoginThrottle:
+    def __init__(self) -> None:
+        self.by_email = TokenBuckets(
+            LOGIN_EMAIL_BURST, LOGIN_EMAIL_PER_MINUTE / 60, LOGIN_THROTTLE_MAX_KEYS
+        )
+        self.by_address = TokenBuckets(
+            LOGIN_IP_BURST, LOGIN_IP_PER_MINUTE / 60, LOGIN_THROTTLE_MAX_KEYS
+        )
+        self._lock = threading.Lock()
+        self._counts = {"allowed": 0, "throttled_email": 0, "throttled_ip": 0, "refunded": 0}
+
+    def check(self, email: str, address: str, now: Optional[float] = None) -> None:
+        """Take a token for this attempt from both buckets, or raise a 429."""
+        now = time.monotonic() if now is None else now
+        email = email.strip().lower()
+        with self._lock:
+            if self.by_email.tokens(email, now) < 1:
+                limited, wait = "throttled_email", self.by_email.seconds_until_token(email, now)
+            elif self.by_address.tokens(address, now) < 1:
+                limited, wait = "throttled_ip", self.by_address.seconds_until_token(address, now)
+            else:
+                self.by_email.add(email, -1, now)
+                self.by_address.add(address, -1, now)
+                self._counts["allowed"] += 1
+                return
+            self._counts[limited] += 1
+
+        logger.warning("login_throttled", reason=limited)
+        raise HTTPException(
+            status_code=429,
+            detail="Too many sign-in attempts; try again shortly",
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+        )
+
+    def succeeded(self, email: str, address: str, now: Optional[float] = None) -> None:
+        """Give back the tokens of an attempt whose password was right."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.by_email.add(email.strip().lower(), 1, now)
+            self.by_address.add(address, 1, now)
+            self._counts["refunded"] += 1
+
+    def metrics(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                **self._counts,
+                "tracked_emails": len(self.by_email),
+                "tracked_addresses": len(self.by_address),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self.by_email = TokenBuckets(
+                self.by_email.capacity, self.by_email.per_second, self.by_email.max_keys
+            )
+            self.by_address = TokenBuckets(
+                self.by_address.capacity, self.by_address.per_second, self.by_address.max_keys
+            )
+
+
+login_throttle = LoginThrottle()
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from datetime import datetime
@@ -8,11 +9,22 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from sqlmodel import Session, select
 
-from .auth import SESSION_HEADER
+from .auth import (
+    SESSION_FLUSH_INTERVAL_SECONDS,
+    SESSION_HEADER,
+    SESSION_SWEEP_INTERVAL_SECONDS,
+    flush_session_slides,
+    sweep_expired_sessions,
+)
+from .background import run_every, stop
 from .catalog import router as catalog_router
 from .customer import router as customer_router
 from .db import engine, init_db
+from .feed import router as feed_router
+from .fts import ensure_fts_index, fts_enabled
+from .kdf import configure_hashing, kdf_pool
 from .logging_config import configure_logging
+from .login_throttle import login_throttle
 from .models import (
     AdminCreate,
     AdminProfile,
@@ -29,7 +41,12 @@ from .models import (
     StorePublic,
     StoreUpdate,
 )
-from .promotions import router as promotions_router
+from .promotion_events import FLUSH_INTERVAL_SECONDS, flush_promotion_events
+from .promotion_stats import ROLLUP_INTERVAL_SECONDS, rollup_promotion_stats
+from .promotions import SCHEDULE_REFRESH_SECONDS, refresh_schedule, router as promotions_router
+from .session_cache import SESSION_CACHE_TTL_SECONDS
+from .signed_tokens import TOKEN_HEADER, load_revocations, signing_enabled
+from .snapshot import SNAPSHOT_REFRESH_SECONDS, refresh_snapshot
 from .storage import UPLOAD_DIR, ensure_upload_dir
 from .vendor import router as vendor_router
 
@@ -40,9 +57,80 @@ logger = structlog.get_logger()
 async def lifespan(app: FastAPI):
     configure_logging()
     init_db()
+    configure_hashing()
+    if fts_enabled():
+        ensure_fts_index(engine)
     ensure_upload_dir()
     logger.info("app_started", database_url=os.getenv("DATABASE_URL", "sqlite"))
+    tasks = [
+        asyncio.create_task(
+            run_every(
+                SESSION_FLUSH_INTERVAL_SECONDS,
+                lambda: flush_session_slides(engine),
+                "flush_session_slides",
+            )
+        ),
+        asyncio.create_task(
+            run_every(
+                SESSION_SWEEP_INTERVAL_SECONDS,
+                lambda: sweep_expired_sessions(engine, datetime.utcnow()),
+                "sweep_expired_sessions",
+            )
+        ),
+        asyncio.create_task(
+            run_every(
+                FLUSH_INTERVAL_SECONDS,
+                lambda: flush_promotion_events(engine),
+                "flush_promotion_events",
+            )
+        ),
+        asyncio.create_task(
+            run_every(
+                ROLLUP_INTERVAL_SECONDS,
+                lambda: rollup_promotion_stats(engine, datetime.utcnow()),
+                "rollup_promotion_stats",
+            )
+        ),
+    ]
+    refresh_snapshot(engine)
+    tasks.append(
+        asyncio.create_task(
+            run_every(
+                SNAPSHOT_REFRESH_SECONDS,
+                lambda: refresh_snapshot(engine),
+                "refresh_snapshot",
+            )
+        )
+    )
+    refresh_schedule(engine, datetime.utcnow())
+    tasks.append(
+        asyncio.create_task(
+            run_every(
+                SCHEDULE_REFRESH_SECONDS,
+                lambda: refresh_schedule(engine, datetime.utcnow()),
+                "refresh_schedule",
+            )
+        )
+    )
+    if signing_enabled():
+        load_revocations(engine, datetime.utcnow())
+        # Other workers' logouts; the same bound as their cached sessions.
+        tasks.append(
+            asyncio.create_task(
+                run_every(
+                    SESSION_CACHE_TTL_SECONDS,
+                    lambda: load_revocations(engine, datetime.utcnow()),
+                    "load_revocations",
+                )
+            )
+        )
     yield
+    await stop(tasks)
+    # Whatever arrived since the last tick.
+    flush_session_slides(engine)
+    flush_promotion_events(engine)
+    rollup_promotion_stats(engine, datetime.utcnow())
+    kdf_pool.shutdown()
     logger.info("app_stopped")
 
 
@@ -54,6 +142,8 @@ def get_session():
 app = FastAPI(title="Plantera API", lifespan=lifespan)
 app.include_router(vendor_router)
 app.include_router(customer_router)
+# Before the catalog router: its `/{item_id}` would otherwise claim `/feed`.
+app.include_router(feed_router)
 app.include_router(catalog_router)
 app.include_router(promotions_router)
 
@@ -71,9 +161,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    # Without this the browser silently hides the header cross-origin and the
-    # client's idle timer never learns the server's real session expiry.
-    expose_headers=[SESSION_HEADER],
+    # Without this the browser silently hides the headers cross-origin: the
+    # client's idle timer never learns the server's real session expiry, and a
+    # slid signed token never reaches the client.
+    expose_headers=[SESSION_HEADER, TOKEN_HEADER],
 )
 
 
@@ -83,6 +174,12 @@ def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+def metrics():
+    """Process-local counters, as JSON, for a scraper to poll."""
+    return {"kdf": kdf_pool.metrics(), "login_throttle": login_throttle.metrics()}
+
+
 @app.post("/api/feedback", response_model=FeedbackRead)
 def create_feedback(payload: FeedbackCreate, session: Session = Depends(get_session)):
     feedback = Feedback(name=payload.name, message=payload.message)
@@ -2,7 +2,7 @@ from datetime import datetime
 from typing import Optional
 
 from pydantic import EmailStr
-from sqlalchemy import Column, String
+from sqlalchemy import Column, Index, String
 from sqlmodel import Field, SQLModel
 
 
@@ -199,6 +199,10 @@ class StorePublic(SQLModel):
 
 
 class InventoryItem(SQLModel, table=True):
+    # The storefront's keyset cursor walks (created_at, id) newest first; see
+    # catalog.load_catalog_page.
+    __table_args__ = (Index("ix_inventoryitem_created_at_id", "created_at", "id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     store_id: int = Field(foreign_key="storeprofile.id")
     plant_name: str = Field(max_length=150)
@@ -332,7 +336,8 @@ class VendorSession(SQLModel, table=True):
     # Slides forward on activity; see auth.touch_session. There is no
     # last_seen_at column on purpose — create_all cannot add columns to an
     # existing table, and created_at + expires_at already encode the same thing.
-    expires_at: datetime
+    # Indexed for the expired-session sweep in auth.sweep_expired_sessions.
+    expires_at: datetime = Field(index=True)
 
 
 class CustomerSession(SQLModel, table=True):
@@ -340,7 +345,23 @@ class CustomerSession(SQLModel, table=True):
     customer_id: int = Field(foreign_key="customeraccount.id", index=True)
     token: str = Field(sa_column=Column(String(128), unique=True, index=True))
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    expires_at: datetime
+    expires_at: datetime = Field(index=True)
+
+
+class SessionRevocation(SQLModel, table=True):
+    """A signed session token, or all of an owner's older ones, revoked.
+
+    Exactly one of `token_id` and `revoked_before` is set. `expires_at` is
+    when every token the entry covers has expired and it can be dropped. See
+    signed_tokens.py.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    kind: str = Field(max_length=16)
+    owner_id: int
+    token_id: Optional[str] = Field(default=None, max_length=32)
+    revoked_before: Optional[datetime] = None
+    expires_at: datetime = Field(index=True)
 
 
 class Order(SQLModel, table=True):
@@ -504,6 +525,22 @@ class CatalogResponse(SQLModel):
     facets: CatalogFacets
 
 
+class CatalogPage(SQLModel):
+    """One keyset page of the catalog. `next_cursor` is opaque and None on the
+    last page. No facets: computing them is O(catalog), which is exactly the
+    cost paging exists to avoid."""
+
+    items: list[CatalogItem]
+    next_cursor: Optional[str] = None
+
+
+class CatalogSearchResponse(SQLModel):
+    """Best match first. `total` counts every match, not just this response."""
+
+    total: int
+    items: list[CatalogItem]
+
+
 class CatalogDetail(SQLModel):
     item: CatalogItem
     related: list[CatalogItem]
@@ -562,6 +599,37 @@ class Promotion(SQLModel, table=True):
     clicks: int = Field(default=0, ge=0)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # The carousel schedule asks for active windows overlapping the next day.
+    __table_args__ = (Index("ix_promotion_active_window", "is_active", "ends_at", "starts_at"),)
+
+
+class PromotionStatsHourly(SQLModel, table=True):
+    """Impressions and clicks for one promotion in one UTC hour.
+
+    Written only by `promotion_events.flush_promotion_events`; the daily and
+    monthly tables are rolled up from it by `promotion_stats`. Keyed by
+    (promotion_id, period_start), so a promotion's series is an index range.
+    """
+
+    promotion_id: int = Field(foreign_key="promotion.id", primary_key=True)
+    period_start: datetime = Field(primary_key=True)
+    impressions: int = Field(default=0, ge=0)
+    clicks: int = Field(default=0, ge=0)
+
+
+class PromotionStatsDaily(SQLModel, table=True):
+    promotion_id: int = Field(foreign_key="promotion.id", primary_key=True)
+    period_start: datetime = Field(primary_key=True)  # midnight UTC
+    impressions: int = Field(default=0, ge=0)
+    clicks: int = Field(default=0, ge=0)
+
+
+class PromotionStatsMonthly(SQLModel, table=True):
+    promotion_id: int = Field(foreign_key="promotion.id", primary_key=True)
+    period_start: datetime = Field(primary_key=True)  # the 1st, midnight UTC
+    impressions: int = Field(default=0, ge=0)
+    clicks: int = Field(default=0, ge=0)
+
 
 class PromotionPublic(SQLModel):
     id: int
@@ -577,5 +645,33 @@ class PromotionPublic(SQLModel):
     image_url: Optional[str]
 
 
+class PromotionStatsPoint(SQLModel):
+    period_start: datetime
+    impressions: int
+    clicks: int
+    ctr: Optional[float]  # clicks / impressions; None with no impressions
+
+
+class PromotionAnalytics(SQLModel):
+    promotion_id: int
+    headline_es: str
+    headline_en: str
+    points: list[PromotionStatsPoint]
+
+
+class VendorPromotionAnalytics(SQLModel):
+    grain: str  # "hour" | "day" | "month"
+    start: datetime
+    end: datetime
+    promotions: list[PromotionAnalytics]
+
+
 class PromotionEvent(SQLModel):
     type: str  # "impression" | "click"
+
+
+class PromotionBeaconEvent(SQLModel):
+    """One entry of a batched beacon; see promotions.record_events."""
+
+    promotion_id: int
+    type: str  # "impression" | "click"
@@ -9,8 +9,8 @@ Pure on purpose: no FastAPI, no Session, no import from anything that imports
 this. That keeps it directly unit-testable and free of import cycles.
 """
 
-from datetime import datetime
-from typing import NamedTuple, Optional
+from datetime import datetime, timedelta
+from typing import Iterable, NamedTuple, Optional
 
 from .models import InventoryItem, StoreProfile
 
@@ -43,8 +43,8 @@ def window_open(
     """Is a discount window open at `now`?
 
     A blank bound is open-ended, so a discount with neither runs until the
-    vivero switches it off. Both edges are inclusive, matching
-    `promotions.load_live_promotions`.
+    vivero switches it off. Both edges are inclusive, matching promotion
+    windows in `promotion_schedule.py`.
     """
     if starts_at is not None and now < starts_at:
         return False
@@ -53,6 +53,55 @@ def window_open(
     return True
 
 
+def discount_edges(
+    percent: int,
+    starts_at: Optional[datetime],
+    ends_at: Optional[datetime],
+) -> list[datetime]:
+    """The instants at which a discount window changes whether it is open.
+
+    Because both edges are inclusive, a window opens *at* `starts_at` and
+    closes one tick *after* `ends_at`; returning that tick keeps "an edge at or
+    before `now` has passed" true for both. A zero percent never applies, so
+    its window has no edges worth watching.
+    """
+    if not percent:
+        return []
+    edges = []
+    if starts_at is not None:
+        edges.append(starts_at)
+    if ends_at is not None:
+        edges.append(ends_at + timedelta(microseconds=1))
+    return edges
+
+
+def next_price_change(
+    rows: Iterable[tuple[InventoryItem, Optional[StoreProfile]]],
+    now: datetime,
+) -> Optional[datetime]:
+    """The first instant after `now` at which any of these prices can change.
+
+    Anything priced from `rows` at `now` stays correct until then, which makes
+    it the expiry for a cached priced response. None means no discount window
+    among them has an edge still ahead.
+    """
+    upcoming = None
+    for item, store in rows:
+        edges = discount_edges(
+            item.discount_percent, item.discount_starts_at, item.discount_ends_at
+        )
+        if store is not None:
+            edges += discount_edges(
+                store.store_discount_percent,
+                store.store_discount_starts_at,
+                store.store_discount_ends_at,
+            )
+        for edge in edges:
+            if edge > now and (upcoming is None or edge < upcoming):
+                upcoming = edge
+    return upcoming
+
+
 def apply_percent(price: float, percent: int) -> float:
     """Take `percent` off `price`, half-up to the cent.
 
@@ -0,0 +1,149 @@
+"""Carousel impression and click counters, buffered and written in batches.
+
+Counting every event with its own COMMIT meant one write transaction per
+slide view, and on SQLite every write transaction takes the database-wide
+lock — homepage traffic queued vendor edits and logins behind it. Events now
+add to an in-memory delta per promotion, and `flush_promotion_events` applies
+all deltas in one executemany UPDATE, on an interval and at shutdown.
+
+The trade-off: a worker that dies without shutting down loses up to one
+interval of counts. These are aggregate display counters, not billing
+records, so that is acceptable.
+
+Each delta is also kept per UTC hour, and the same flush adds it to that
+hour's `PromotionStatsHourly` bucket (see `promotion_stats.py`).
+
+The flush is Core statements on purpose. They bypass the cache hooks, so
+counter writes never invalidate anything cached from promotion rows.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+
+import structlog
+from sqlalchemy import Engine, bindparam, update
+from sqlmodel import Session
+
+from .cache import promotions_version
+from .models import Promotion
+from .promotion_stats import add_hourly, hour_start
+
+logger = structlog.get_logger()
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("PROMOTION_FLUSH_INTERVAL_SECONDS", "5"))
+
+EVENT_COLUMNS = {"impression": "impressions", "click": "clicks"}
+
+
+Deltas = dict[tuple[int, datetime], list[int]]
+
+
+class CounterBuffer:
+    """Pending [impressions, clicks] per (promotion id, UTC hour)."""
+
+    def __init__(self) -> None:
+        self._deltas: Deltas = defaultdict(lambda: [0, 0])
+        self._lock = threading.Lock()
+
+    def add(
+        self,
+        promotion_id: int,
+        impressions: int = 0,
+        clicks: int = 0,
+        at: Optional[datetime] = None,
+    ) -> None:
+        key = (promotion_id, hour_start(at or datetime.utcnow()))
+        with self._lock:
+            delta = self._deltas[key]
+            delta[0] += impressions
+            delta[1] += clicks
+
+    def drain(self) -> Deltas:
+        """Take everything pending and leave the buffer empty."""
+        with self._lock:
+            deltas, self._deltas = self._deltas, defaultdict(lambda: [0, 0])
+        return deltas
+
+    def restore(self, deltas: Deltas) -> None:
+        """Put back deltas whose flush failed, on top of anything added since."""
+        for (promotion_id, hour), (impressions, clicks) in deltas.items():
+            self.add(promotion_id, impressions, clicks, at=hour)
+
+
+pending_events = CounterBuffer()
+
+_increment = (
+    update(Promotion.__table__)
+    .where(Promotion.__table__.c.id == bindparam("promotion_id"))
+    .values(
+        impressions=Promotion.__table__.c.impressions + bindparam("add_impressions"),
+        clicks=Promotion.__table__.c.clicks + bindparam("add_clicks"),
+    )
+)
+
+
+def flush_promotion_events(bind: Engine) -> int:
+    """Write every pending delta in one transaction; returns promotions touched.
+
+    On failure the deltas go back in the buffer for the next flush.
+    """
+    deltas = pending_events.drain()
+    if not deltas:
+        return 0
+
+    totals: dict[int, list[int]] = defaultdict(lambda: [0, 0])
+    for (promotion_id, _hour), (impressions, clicks) in deltas.items():
+        totals[promotion_id][0] += impressions
+        totals[promotion_id][1] += clicks
+    rows = [
+        {"promotion_id": promotion_id, "add_impressions": impressions, "add_clicks": clicks}
+        for promotion_id, (impressions, clicks) in totals.items()
+    ]
+    try:
+        with bind.begin() as connection:
+            connection.execute(_increment, rows)
+            add_hourly(connection, deltas)
+    except Exception:
+        pending_events.restore(deltas)
+        raise
+
+    logger.info(
+        "promotion_events_flushed",
+        promotions=len(rows),
+        impressions=sum(row["add_impressions"] for row in rows),
+        clicks=sum(row["add_clicks"] for row in rows),
+    )
+    return len(rows)
+
+
+# Ids known to exist, so a repeat event is answered without the database. Reset
+# whenever a promotion row is written through the ORM in this process.
+_known_ids: set[int] = set()
+_known_version = -1
+_known_lock = threading.Lock()
+
+
+def promotion_exists(session: Session, promotion_id: int) -> bool:
+    """True if the promotion exists; only an id not yet seen costs a query.
+
+    Deleting a promotion in another worker leaves its id here until this
+    process writes a promotion itself. Events for it are then counted against
+    a row that no longer exists, and the UPDATE matches nothing.
+    """
+    global _known_version
+
+    with _known_lock:
+        if _known_version != promotions_version.value:
+            _known_ids.clear()
+            _known_version = promotions_version.value
+        if promotion_id in _known_ids:
+            return True
+
+    if session.get(Promotion, promotion_id) is None:
+        return False
+    with _known_lock:
+        _known_ids.add(promotion_id)
+    return True
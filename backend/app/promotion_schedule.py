@@ -0,0 +1,160 @@
+"""The carousel's timetable: which promotions it shows, and in what order, at
+any instant over the next stretch of time.
+
+Promotion windows and the hourly rotation only change the carousel at known
+instants — a window opening at `starts_at`, one closing a tick after its
+inclusive `ends_at`, the top of each hour. Between two of those instants
+nothing can change. So the schedule sweeps the windows once, in time order,
+keeping the live set grouped by priority tier as windows open and close, and
+records the carousel for each stretch between consecutive instants. Reading
+the carousel off the top tiers costs at most `slots` steps, however many
+promotions are live; ranking the whole live set at every instant made the
+build quadratic. Asking "what shows at t" or "when does that next change" is
+then a binary search over the stretches' start times.
+
+Pure like `pricing.py`: no FastAPI, no Session. The rotation within a tier is
+passed in, so it lives in `promotions` next to `rank_promotions`, which orders
+the same way in one go.
+"""
+
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from .models import Promotion
+
+HOUR = timedelta(hours=1)
+TICK = timedelta(microseconds=1)
+
+Rotation = Callable[[int, datetime], int]
+"""Where, at a moment, a tier of n promotions in id order starts."""
+
+
+def ids(promos: tuple[Promotion, ...]) -> tuple[int, ...]:
+    return tuple(promo.id for promo in promos)
+
+
+def _by_id(promo: Promotion) -> int:
+    return promo.id
+
+
+class LiveTiers:
+    """The live promotions grouped by priority, each tier in id order.
+
+    Updated as windows open and close, so each instant of the sweep costs one
+    insert or removal rather than a ranking of everything live.
+    """
+
+    def __init__(self) -> None:
+        self._tiers: dict[int, list[Promotion]] = {}
+        self._priorities: list[int] = []
+
+    def add(self, promo: Promotion) -> None:
+        tier = self._tiers.get(promo.priority)
+        if tier is None:
+            tier = self._tiers[promo.priority] = []
+            insort(self._priorities, promo.priority)
+        insort(tier, promo, key=_by_id)
+
+    def remove(self, promo: Promotion) -> None:
+        tier = self._tiers[promo.priority]
+        del tier[bisect_left(tier, promo.id, key=_by_id)]
+        if not tier:
+            del self._tiers[promo.priority]
+            del self._priorities[bisect_left(self._priorities, promo.priority)]
+
+    def top(self, moment: datetime, rotation: Rotation, slots: int) -> tuple[Promotion, ...]:
+        """The first `slots` of the carousel at `moment`: highest tier first,
+        each tier rotated. Never looks past the promotions it returns."""
+        shown: list[Promotion] = []
+        for priority in reversed(self._priorities):
+            tier = self._tiers[priority]
+            offset = rotation(len(tier), moment)
+            for step in range(min(len(tier), slots - len(shown))):
+                shown.append(tier[(offset + step) % len(tier)])
+            if len(shown) >= slots:
+                break
+        return tuple(shown)
+
+
+class Stretch(NamedTuple):
+    starts_at: datetime
+    ranked: tuple[Promotion, ...]
+    """What the carousel shows throughout the stretch, in order."""
+
+
+class PromotionSchedule:
+    """The carousel over [start, end). Read-only once built.
+
+    Building costs one sort of the windows, a tier update per window edge, and
+    at most `slots` steps per stretch; a horizon of h hours has h hourly
+    stretches plus two per window edge inside it. Consecutive stretches that
+    show the same thing are merged, so `next_change` is when the carousel
+    really changes (or the horizon ends).
+    """
+
+    def __init__(
+        self,
+        promos: list[Promotion],
+        start: datetime,
+        end: datetime,
+        rotation: Rotation,
+        slots: int,
+    ) -> None:
+        self.start = start
+        self.end = end
+
+        edges = {start}
+        hour = start.replace(minute=0, second=0, microsecond=0) + HOUR
+        while hour < end:
+            edges.add(hour)
+            hour += HOUR
+        for promo in promos:
+            for edge in (promo.starts_at, promo.ends_at + TICK):
+                if start < edge < end:
+                    edges.add(edge)
+
+        by_start = sorted(promos, key=lambda promo: promo.starts_at)
+        closing: list[tuple[datetime, int]] = []
+        live: dict[int, Promotion] = {}
+        tiers = LiveTiers()
+        opened = 0
+
+        stretches: list[Stretch] = []
+        for edge in sorted(edges):
+            while opened < len(by_start) and by_start[opened].starts_at <= edge:
+                promo = by_start[opened]
+                live[promo.id] = promo
+                tiers.add(promo)
+                heapq.heappush(closing, (promo.ends_at + TICK, promo.id))
+                opened += 1
+            while closing and closing[0][0] <= edge:
+                promo = live.pop(heapq.heappop(closing)[1], None)
+                if promo is not None:
+                    tiers.remove(promo)
+
+            ranked = tiers.top(edge, rotation, slots)
+            if stretches and ids(stretches[-1].ranked) == ids(ranked):
+                continue
+            stretches.append(Stretch(edge, ranked))
+
+        self.stretches = stretches
+        self.starts = [stretch.starts_at for stretch in stretches]
+
+    def covers(self, moment: datetime) -> bool:
+        return self.start <= moment < self.end
+
+    def index(self, moment: datetime) -> int:
+        """Which stretch `moment` falls in. It must be covered."""
+        if not self.covers(moment):
+            raise ValueError(f"{moment} is outside the schedule")
+        return bisect_right(self.starts, moment) - 1
+
+    def ranked_at(self, moment: datetime) -> tuple[Promotion, ...]:
+        return self.stretches[self.index(moment)].ranked
+
+    def next_change(self, moment: datetime) -> datetime:
+        """When the stretch holding `moment` ends — at the latest, `end`."""
+        following = self.index(moment) + 1
+        return self.starts[following] if following < len(self.starts) else self.end
@@ -0,0 +1,179 @@
+"""Per-hour, per-day and per-month promotion analytics.
+
+`Promotion.impressions`/`clicks` are lifetime totals; a vivero paying for a
+slot wants CTR over time. The event flush adds each batch to an hourly bucket
+too, and `rollup_promotion_stats` folds recent hours into days and recent days
+into months. The vendor endpoint reads one grain's table by primary-key range
+and never touches finer data, so a year of daily points is a few hundred rows
+however much traffic produced them.
+
+Rollups recompute their whole window from the finer table rather than adding
+to it, so running one twice, or after a missed run, is harmless.
+"""
+
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, NamedTuple
+
+from sqlalchemy import Engine, Table
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Connection
+from sqlmodel import Session, SQLModel, select
+
+from .models import (
+    PromotionStatsDaily,
+    PromotionStatsHourly,
+    PromotionStatsMonthly,
+    PromotionStatsPoint,
+)
+
+ROLLUP_INTERVAL_SECONDS = float(os.getenv("PROMOTION_ROLLUP_INTERVAL_SECONDS", "300"))
+
+# How far back each rollup looks. Hours only ever arrive for the current one
+# (or the previous, across a flush), so two days covers a run missed at
+# midnight with room to spare.
+ROLLUP_LOOKBACK = timedelta(days=2)
+
+KEY_COLUMNS = ("promotion_id", "period_start")
+COUNT_COLUMNS = ("impressions", "clicks")
+
+
+def hour_start(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_start(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_start(moment: datetime) -> datetime:
+    return day_start(moment).replace(day=1)
+
+
+class Grain(NamedTuple):
+    model: type[SQLModel]
+    truncate: Callable[[datetime], datetime]
+    default_span: timedelta
+    max_span: timedelta
+
+
+GRAINS = {
+    "hour": Grain(PromotionStatsHourly, hour_start, timedelta(days=2), timedelta(days=31)),
+    "day": Grain(PromotionStatsDaily, day_start, timedelta(days=30), timedelta(days=366)),
+    "month": Grain(PromotionStatsMonthly, month_start, timedelta(days=365), timedelta(days=3660)),
+}
+
+
+def upsert(connection: Connection, table: Table, rows: list[dict], accumulate: bool) -> None:
+    """Insert rows keyed by KEY_COLUMNS; on conflict add to the counts, or
+    replace them. One statement, executed for every row."""
+    if not rows:
+        return
+    dialect = postgresql if connection.dialect.name == "postgresql" else sqlite
+    statement = dialect.insert(table)
+    if accumulate:
+        counts = {column: table.c[column] + statement.excluded[column] for column in COUNT_COLUMNS}
+    else:
+        counts = {column: statement.excluded[column] for column in COUNT_COLUMNS}
+    connection.execute(
+        statement.on_conflict_do_update(index_elements=list(KEY_COLUMNS), set_=counts), rows
+    )
+
+
+def add_hourly(connection: Connection, deltas: dict[tuple[int, datetime], list[int]]) -> None:
+    """Add flushed (promotion_id, hour) deltas to their hourly buckets."""
+    upsert(
+        connection,
+        PromotionStatsHourly.__table__,
+        [
+            {
+                "promotion_id": promotion_id,
+                "period_start": hour,
+                "impressions": impressions,
+                "clicks": clicks,
+            }
+            for (promotion_id, hour), (impressions, clicks) in deltas.items()
+        ],
+        accumulate=True,
+    )
+
+
+def roll_up(
+    connection: Connection,
+    source: type[SQLModel],
+    target: type[SQLModel],
+    truncate: Callable[[datetime], datetime],
+    since: datetime,
+) -> int:
+    """Recompute every `target` period from `since` on out of `source` rows."""
+    rows = connection.execute(
+        select(source.promotion_id, source.period_start, source.impressions, source.clicks).where(
+            source.period_start >= since
+        )
+    ).all()
+
+    totals: dict[tuple[int, datetime], list[int]] = defaultdict(lambda: [0, 0])
+    for promotion_id, period_start, impressions, clicks in rows:
+        total = totals[promotion_id, truncate(period_start)]
+        total[0] += impressions
+        total[1] += clicks
+
+    upsert(
+        connection,
+        target.__table__,
+        [
+            {
+                "promotion_id": promotion_id,
+                "period_start": period_start,
+                "impressions": impressions,
+                "clicks": clicks,
+            }
+            for (promotion_id, period_start), (impressions, clicks) in totals.items()
+        ],
+        accumulate=False,
+    )
+    return len(totals)
+
+
+def rollup_promotion_stats(bind: Engine, now: datetime) -> tuple[int, int]:
+    """Hours into days, then days into months. Returns the rows written."""
+    since = day_start(now - ROLLUP_LOOKBACK)
+    with bind.begin() as connection:
+        days = roll_up(connection, PromotionStatsHourly, PromotionStatsDaily, day_start, since)
+        # The month a lookback day falls in is recomputed whole, from its days.
+        months = roll_up(
+            connection, PromotionStatsDaily, PromotionStatsMonthly, month_start, month_start(since)
+        )
+    return days, months
+
+
+def load_series(
+    session: Session,
+    promotion_ids: list[int],
+    grain: Grain,
+    start: datetime,
+    end: datetime,
+) -> dict[int, list[PromotionStatsPoint]]:
+    """Stored points per promotion, oldest first. Sparse: a period with no
+    events has no row and no point."""
+    model = grain.model
+    rows = session.exec(
+        select(model)
+        .where(model.promotion_id.in_(promotion_ids))
+        .where(model.period_start >= grain.truncate(start))
+        .where(model.period_start <= end)
+        .order_by(model.promotion_id, model.period_start)
+    ).all()
+
+    series: dict[int, list[PromotionStatsPoint]] = defaultdict(list)
+    for row in rows:
+        series[row.promotion_id].append(
+            PromotionStatsPoint(
+                period_start=row.period_start,
+                impressions=row.impressions,
+                clicks=row.clicks,
+                ctr=round(row.clicks / row.impressions, 4) if row.impressions else None,
+            )
+        )
+    return series
@@ -5,15 +5,39 @@ editorial priority; once viveros pay for placement, that one function is the
 only thing that changes — the model, the endpoints, and the carousel all stay.
 """
 
-from collections import defaultdict
-from datetime import datetime
+import hashlib
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
 
 import structlog
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import Engine
 from sqlmodel import Session, select
 
 from .auth import get_session
-from .models import Promotion, PromotionEvent, PromotionPublic, StoreProfile
+from .cache import (
+    etag_matches,
+    not_modified,
+    promotions_version,
+    set_validators,
+    stores_version,
+)
+from .models import (
+    Promotion,
+    PromotionBeaconEvent,
+    PromotionEvent,
+    PromotionPublic,
+    StoreProfile,
+)
+from .promotion_events import EVENT_COLUMNS, pending_events, promotion_exists
+from .promotion_schedule import PromotionSchedule
+from .snapshot import SNAPSHOT_MAX_AGE_SECONDS
 
 logger = structlog.get_logger()
 
@@ -21,6 +45,13 @@ router = APIRouter(prefix="/api/promotions", tags=["promotions"])
 
 MAX_SLOTS = 5
 
+# A visit views each slot and may click a few; anything far beyond that is not
+# one page's worth of beacons. sendBeacon itself caps payloads at 64 KiB.
+MAX_BEACON_EVENTS = 100
+MAX_BEACON_BYTES = 16 * 1024
+
+beacon_events = TypeAdapter(list[PromotionBeaconEvent])
+
 
 def rank_promotions(promos: list[Promotion], now: datetime) -> list[Promotion]:
     """Ordering strategy for the homepage carousel.
@@ -30,7 +61,9 @@ def rank_promotions(promos: list[Promotion], now: datetime) -> list[Promotion]:
     than the lowest id winning permanently. Rotating the whole list instead
     would let a tier-30 promotion fall behind a tier-10 one, which is exactly
     what a vivero would be paying not to happen. Swap this body when paid tiers
-    land — nothing else changes.
+    land, along with `tier_rotation` and `promotion_schedule.LiveTiers`, which
+    apply the same policy a window at a time; a test holds them to the same
+    answer.
     """
     if not promos:
         return []
@@ -42,49 +75,273 @@ def rank_promotions(promos: list[Promotion], now: datetime) -> list[Promotion]:
     ranked: list[Promotion] = []
     for priority in sorted(tiers, reverse=True):
         group = sorted(tiers[priority], key=lambda promo: promo.id)
-        offset = now.hour % len(group)
+        offset = tier_rotation(len(group), now)
         ranked.extend(group[offset:] + group[:offset])
     return ranked
 
 
-def load_live_promotions(session: Session, now: datetime) -> list[Promotion]:
+def tier_rotation(size: int, now: datetime) -> int:
+    """Where a tier of `size` promotions, in id order, starts at `now`: one
+    place further each hour."""
+    return now.hour % size
+
+
+def load_scheduled_promotions(session: Session, start: datetime, end: datetime) -> list[Promotion]:
+    """Active promotions whose window overlaps [start, end). Both window
+    bounds are inclusive, as on the carousel. Served by
+    `ix_promotion_active_window`."""
     return session.exec(
         select(Promotion)
         .where(Promotion.is_active == True)  # noqa: E712
-        .where(Promotion.starts_at <= now)
-        .where(Promotion.ends_at >= now)
+        .where(Promotion.ends_at >= start)
+        .where(Promotion.starts_at < end)
     ).all()
 
 
+# Everything PromotionPublic copies off the row; store_name comes from the store.
+PROMOTION_FIELDS = tuple(field for field in PromotionPublic.model_fields if field != "store_name")
+
+# How far ahead one schedule is built. The refresh task replaces it at least
+# every SNAPSHOT_MAX_AGE_SECONDS, so this only has to outlast a few failed
+# refreshes.
+SCHEDULE_HORIZON = timedelta(hours=1)
+
+# Schedules start this far back, so a request that read the clock just before
+# a refresh swapped one in is still covered by it.
+SCHEDULE_SLACK = timedelta(seconds=5)
+
+# How often the refresh task checks for edits. A check that finds none costs
+# nothing; a rebuild runs on the task's thread, never on a request.
+SCHEDULE_REFRESH_SECONDS = float(os.getenv("PROMOTION_SCHEDULE_REFRESH_SECONDS", "1"))
+
+
+def promotions_etag(ranked: list[Promotion], store_lookup: dict[int, StoreProfile]) -> str:
+    """Digest of exactly what the carousel shows, in the order it shows it."""
+    digest = hashlib.blake2b(digest_size=12)
+    for promo in ranked:
+        shown = tuple(getattr(promo, field) for field in PROMOTION_FIELDS)
+        digest.update(repr((shown, store_lookup[promo.store_id].name)).encode())
+    return f'"p-{digest.hexdigest()}"'
+
+
+class CarouselView(NamedTuple):
+    etag: str
+    promotions: list[PromotionPublic]
+
+
+class CarouselSchedule(NamedTuple):
+    versions: tuple[int, int]
+    """(promotions_version, stores_version) at build."""
+    built_at: float
+    schedule: PromotionSchedule
+    views: list[CarouselView]
+    """One per schedule stretch, serialized at build time."""
+
+    def fresh_at(self, now: datetime, monotonic_now: float) -> bool:
+        return (
+            self.versions == schedule_versions()
+            and self.schedule.covers(now)
+            and monotonic_now - self.built_at < SNAPSHOT_MAX_AGE_SECONDS
+        )
+
+    def view_at(self, now: datetime) -> CarouselView:
+        return self.views[self.schedule.index(now)]
+
+
+def schedule_versions() -> tuple[int, int]:
+    return (promotions_version.value, stores_version.value)
+
+
+_schedule: Optional[CarouselSchedule] = None
+_schedule_lock = threading.Lock()
+
+
+def current_schedule(session: Session, now: datetime) -> CarouselSchedule:
+    """The carousel schedule covering `now`, as last built.
+
+    Every hourly rotation and window edge inside the horizon is already
+    worked out, so the homepage's hottest endpoint is a binary search with no
+    queries. Edits are picked up by `refresh_schedule`, off the request path;
+    until it swaps the new schedule in, this one keeps being served. Only
+    with none covering `now` — a cold worker, or refreshes failing for a
+    whole horizon — does a request build one itself.
+    """
+    global _schedule
+
+    carousel = _schedule
+    if carousel is not None and carousel.schedule.covers(now):
+        return carousel
+
+    with _schedule_lock:
+        carousel = _schedule
+        if carousel is not None and carousel.schedule.covers(now):
+            return carousel
+        # Read before querying, as in snapshot.current_snapshot.
+        carousel = build_schedule(session, now, schedule_versions())
+        _schedule = carousel
+    log_schedule(carousel, "request")
+    return carousel
+
+
+def refresh_schedule(bind: Engine, now: datetime) -> bool:
+    """Rebuild the schedule if an edit, the max age or the horizon says so.
+
+    Run by the app's lifespan every SCHEDULE_REFRESH_SECONDS. Like the
+    catalog snapshot, the max age bounds how long another worker's edits stay
+    invisible. True when it rebuilt.
+    """
+    global _schedule
+
+    carousel = _schedule
+    if carousel is not None and carousel.fresh_at(now, time.monotonic()):
+        return False
+
+    versions = schedule_versions()
+    with Session(bind) as session:
+        carousel = build_schedule(session, now, versions)
+    with _schedule_lock:
+        _schedule = carousel
+    log_schedule(carousel, "refresh")
+    return True
+
+
+def log_schedule(carousel: CarouselSchedule, built_by: str) -> None:
+    logger.info(
+        "promotions_scheduled",
+        stretches=len(carousel.views),
+        until=carousel.schedule.end,
+        built_by=built_by,
+    )
+
+
+def build_schedule(session: Session, now: datetime, versions: tuple[int, int]) -> CarouselSchedule:
+    start, end = now - SCHEDULE_SLACK, now + SCHEDULE_HORIZON
+    promos = load_scheduled_promotions(session, start, end)
+
+    store_lookup: dict[int, StoreProfile] = {}
+    if promos:
+        store_ids = {promo.store_id for promo in promos}
+        stores = session.exec(select(StoreProfile).where(StoreProfile.id.in_(store_ids))).all()
+        store_lookup = {store.id: store for store in stores if store.is_active}
+
+    schedule = PromotionSchedule(
+        [promo for promo in promos if promo.store_id in store_lookup],
+        start=start,
+        end=end,
+        rotation=tier_rotation,
+        slots=MAX_SLOTS,
+    )
+    return CarouselSchedule(
+        versions=versions,
+        built_at=time.monotonic(),
+        schedule=schedule,
+        views=[carousel_view(stretch.ranked, store_lookup) for stretch in schedule.stretches],
+    )
+
+
+def carousel_view(
+    ranked: tuple[Promotion, ...], store_lookup: dict[int, StoreProfile]
+) -> CarouselView:
+    return CarouselView(
+        etag=promotions_etag(list(ranked), store_lookup),
+        promotions=[
+            PromotionPublic(
+                id=promo.id,
+                store_id=promo.store_id,
+                store_name=store_lookup[promo.store_id].name,
+                headline_es=promo.headline_es,
+                headline_en=promo.headline_en,
+                body_es=promo.body_es,
+                body_en=promo.body_en,
+                cta_label_es=promo.cta_label_es,
+                cta_label_en=promo.cta_label_en,
+                cta_href=promo.cta_href,
+                image_url=promo.image_url,
+            )
+            for promo in ranked
+        ],
+    )
+
+
 @router.get("", response_model=list[PromotionPublic])
-def list_promotions(session: Session = Depends(get_session)):
+def list_promotions(
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    session: Session = Depends(get_session),
+):
     now = datetime.utcnow()
-    promos = load_live_promotions(session, now)
-    if not promos:
-        return []
+    view = current_schedule(session, now).view_at(now)
+    if etag_matches(if_none_match, view.etag):
+        return not_modified(view.etag)
+    set_validators(response, view.etag)
+    return view.promotions
+
 
-    store_ids = {promo.store_id for promo in promos}
-    stores = session.exec(select(StoreProfile).where(StoreProfile.id.in_(store_ids))).all()
-    store_lookup = {store.id: store for store in stores if store.is_active}
-
-    ranked = rank_promotions([p for p in promos if p.store_id in store_lookup], now)
-
-    return [
-        PromotionPublic(
-            id=promo.id,
-            store_id=promo.store_id,
-            store_name=store_lookup[promo.store_id].name,
-            headline_es=promo.headline_es,
-            headline_en=promo.headline_en,
-            body_es=promo.body_es,
-            body_en=promo.body_en,
-            cta_label_es=promo.cta_label_es,
-            cta_label_en=promo.cta_label_en,
-            cta_href=promo.cta_href,
-            image_url=promo.image_url,
+async def read_beacon(request: Request) -> bytes:
+    """The request body, never holding more than MAX_BEACON_BYTES of it.
+
+    A declared Content-Length over the limit is refused unread; a chunked or
+    understated body is read piece by piece and refused as soon as it passes.
+    """
+    too_large = HTTPException(status_code=413, detail="Too many events")
+    declared = request.headers.get("content-length")
+    if declared is not None:
+        if not declared.isdigit():
+            raise HTTPException(status_code=400, detail="Invalid Content-Length")
+        if int(declared) > MAX_BEACON_BYTES:
+            raise too_large
+
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_BEACON_BYTES:
+            raise too_large
+    return bytes(body)
+
+
+@router.post("/events", status_code=204)
+async def record_events(request: Request, session: Session = Depends(get_session)):
+    """Many carousel events in one request: a JSON array of
+    `{"promotion_id": 1, "type": "impression"}`.
+
+    Made for `navigator.sendBeacon`, which can't set a JSON content type
+    without a CORS preflight — so the raw body is parsed whatever the
+    Content-Type says, and a plain string beacon works too.
+
+    Same privacy rule as `record_event`: aggregate counters only, no visitor
+    id, nothing stored per event. A malformed batch or unknown type rejects
+    the whole batch; an id that no longer exists is skipped, so one deleted
+    promotion doesn't discard the rest of the visit.
+    """
+    body = await read_beacon(request)
+    try:
+        events = beacon_events.validate_json(body)
+    except ValidationError as error:
+        raise HTTPException(status_code=400, detail="Invalid events") from error
+    if len(events) > MAX_BEACON_EVENTS:
+        raise HTTPException(status_code=413, detail="Too many events")
+    if any(event.type not in EVENT_COLUMNS for event in events):
+        raise HTTPException(status_code=400, detail="Unknown event type")
+
+    counts = Counter((event.promotion_id, event.type) for event in events)
+    # promotion_exists may query; keep that off the event loop.
+    await run_in_threadpool(apply_event_counts, session, counts)
+
+
+def apply_event_counts(session: Session, counts: Counter) -> None:
+    """Grouped increments: one buffered delta per promotion, however many events."""
+    skipped = 0
+    for promotion_id in {promotion_id for promotion_id, _type in counts}:
+        if not promotion_exists(session, promotion_id):
+            skipped += 1
+            continue
+        pending_events.add(
+            promotion_id,
+            impressions=counts[promotion_id, "impression"],
+            clicks=counts[promotion_id, "click"],
         )
-        for promo in ranked[:MAX_SLOTS]
-    ]
+    if skipped:
+        logger.info("promotion_events_skipped", unknown_promotions=skipped)
 
 
 @router.post("/{promotion_id}/event", status_code=204)
@@ -93,18 +350,18 @@ def record_event(
     payload: PromotionEvent,
     session: Session = Depends(get_session),
 ):
-    """Aggregate counters only — no per-visitor tracking, no cookies, no ids."""
-    if payload.type not in ("impression", "click"):
+    """Aggregate counters only — no per-visitor tracking, no cookies, no ids.
+
+    Buffered, not written: the count reaches the row at the next flush (see
+    `promotion_events.py`), and a known id is answered without the database.
+    """
+    if payload.type not in EVENT_COLUMNS:
         raise HTTPException(status_code=400, detail="Unknown event type")
 
-    promo = session.get(Promotion, promotion_id)
-    if not promo:
+    if not promotion_exists(session, promotion_id):
         raise HTTPException(status_code=404, detail="Promotion not found")
 
     if payload.type == "impression":
-        promo.impressions += 1
+        pending_events.add(promotion_id, impressions=1)
     else:
-        promo.clicks += 1
-
-    session.add(promo)
-    session.commit()
+        pending_events.add(promotion_id, clicks=1)
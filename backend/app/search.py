@@ -0,0 +1,211 @@
+"""Catalog search — the server-side twin of `frontend/app/lib/search.ts`.
+
+Same accent folding, same field weights, same prefix bonuses and same "every
+token must land somewhere" rule, so moving search to the server does not
+reorder anyone's results. If a rule changes, change it in both places.
+
+Matching is by substring, as in the browser: "stera" finds "Monstera". A plain
+word index can't answer that, so the index is two-level. Every distinct word
+in the catalog is indexed by its character n-grams, which finds the *words*
+containing a token without scanning them; each word then maps to the listings
+that use it. Only those listings are scored, exactly, with `score_field`.
+
+Pure on purpose, like `pricing.py`: no FastAPI, no Session.
+"""
+
+import heapq
+import unicodedata
+from collections import defaultdict
+from typing import Iterable, Mapping, NamedTuple, Optional
+
+from .models import InventoryItem, StoreProfile
+
+WEIGHTS = {
+    "name": 10,
+    "genus": 6,
+    "tags": 4,
+    "vivero": 3,
+    "description": 1,
+}
+
+# In Document's field order.
+FIELD_WEIGHTS = tuple(WEIGHTS.values())
+
+# Tokens up to this long are looked up by their whole text; longer ones by the
+# intersection of their n-grams of this length.
+GRAM = 3
+
+
+def normalize(text: str) -> str:
+    """Fold accents so "sabila" finds "Sábila" and "boriken" finds "Borikén"."""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(char for char in decomposed if not "\u0300" <= char <= "\u036f")
+    return stripped.lower().strip()
+
+
+def tokenize(query: str) -> list[str]:
+    return normalize(query).split()
+
+
+def split_tags(tags: Optional[str]) -> list[str]:
+    """Mirror of `splitTags` in `frontend/app/lib/catalog.ts`."""
+    if not tags:
+        return []
+    return [tag.strip() for tag in tags.split(",") if tag.strip()]
+
+
+def js_round(value: float) -> int:
+    """`Math.round`: halves go up. Python's round() would send 4.5 to 4."""
+    return int(value + 0.5)
+
+
+def score_field(haystack: str, token: str, weight: int) -> int:
+    """A prefix match is a stronger signal than a match buried mid-word.
+
+    Only the *first* occurrence counts, exactly like `indexOf` in the browser.
+    """
+    if not haystack:
+        return 0
+    at = haystack.find(token)
+    if at == -1:
+        return 0
+    if at == 0:
+        return weight * 2
+    if haystack[at - 1] == " ":
+        return js_round(weight * 1.5)
+    return weight
+
+
+class Document(NamedTuple):
+    item: InventoryItem
+    name: str
+    genus: str
+    tags: str
+    vivero: str
+    description: str
+
+    def score(self, token: str) -> int:
+        total = 0
+        for haystack, weight in zip(self[1:], FIELD_WEIGHTS):
+            total += score_field(haystack, token, weight)
+        return total
+
+
+def grams(text: str) -> set[str]:
+    """Every substring of `text` up to GRAM characters long."""
+    return {text[at : at + size] for size in range(1, GRAM + 1) for at in range(len(text))}
+
+
+class SearchResults(NamedTuple):
+    total: int
+    """Every listing that matched, however many `hits` holds."""
+    hits: list[tuple[InventoryItem, int]]
+    """Best first, with their scores."""
+
+
+class SearchIndex:
+    """Built once per catalog snapshot; read-only afterwards."""
+
+    def __init__(
+        self,
+        items: Iterable[InventoryItem],
+        stores: Mapping[int, StoreProfile],
+    ) -> None:
+        self.documents: list[Document] = []
+        postings: dict[str, set[int]] = defaultdict(set)
+        for position, item in enumerate(items):
+            store = stores.get(item.store_id)
+            document = Document(
+                item=item,
+                name=normalize(item.plant_name),
+                genus=normalize(item.genus or ""),
+                tags=normalize(" ".join(split_tags(item.tags))),
+                vivero=normalize(store.name if store else ""),
+                description=normalize(item.description or ""),
+            )
+            self.documents.append(document)
+            for field in document[1:]:
+                for word in field.split():
+                    postings[word].add(position)
+
+        self.postings = {word: frozenset(found) for word, found in postings.items()}
+
+        # Featured stock breaks ties, matching the shop's default sort; read
+        # once here rather than off the ORM object on every search.
+        self.bonus = [1 if document.item.is_featured else 0 for document in self.documents]
+        # Each listing's place among equal scores. The browser breaks ties with
+        # localeCompare on the name; comparing the folded name is the closest
+        # stable equivalent without ICU.
+        self.by_tiebreak = sorted(
+            range(len(self.documents)),
+            key=lambda at: (self.documents[at].name, self.documents[at].item.id),
+        )
+        self.tiebreak = [0] * len(self.documents)
+        for place, position in enumerate(self.by_tiebreak):
+            self.tiebreak[position] = place
+        words_by_gram: dict[str, set[str]] = defaultdict(set)
+        for word in self.postings:
+            for gram in grams(word):
+                words_by_gram[gram].add(word)
+        self.words_by_gram = {gram: frozenset(words) for gram, words in words_by_gram.items()}
+
+    def words_containing(self, token: str) -> set[str]:
+        if len(token) <= GRAM:
+            return set(self.words_by_gram.get(token, ()))
+        pieces = sorted(
+            (
+                self.words_by_gram.get(token[at : at + GRAM], frozenset())
+                for at in range(len(token) - GRAM + 1)
+            ),
+            key=len,
+        )
+        words = set(pieces[0])
+        for piece in pieces[1:]:
+            words &= piece
+            if not words:
+                break
+        # Shared n-grams don't guarantee the substring; confirm it.
+        return {word for word in words if token in word}
+
+    def candidates(self, token: str) -> set[int]:
+        return set().union(*(self.postings[word] for word in self.words_containing(token)))
+
+    def search(self, query: str, limit: Optional[int] = None) -> SearchResults:
+        """Matching listings: how many, and the best `limit` with their scores.
+
+        A blank query matches nothing here; listing everything is what the
+        catalog endpoint itself is for. Every match is scored, but only the
+        page asked for is ranked — a broad query at 100k listings would
+        otherwise spend most of its time sorting rows no one sees.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return SearchResults(0, [])
+
+        matched: Optional[set[int]] = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            found = self.candidates(token)
+            matched = found if matched is None else matched & found
+            if not matched:
+                return SearchResults(0, [])
+
+        # One int per match, larger is better: the score first, then the
+        # earlier place among ties. Plain ints let heapq compare in C rather
+        # than through a key function, and decode back without a lookup table.
+        documents, bonus, tiebreak = self.documents, self.bonus, self.tiebreak
+        span = len(documents)
+        keys = []
+        for position in matched:
+            document = documents[position]
+            score = bonus[position]
+            for token in tokens:
+                score += document.score(token)
+            keys.append(score * span - tiebreak[position])
+
+        best = sorted(keys, reverse=True) if limit is None else heapq.nlargest(limit, keys)
+        hits = []
+        for key in best:
+            place = -key % span
+            document = documents[self.by_tiebreak[place]]
+            hits.append((document.item, (key + place) // span))
+        return SearchResults(len(matched), hits)
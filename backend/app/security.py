@@ -8,26 +8,65 @@ in `auth.py` instead.
 import hashlib
 import os
 import secrets
+import time
 from datetime import datetime, timedelta
 
 VERIFICATION_TTL_MINUTES = int(os.getenv("VERIFICATION_TTL_MINUTES", "30"))
 
 PBKDF2_ITERATIONS = 200_000
 
+# Calibration never goes below this, however slow the host, and rounds to
+# this step so workers on one host settle on the same number.
+MIN_PBKDF2_ITERATIONS = 100_000
+CALIBRATION_STEP = 10_000
+
+# A stored hash within this fraction of the current cost is left alone, so
+# two workers calibrating a step apart don't rehash on every login.
+REHASH_TOLERANCE = 0.25
+
 MIN_PASSWORD_LENGTH = 8
 
 
-def hash_password(password: str) -> str:
+def hash_password(password: str, iterations: int = PBKDF2_ITERATIONS) -> str:
     """PBKDF2-SHA256 with a per-password salt, stored as `pbkdf2$iters$salt$hex`.
 
     Vendors and customers share this scheme — there was never anything
     vendor-specific about it beyond the old function name.
     """
     salt = secrets.token_hex(16)
-    digest = hashlib.pbkdf2_hmac(
-        "sha256", password.encode(), bytes.fromhex(salt), PBKDF2_ITERATIONS
-    )
-    return f"pbkdf2${PBKDF2_ITERATIONS}${salt}${digest.hex()}"
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), iterations)
+    return f"pbkdf2${iterations}${salt}${digest.hex()}"
+
+
+def needs_rehash(stored: str, iterations: int) -> bool:
+    """Should a hash that just verified be replaced with one at `iterations`?
+
+    Yes for another scheme, and for a cost outside REHASH_TOLERANCE either
+    way — lowering the cost on purpose should take effect too.
+    """
+    try:
+        scheme, stored_iterations, _salt, _digest = stored.split("$")
+        if scheme != "pbkdf2":
+            return True
+        return abs(int(stored_iterations) - iterations) > iterations * REHASH_TOLERANCE
+    except (ValueError, AttributeError):
+        return True
+
+
+def calibrate_iterations(target_seconds: float, sample: int = 20_000, runs: int = 3) -> int:
+    """PBKDF2 iterations that take about `target_seconds` on this host.
+
+    Times the best of a few short runs and scales, so calibration itself
+    costs a fraction of one real hash.
+    """
+    salt = secrets.token_bytes(16)
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        hashlib.pbkdf2_hmac("sha256", b"calibration", salt, sample)
+        best = min(best, time.perf_counter() - started)
+    iterations = round(target_seconds / best * sample / CALIBRATION_STEP) * CALIBRATION_STEP
+    return max(MIN_PBKDF2_ITERATIONS, iterations)
 
 
 def verify_password(password: str, stored: str) -> bool:
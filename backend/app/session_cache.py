@@ -0,0 +1,215 @@
+"""Resolved sessions and their owners, kept between requests.
+
+Without it every authenticated request costs two queries before any real
+work: the session row by token, then its StoreProfile or CustomerAccount. The
+vendor portal polls several endpoints per screen, so that adds up.
+
+Entries are detached copies. `auth` merges them into the request's Session
+with `load=False`, which hands the handler an ordinary session-bound object
+without a round trip — and leaves the cached copy untouched whatever the
+handler does to its own.
+
+Invalidation follows `cache.py`: a Session hook drops a token whose row was
+written or deleted, and every token of an owner that was written. Logout,
+a password change, and a store being deactivated go through the ORM, so none
+of them can forget. Bulk statements can't be seen: `revoke_other_sessions`,
+a single DELETE, calls `forget_owner` itself. Other workers can't be seen
+either; SESSION_CACHE_TTL_SECONDS bounds how long a token revoked elsewhere
+keeps working here.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+from typing import NamedTuple, Optional, Union
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from .models import CustomerAccount, CustomerSession, StoreProfile, VendorSession
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "30"))
+
+SessionRow = Union[VendorSession, CustomerSession]
+Owner = Union[StoreProfile, CustomerAccount]
+
+# Which owner each kind of session belongs to, and through which column.
+OWNERS: dict[type, tuple[type, str]] = {
+    VendorSession: (StoreProfile, "store_id"),
+    CustomerSession: (CustomerAccount, "customer_id"),
+}
+
+_PENDING_KEY = "session_cache_pending"
+
+
+def detached_copy(instance):
+    """A loaded, session-less twin of `instance` that merge(load=False) accepts."""
+    model = type(instance)
+    copy = model(**{column.key: getattr(instance, column.key) for column in inspect(model).columns})
+    make_transient_to_detached(copy)
+    return copy
+
+
+class CachedSession(NamedTuple):
+    row: SessionRow
+    owner: Owner
+    cached_at: float
+
+
+class SessionCache:
+    """LRU of token → (session row, owner), each entry good for a TTL.
+
+    Indexed by session row and by owner too, so a write to either finds its
+    tokens without a scan. Every forget moves `generation`; a caller reads it
+    before querying and passes it to `put`, so rows read before a write that
+    committed meanwhile are never cached after it.
+    """
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[type, str], CachedSession] = OrderedDict()
+        self._by_row: dict[tuple[type, int], tuple[type, str]] = {}
+        self._by_owner: dict[tuple[type, int], set[tuple[type, str]]] = {}
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: type, token: str) -> Optional[CachedSession]:
+        key = (model, token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.cached_at >= self.ttl:
+                self._discard(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, row: SessionRow, owner: Owner, generation: int) -> None:
+        model = type(row)
+        key = (model, row.token)
+        entry = CachedSession(detached_copy(row), detached_copy(owner), time.monotonic())
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._discard(key)
+            self._entries[key] = entry
+            self._by_row[model, row.id] = key
+            self._by_owner.setdefault((type(owner), owner.id), set()).add(key)
+            while len(self._entries) > self.size:
+                self._discard(next(iter(self._entries)))
+
+    def forget_token(self, model: type, token: str) -> None:
+        with self._lock:
+            self.generation += 1
+            self._discard((model, token))
+
+    def forget_row(self, model: type, row_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            key = self._by_row.get((model, row_id))
+            if key is not None:
+                self._discard(key)
+
+    def forget_owner(self, model: type, owner_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            for key in list(self._by_owner.get((model, owner_id), ())):
+                self._discard(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._by_row.clear()
+            self._by_owner.clear()
+
+    def _discard(self, key: tuple[type, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        model = key[0]
+        self._by_row.pop((model, entry.row.id), None)
+        owner_key = (type(entry.owner), entry.owner.id)
+        keys = self._by_owner.get(owner_key)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_owner[owner_key]
+
+
+class OwnerCache:
+    """LRU of (model, id) → owner, for signed tokens, which have no session
+    row to cache. Same TTL and generation rule as SessionCache."""
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[type, int], tuple[Owner, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+
+    def get(self, model: type, owner_id: int) -> Optional[Owner]:
+        key = (model, owner_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, owner: Owner, generation: int) -> None:
+        entry = (detached_copy(owner), time.monotonic())
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[type(owner), owner.id] = entry
+            self._entries.move_to_end((type(owner), owner.id))
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def forget(self, model: type, owner_id: int) -> None:
+        with self._lock:
+            self.generation += 1
+            self._entries.pop((model, owner_id), None)
+
+
+session_cache = SessionCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS)
+owner_cache = OwnerCache(SESSION_CACHE_SIZE, SESSION_CACHE_TTL_SECONDS)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_writes(session: Session, flush_context) -> None:
+    pending: set[tuple[type, int]] = session.info.setdefault(_PENDING_KEY, set())
+    for instance in chain(session.new, session.dirty, session.deleted):
+        model = type(instance)
+        if model in OWNERS or model in (StoreProfile, CustomerAccount):
+            # The identity survives deletes and expiry, unlike the attributes.
+            identity = inspect(instance).identity
+            if identity is not None:
+                pending.add((model, identity[0]))
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed(session: Session) -> None:
+    for model, row_id in session.info.pop(_PENDING_KEY, ()):
+        if model in OWNERS:
+            session_cache.forget_row(model, row_id)
+        else:
+            session_cache.forget_owner(model, row_id)
+            owner_cache.forget(model, row_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,200 @@
+"""Signed, stateless session tokens — optional, on when SESSION_SIGNING_KEY is set.
+
+An opaque token means nothing until the session table says what it is. A
+signed token carries its own session — kind, owner id, created_at, expires_at
+and a random id — under an HMAC-SHA256, so checking one is a hash, not a
+query:
+
+    st1.<kind>.<owner id>.<created µs>.<expires µs>.<token id>.<signature>
+
+Nothing is stored per token, so sliding the window means issuing a new token
+with a later expiry (`auth` sends it in TOKEN_HEADER) under the same token
+id. Logout and password changes can't delete a row either; they go on a
+revocation list instead — a token id, or "everything this owner had before
+t" — which is small because entries are dropped once every token they cover
+has expired anyway. The list lives in memory, is written to
+`SessionRevocation`, and is reloaded at startup and on an interval, so a
+revocation made by another worker is seen within one reload.
+
+Opaque tokens keep working alongside, so turning the mode on signs nobody out.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+
+from sqlalchemy import Engine, delete
+from sqlmodel import Session, select
+
+from .models import SessionRevocation
+
+SIGNING_KEY = os.getenv("SESSION_SIGNING_KEY", "")
+
+TOKEN_PREFIX = "st1"
+TOKEN_HEADER = "X-Session-Token"
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def signing_enabled() -> bool:
+    return bool(SIGNING_KEY)
+
+
+def is_signed(token: str) -> bool:
+    return token.startswith(TOKEN_PREFIX + ".")
+
+
+class TokenClaims(NamedTuple):
+    kind: str
+    """"vendor" or "customer"; a token only opens its own side."""
+    owner_id: int
+    created_at: datetime
+    expires_at: datetime
+    token_id: str
+    """Shared by every reissue of one login, so one logout ends them all."""
+
+
+def new_token_id() -> str:
+    return secrets.token_urlsafe(12)
+
+
+def _micros(moment: datetime) -> int:
+    return (moment - EPOCH) // MICROSECOND
+
+
+def _signature(payload: str) -> str:
+    digest = hmac.new(SIGNING_KEY.encode(), payload.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+
+def issue_token(claims: TokenClaims) -> str:
+    payload = ".".join(
+        (
+            TOKEN_PREFIX,
+            claims.kind,
+            str(claims.owner_id),
+            str(_micros(claims.created_at)),
+            str(_micros(claims.expires_at)),
+            claims.token_id,
+        )
+    )
+    return f"{payload}.{_signature(payload)}"
+
+
+def read_token(token: str) -> Optional[TokenClaims]:
+    """The claims of a well-formed token signed with our key, else None.
+
+    Says nothing about expiry or revocation; `auth` checks those.
+    """
+    if not signing_enabled():
+        return None
+    payload, _, signature = token.rpartition(".")
+    if not hmac.compare_digest(signature.encode(), _signature(payload).encode()):
+        return None
+    try:
+        prefix, kind, owner_id, created, expires, token_id = payload.split(".")
+        if prefix != TOKEN_PREFIX:
+            return None
+        return TokenClaims(
+            kind=kind,
+            owner_id=int(owner_id),
+            created_at=EPOCH + int(created) * MICROSECOND,
+            expires_at=EPOCH + int(expires) * MICROSECOND,
+            token_id=token_id,
+        )
+    except ValueError:
+        return None
+
+
+class RevocationList:
+    """Revoked token ids and per-owner cutoffs, each kept until it can't
+    matter any more.
+
+    A reload reads the table and then swaps the result in, and a revocation
+    made here in between would be lost with the old contents. So `add` also
+    journals each entry under a sequence number: `mark` before the read, and
+    `replace` re-applies whatever was journalled after the mark.
+    """
+
+    def __init__(self) -> None:
+        self._token_ids: dict[str, datetime] = {}
+        self._cutoffs: dict[tuple[str, int], tuple[datetime, datetime]] = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._journal: list[tuple[int, SessionRevocation]] = []
+
+    def __len__(self) -> int:
+        return len(self._token_ids) + len(self._cutoffs)
+
+    def is_revoked(self, claims: TokenClaims) -> bool:
+        if claims.token_id in self._token_ids:
+            return True
+        cutoff = self._cutoffs.get((claims.kind, claims.owner_id))
+        return cutoff is not None and claims.created_at < cutoff[0]
+
+    def add(self, row: SessionRevocation) -> None:
+        with self._lock:
+            self._sequence += 1
+            self._journal.append((self._sequence, row))
+            self._apply(row)
+
+    def mark(self) -> int:
+        """Call before reading the table; pass the result to `replace`."""
+        with self._lock:
+            return self._sequence
+
+    def replace(self, rows: list[SessionRevocation], since: int) -> None:
+        fresh = RevocationList()
+        for row in rows:
+            fresh._apply(row)
+        with self._lock:
+            # Entries up to `since` were committed before the read began, so
+            # `rows` has them; later ones may not have made it in.
+            self._journal = [entry for entry in self._journal if entry[0] > since]
+            for _sequence, row in self._journal:
+                fresh._apply(row)
+            self._token_ids = fresh._token_ids
+            self._cutoffs = fresh._cutoffs
+
+    def _apply(self, row: SessionRevocation) -> None:
+        if row.token_id is not None:
+            self._token_ids[row.token_id] = row.expires_at
+            return
+        key = (row.kind, row.owner_id)
+        current = self._cutoffs.get(key)
+        if current is None or row.revoked_before > current[0]:
+            self._cutoffs[key] = (row.revoked_before, row.expires_at)
+
+
+revocations = RevocationList()
+
+
+def revoke(session: Session, row: SessionRevocation) -> None:
+    """Record a revocation here at once, and durably for the other workers."""
+    session.add(row)
+    session.commit()
+    revocations.add(row)
+
+
+def load_revocations(bind: Engine, now: datetime) -> int:
+    """Replace the in-memory list with every revocation still in force."""
+    since = revocations.mark()
+    with Session(bind) as session:
+        rows = session.exec(
+            select(SessionRevocation).where(SessionRevocation.expires_at >= now)
+        ).all()
+    revocations.replace(rows, since)
+    return len(rows)
+
+
+def sweep_revocations(bind: Engine, now: datetime) -> int:
+    """Delete revocations that every token they cover has outlived."""
+    with bind.begin() as connection:
+        table = SessionRevocation.__table__
+        return connection.execute(delete(table).where(table.c.expires_at < now)).rowcount
@@ -0,0 +1,339 @@
+"""An immutable in-memory copy of the active catalog.
+
+The catalog only changes when a vivero edits inventory or a store is toggled,
+yet every storefront read used to re-query every active store and item. The
+snapshot is built once per change to the catalog's contents and shared by all
+readers, so a read is a few dictionary lookups. `refresh_snapshot` keeps it
+current from a background task; requests only ever read it.
+
+Holds *unpriced* rows. Prices depend on `now`, so they are still resolved per
+request by `catalog.build_catalog_item`.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from bisect import bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from functools import cached_property
+from itertools import chain, islice
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional
+
+import structlog
+from sqlalchemy import Engine
+from sqlmodel import Session, select
+
+from .batch_pricing import PriceColumns
+from .cache import catalog_version
+from .fts import fts_enabled
+from .models import CatalogFacets, CatalogVivero, InventoryItem, StoreProfile
+from .pricing import discount_edges
+from .search import SearchIndex
+
+logger = structlog.get_logger()
+
+# Writes in this process are picked up on the next refresh. Writes made by
+# another worker can't be seen, so this bounds how long they stay invisible.
+SNAPSHOT_MAX_AGE_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_MAX_AGE_SECONDS", "30"))
+
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_REFRESH_SECONDS", "1"))
+
+# The store columns a shopper's view of the catalog depends on. Anything else
+# — password hashes, contact details, timestamps — changing must not change
+# the ETag.
+STORE_FINGERPRINT_FIELDS = (
+    "id",
+    "name",
+    "address",
+    "store_discount_percent",
+    "store_discount_starts_at",
+    "store_discount_ends_at",
+)
+
+
+def load_active_catalog(
+    session: Session,
+) -> tuple[list[InventoryItem], dict[int, StoreProfile]]:
+    """Every inventory item belonging to an active vivero, plus its store."""
+    stores = session.exec(
+        select(StoreProfile).where(StoreProfile.is_active == True)  # noqa: E712
+    ).all()
+    store_lookup = {store.id: store for store in stores}
+    if not store_lookup:
+        return [], {}
+
+    # Paused listings are hidden from customers entirely; sold-out ones are not.
+    items = session.exec(
+        select(InventoryItem)
+        .where(InventoryItem.store_id.in_(store_lookup.keys()))
+        .where(InventoryItem.is_active == True)  # noqa: E712
+        .order_by(InventoryItem.created_at.desc())
+    ).all()
+    return items, store_lookup
+
+
+class RelatedIndex:
+    """Listings bucketed for the "related" strip on a product page.
+
+    Related means same category, ranked same genus first, then same vivero,
+    then anything else — newest first within each tier. Each tier is one
+    bucket, so a lookup reads three buckets from the front and stops at the
+    limit. The exclusions stay bounded too: the store bucket is only reached
+    when the genus bucket came up short, so it can hold only a handful of
+    same-genus rows to skip, and likewise for the category bucket.
+    """
+
+    def __init__(self, items: tuple[InventoryItem, ...]) -> None:
+        by_genus: dict[tuple, list[InventoryItem]] = defaultdict(list)
+        by_store: dict[tuple, list[InventoryItem]] = defaultdict(list)
+        by_category: dict[Optional[str], list[InventoryItem]] = defaultdict(list)
+        for item in items:
+            if item.genus:
+                by_genus[item.category, item.genus].append(item)
+            by_store[item.category, item.store_id].append(item)
+            by_category[item.category].append(item)
+        self.by_genus = {key: tuple(bucket) for key, bucket in by_genus.items()}
+        self.by_store = {key: tuple(bucket) for key, bucket in by_store.items()}
+        self.by_category = {key: tuple(bucket) for key, bucket in by_category.items()}
+
+    def related(self, item: InventoryItem, limit: int) -> list[InventoryItem]:
+        genus = item.genus
+
+        def same_genus(candidate: InventoryItem) -> bool:
+            return bool(genus) and candidate.genus == genus
+
+        ranked = chain(
+            self.by_genus.get((item.category, genus), ()) if genus else (),
+            (
+                candidate
+                for candidate in self.by_store.get((item.category, item.store_id), ())
+                if not same_genus(candidate)
+            ),
+            (
+                candidate
+                for candidate in self.by_category.get(item.category, ())
+                if candidate.store_id != item.store_id and not same_genus(candidate)
+            ),
+        )
+        return list(islice((c for c in ranked if c.id != item.id), limit))
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """Read-only by contract: the rows are shared across requests and threads.
+
+    The ORM objects are detached from the session that loaded them, so
+    nothing can lazy-load or flush through them — but nothing stops a caller
+    assigning an attribute either. Don't.
+    """
+
+    version: int
+    """The `catalog_version` it was built at. A snapshot outlives versions
+    whose writes left the catalog as it was; see `refresh_snapshot`."""
+    items: tuple[InventoryItem, ...]
+    """Newest first, the storefront's default order."""
+    items_by_id: Mapping[int, InventoryItem]
+    stores: Mapping[int, StoreProfile]
+    facets: CatalogFacets
+    fingerprint: str
+    """A digest of every row, so two workers holding the same data agree on it
+    even though their in-process versions differ."""
+    price_edges: tuple[datetime, ...]
+    """Sorted instants at which some price in the catalog can change."""
+    related: RelatedIndex
+
+    def etag(self, now: datetime) -> str:
+        """Strong ETag for anything priced from this snapshot at `now`.
+
+        Prices are a function of the rows and of which discount edges have
+        passed, so counting the passed edges is enough — two instants with the
+        same count price every listing identically.
+        """
+        return f'"c-{self.fingerprint}-{bisect_right(self.price_edges, now)}"'
+
+    def next_price_change(self, now: datetime) -> Optional[datetime]:
+        """`pricing.next_price_change` over the whole catalog, by bisection."""
+        at = bisect_right(self.price_edges, now)
+        return self.price_edges[at] if at < len(self.price_edges) else None
+
+    @cached_property
+    def search_index(self) -> SearchIndex:
+        """Built by `load_snapshot` before the snapshot is published, so a
+        search request never builds it; skipped when FTS5 does the searching."""
+        return SearchIndex(self.items, self.stores)
+
+    @cached_property
+    def price_columns(self) -> PriceColumns:
+        """`items` in columnar form, so pricing all of them is one batch."""
+        return PriceColumns.from_rows((item, self.stores[item.store_id]) for item in self.items)
+
+
+def catalog_fingerprint(
+    items: list[InventoryItem],
+    store_lookup: dict[int, StoreProfile],
+) -> str:
+    """A digest of the shopper-facing rows; see `CatalogSnapshot.fingerprint`."""
+    # In id order, so every worker derives the same tag from the same rows.
+    digest = hashlib.blake2b(digest_size=12)
+    for store_id in sorted(store_lookup):
+        store = store_lookup[store_id]
+        digest.update(repr([getattr(store, f) for f in STORE_FINGERPRINT_FIELDS]).encode())
+    for item in sorted(items, key=lambda item: item.id):
+        digest.update(repr(item.model_dump()).encode())
+    return digest.hexdigest()
+
+
+def build_snapshot(
+    version: int,
+    items: list[InventoryItem],
+    store_lookup: dict[int, StoreProfile],
+    fingerprint: Optional[str] = None,
+) -> CatalogSnapshot:
+    genera = sorted({item.genus for item in items if item.genus})
+    categories = sorted({item.category for item in items if item.category})
+
+    counts: dict[int, int] = defaultdict(int)
+    for item in items:
+        counts[item.store_id] += 1
+    viveros = [
+        CatalogVivero(
+            id=store.id,
+            name=store.name,
+            location=store.address,
+            item_count=counts[store.id],
+        )
+        for store in sorted(store_lookup.values(), key=lambda s: s.name)
+        if counts[store.id] > 0
+    ]
+
+    edges = [
+        edge
+        for item in items
+        for edge in discount_edges(
+            item.discount_percent, item.discount_starts_at, item.discount_ends_at
+        )
+    ]
+    for store in store_lookup.values():
+        if counts[store.id]:
+            edges.extend(
+                discount_edges(
+                    store.store_discount_percent,
+                    store.store_discount_starts_at,
+                    store.store_discount_ends_at,
+                )
+            )
+
+    ordered = tuple(items)
+    return CatalogSnapshot(
+        version=version,
+        items=ordered,
+        items_by_id=MappingProxyType({item.id: item for item in items}),
+        stores=MappingProxyType(dict(store_lookup)),
+        facets=CatalogFacets(genera=genera, categories=categories, viveros=viveros),
+        fingerprint=fingerprint or catalog_fingerprint(items, store_lookup),
+        price_edges=tuple(sorted(edges)),
+        related=RelatedIndex(ordered),
+    )
+
+
+class PublishedSnapshot(NamedTuple):
+    snapshot: CatalogSnapshot
+    version: int
+    """`catalog_version` when the snapshot was last checked against the database."""
+    checked_at: float
+
+    def is_current(self, monotonic_now: float) -> bool:
+        return (
+            self.version == catalog_version.value
+            and monotonic_now - self.checked_at < SNAPSHOT_MAX_AGE_SECONDS
+        )
+
+
+_published: Optional[PublishedSnapshot] = None
+_rebuild_lock = threading.Lock()
+
+
+def load_snapshot(session: Session, previous: Optional[PublishedSnapshot]) -> PublishedSnapshot:
+    """Check the catalog against the database, rebuilding only if it changed.
+
+    A write that leaves the shopper-facing rows as they were — or a max-age
+    check that finds nothing new — keeps `previous`'s snapshot object, and
+    with it everything derived from it: the related buckets, price columns,
+    search index and encoded catalog body.
+    """
+    # Read before querying: a write that lands mid-build bumps past this, so
+    # the next refresh looks again rather than trusting a half-old snapshot.
+    version = catalog_version.value
+    items, store_lookup = load_active_catalog(session)
+    for row in (*items, *store_lookup.values()):
+        session.expunge(row)
+
+    fingerprint = catalog_fingerprint(items, store_lookup)
+    if previous is not None and previous.snapshot.fingerprint == fingerprint:
+        return PublishedSnapshot(previous.snapshot, version, time.monotonic())
+    snapshot = build_snapshot(version, items, store_lookup, fingerprint)
+    if not fts_enabled():
+        # Touching the cached property builds the index now, off any request.
+        snapshot.search_index  # noqa: B018
+    logger.info("catalog_snapshot_built", version=version, count=len(snapshot.items))
+    return PublishedSnapshot(snapshot, version, time.monotonic())
+
+
+def current_snapshot(session: Session) -> CatalogSnapshot:
+    """The catalog snapshot, as last published.
+
+    Edits are picked up by `refresh_snapshot`, off the request path; until it
+    swaps a new snapshot in, this one keeps being served. Only a cold worker,
+    with none published yet, builds one on a request — one build at a time,
+    so a burst of first requests waits for it instead of each running its own.
+    """
+    global _published
+
+    published = _published
+    if published is not None:
+        return published.snapshot
+
+    with _rebuild_lock:
+        published = _published
+        if published is None:
+            published = load_snapshot(session, None)
+            _published = published
+    return published.snapshot
+
+
+def refresh_snapshot(bind: Engine) -> bool:
+    """Re-check the catalog if a write or the max age says so.
+
+    Run by the app's lifespan every SNAPSHOT_REFRESH_SECONDS, as
+    `promotions.refresh_schedule` is. True when the snapshot was replaced;
+    False when it was current, or the check found the same rows.
+    """
+    global _published
+
+    published = _published
+    if published is not None and published.is_current(time.monotonic()):
+        return False
+
+    with _rebuild_lock:
+        previous = _published
+        with Session(bind) as session:
+            published = load_snapshot(session, previous)
+        _published = published
+    return previous is None or published.snapshot is not previous.snapshot
+
+
+def peek_snapshot() -> Optional[CatalogSnapshot]:
+    """The current snapshot if it is known to be up to date; never builds one.
+
+    For callers that must not serve a price a refresh hasn't caught up with
+    yet, and whose own query is cheaper than a rebuild — see
+    `catalog.get_pricing`.
+    """
+    published = _published
+    if published is not None and published.is_current(time.monotonic()):
+        return published.snapshot
+    return None
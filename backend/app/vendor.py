@@ -1,20 +1,31 @@
 from collections import defaultdict
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import Literal, Optional
 
 import structlog
-from fastapi import APIRouter, Depends, File, Header, HTTPException, Query, UploadFile
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    UploadFile,
+)
 from sqlmodel import Session, select
 
 from .auth import (
-    VENDOR_IDLE_MINUTES,
     bearer_token,
     get_current_store,
     get_session,
-    new_expiration,
     revoke_other_sessions,
     revoke_token,
+    start_session,
 )
+from .kdf import hash_password, rehash_if_outdated, verify_password
+from .login_throttle import client_address, login_throttle
 from .models import (
     ChangePasswordRequest,
     InventoryItem,
@@ -27,6 +38,8 @@ from .models import (
     OrderLineRead,
     OrderRead,
     OrdersPage,
+    Promotion,
+    PromotionAnalytics,
     RecentOrder,
     StoreProfile,
     StorePublic,
@@ -34,16 +47,13 @@ from .models import (
     TopPlant,
     VendorLogin,
     VendorLoginResponse,
+    VendorPromotionAnalytics,
     VendorSession,
     VendorStats,
     VendorTotals,
 )
-from .security import (
-    MIN_PASSWORD_LENGTH,
-    generate_session_token,
-    hash_password,
-    verify_password,
-)
+from .promotion_stats import GRAINS, load_series
+from .security import MIN_PASSWORD_LENGTH
 from .storage import ImageValidationError, delete_image, save_image
 
 logger = structlog.get_logger()
@@ -59,7 +69,9 @@ __all__ = ["router", "get_session", "get_current_store"]
 
 
 @router.post("/login", response_model=VendorLoginResponse)
-def login(payload: VendorLogin, session: Session = Depends(get_session)):
+def login(payload: VendorLogin, request: Request, session: Session = Depends(get_session)):
+    address = client_address(request)
+    login_throttle.check(payload.email, address)
     store = session.exec(select(StoreProfile).where(StoreProfile.email == payload.email)).first()
 
     if (
@@ -69,15 +81,14 @@ def login(payload: VendorLogin, session: Session = Depends(get_session)):
         or not verify_password(payload.password, store.password_hash)
     ):
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    login_throttle.succeeded(payload.email, address)
 
-    token = generate_session_token()
-    vendor_session = VendorSession(
-        store_id=store.id,
-        token=token,
-        expires_at=new_expiration(datetime.utcnow(), VENDOR_IDLE_MINUTES),
-    )
-    session.add(vendor_session)
-    session.commit()
+    if rehash_if_outdated(store, payload.password):
+        session.add(store)
+        session.commit()
+        logger.info("vendor_password_rehashed", store_id=store.id)
+
+    token, _expires_at = start_session(session, VendorSession, store.id, datetime.utcnow())
 
     logger.info("vendor_logged_in", store_id=store.id)
     return VendorLoginResponse(token=token, vendor=StorePublic.from_orm(store))
@@ -295,6 +306,7 @@ def list_orders(
 @router.post("/change-password", status_code=204)
 def change_password(
     payload: ChangePasswordRequest,
+    response: Response,
     authorization: Optional[str] = Header(default=None),
     store: StoreProfile = Depends(get_current_store),
     session: Session = Depends(get_session),
@@ -321,6 +333,7 @@ def change_password(
         VendorSession.store_id,
         store.id,
         bearer_token(authorization) or "",
+        response,
     )
     logger.info("vendor_password_changed", store_id=store.id)
 
@@ -409,3 +422,59 @@ def get_stats(
         low_stock=low_stock,
         recent_orders=recent_orders,
     )
+
+
+def as_naive_utc(moment: datetime) -> datetime:
+    """Stored times are naive UTC; an explicit offset from the client is honoured."""
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@router.get("/promotions/analytics", response_model=VendorPromotionAnalytics)
+def get_promotion_analytics(
+    grain: Literal["hour", "day", "month"] = "day",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    store: StoreProfile = Depends(get_current_store),
+    session: Session = Depends(get_session),
+):
+    """Impressions, clicks and CTR per period for this vivero's promotions.
+
+    Reads only the pre-aggregated table for `grain`. The range is capped per
+    grain, so every answer is a bounded primary-key range scan. The current
+    day and month trail by up to one rollup interval.
+    """
+    spec = GRAINS[grain]
+    end = as_naive_utc(end) if end else datetime.utcnow()
+    start = as_naive_utc(start) if start else end - spec.default_span
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    if end - start > spec.max_span:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {spec.max_span.days} days of data per request at {grain} grain",
+        )
+
+    promos = session.exec(
+        select(Promotion).where(Promotion.store_id == store.id).order_by(Promotion.id)
+    ).all()
+    series = (
+        load_series(session, [promo.id for promo in promos], spec, start, end) if promos else {}
+    )
+
+    logger.info("promotion_analytics_read", store_id=store.id, grain=grain)
+    return VendorPromotionAnalytics(
+        grain=grain,
+        start=start,
+        end=end,
+        promotions=[
+            PromotionAnalytics(
+                promotion_id=promo.id,
+                headline_es=promo.headline_es,
+                headline_en=promo.headline_en,
+                points=series.get(promo.id, []),
+            )
+            for promo in promos
+        ],
+    )
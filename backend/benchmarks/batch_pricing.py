@@ -0,0 +1,98 @@
+"""Per-item `resolve_pricing` against `PriceColumns.resolve`, 10k to 1M listings.
+
+    cd backend && python -m benchmarks.batch_pricing [--sizes 10000 100000 1000000]
+
+Builds a synthetic catalog with a realistic mix of item and store discounts,
+checks both paths agree on every price, then reports the best of a few runs of
+each. Column building is reported separately: the snapshot pays it once per
+rebuild, while pricing runs again at every discount edge.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from app.batch_pricing import PriceColumns
+from app.models import InventoryItem, StoreProfile
+from app.pricing import resolve_pricing
+
+NOW = datetime(2026, 7, 29, 12, 0, 0)
+STORES = 50
+REPEATS = 3
+
+
+def synthetic_rows(size: int, seed: int = 1) -> list[tuple[InventoryItem, StoreProfile]]:
+    rng = random.Random(seed)
+    day = timedelta(days=1)
+
+    def window():
+        return rng.choice([(None, None), (NOW - day, NOW + day), (NOW + day, None)])
+
+    stores = []
+    for store_id in range(1, STORES + 1):
+        starts, ends = window()
+        stores.append(
+            StoreProfile(
+                id=store_id,
+                name=f"Vivero {store_id}",
+                email=f"vivero{store_id}@plantera.pr",
+                store_discount_percent=rng.choice([0, 0, 10, 15]),
+                store_discount_starts_at=starts,
+                store_discount_ends_at=ends,
+            )
+        )
+
+    rows = []
+    for item_id in range(1, size + 1):
+        starts, ends = window()
+        store = rng.choice(stores)
+        item = InventoryItem(
+            id=item_id,
+            store_id=store.id,
+            plant_name=f"Planta {item_id}",
+            price=rng.randint(100, 20_000) / 100,
+            discount_percent=rng.choice([0, 0, 0, 20, 35]),
+            discount_starts_at=starts,
+            discount_ends_at=ends,
+        )
+        rows.append((item, store))
+    return rows
+
+
+def best_of(run) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    print(f"{'items':>10} {'per-item':>10} {'columns':>10} {'batch':>10} {'speedup':>8}")
+    for size in args.sizes:
+        rows = synthetic_rows(size)
+
+        columns = PriceColumns.from_rows(rows)
+        batch = columns.resolve(NOW).price
+        scalar = [resolve_pricing(item, store, NOW).price for item, store in rows]
+        assert batch.tolist() == scalar, "batch and per-item prices disagree"
+
+        per_item = best_of(
+            lambda rows=rows: [resolve_pricing(item, store, NOW) for item, store in rows]
+        )
+        build = best_of(lambda rows=rows: PriceColumns.from_rows(rows))
+        vectorized = best_of(lambda columns=columns: columns.resolve(NOW))
+        print(
+            f"{size:>10} {per_item * 1000:>8.1f}ms {build * 1000:>8.1f}ms "
+            f"{vectorized * 1000:>8.1f}ms {per_item / vectorized:>7.0f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
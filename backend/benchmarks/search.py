@@ -0,0 +1,101 @@
+"""`SearchIndex` build and query latency, 10k and 100k listings.
+
+    cd backend && python -m benchmarks.search [--sizes 10000 100000] [--limit 20]
+
+Builds a synthetic catalog with realistic names, genera, tags and viveros,
+then times a spread of queries from very selective to one that matches
+almost everything. Each query is run both ways: ranking every match, as the
+endpoint used to, and keeping only the page asked for. The index build is
+reported separately; the snapshot refresh pays it once per catalog change,
+never a search request.
+"""
+
+import argparse
+import random
+import time
+
+from app.models import InventoryItem, StoreProfile
+from app.search import SearchIndex
+
+STORES = 50
+REPEATS = 5
+
+GENERA = [
+    "Monstera",
+    "Philodendron",
+    "Anthurium",
+    "Calathea",
+    "Aloe",
+    "Ficus",
+    "Pothos",
+    "Sansevieria",
+    "Begonia",
+    "Orquídea",
+]
+KINDS = ["Deliciosa", "Adansonii", "Variegata", "Mini", "Grande", "Rosa", "Roja", "Trepadora"]
+TAGS = ["tropical", "interior", "sombra", "sol", "suculenta", "colgante", "pet friendly"]
+WORDS = ["planta", "ideal", "para", "interior", "hojas", "verdes", "riego", "semanal", "luz"]
+
+QUERIES = ["monstera deliciosa 4", "anthurium rosa", "philo", "sombra", "planta"]
+
+
+def synthetic_catalog(size: int, seed: int = 1):
+    rng = random.Random(seed)
+    stores = {
+        store_id: StoreProfile(
+            id=store_id, name=f"Vivero {store_id}", email=f"vivero{store_id}@plantera.pr"
+        )
+        for store_id in range(1, STORES + 1)
+    }
+    items = [
+        InventoryItem(
+            id=item_id,
+            store_id=rng.randint(1, STORES),
+            plant_name=f"{genus} {rng.choice(KINDS)} {item_id}",
+            genus=genus,
+            tags=", ".join(rng.sample(TAGS, 2)),
+            description=" ".join(rng.choices(WORDS, k=8)),
+            price=rng.randint(100, 20_000) / 100,
+            is_featured=rng.random() < 0.05,
+        )
+        for item_id in range(1, size + 1)
+        for genus in [rng.choice(GENERA)]
+    ]
+    return items, stores
+
+
+def best_of(run) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        items, stores = synthetic_catalog(size)
+        started = time.perf_counter()
+        index = SearchIndex(items, stores)
+        build = time.perf_counter() - started
+        print(f"\n{size} items, index built in {build * 1000:.0f}ms")
+        print(f"{'query':>22} {'matches':>8} {'rank all':>10} {'top ' + str(args.limit):>10}")
+
+        for query in QUERIES:
+            ranked = index.search(query)
+            top = index.search(query, args.limit)
+            assert top.hits == ranked.hits[: args.limit], "top-k and full ranking disagree"
+
+            full = best_of(lambda index=index, query=query: index.search(query))
+            page = best_of(lambda index=index, query=query: index.search(query, args.limit))
+            print(f"{query:>22} {top.total:>8} {full * 1000:>8.1f}ms {page * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,26 @@
+import csv
+import io
+import json
+import random
+import threading
+import time
 from datetime import datetime, timedelta
 from typing import Generator
 
+import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import delete, event, insert, text
+from sqlalchemy.engine import Engine
 from sqlmodel import Session, SQLModel, create_engine
 
-from app.catalog import get_session as catalog_get_session
+from app import catalog, feed, fts
+from app.cache import PRICED_MAX_AGE_SECONDS, catalog_version
+from app.catalog import RELATED_LIMIT, get_session as catalog_get_session, priced_full_catalog
+from app.compression import variant_etag
 from app.main import app, get_session
-from app.models import InventoryItem, StoreProfile
+from app.models import CatalogResponse, InventoryItem, StoreProfile
+from app.search import SearchIndex
+from app.snapshot import RelatedIndex, build_snapshot, current_snapshot, refresh_snapshot
 
 
 def get_test_engine():
@@ -160,12 +174,18 @@ def setup_module(module):
         module.sold_out_id = sold_out.id
         module.hidden_item_id = hidden_item.id
 
+    # What the lifespan does at startup.
+    refresh_snapshot(engine)
+
 
 def teardown_module(module):
     app.dependency_overrides.clear()
     app.dependency_overrides.update(module._saved_overrides)
     engine = get_test_engine()
     SQLModel.metadata.drop_all(engine)
+    # Not in SQLModel's metadata, so drop_all leaves it behind.
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {fts.FTS_TABLE}"))
 
 
 client = TestClient(app)
@@ -292,6 +312,40 @@ def test_an_expired_item_discount_falls_through_to_the_store_discount():
     assert item["price"] == 18.0
 
 
+def test_related_index_matches_a_full_relevance_sort():
+    """The bucketed lookup must rank exactly like sorting every candidate."""
+    rng = random.Random(7)
+    items = tuple(
+        InventoryItem(
+            id=n,
+            store_id=rng.randint(1, 4),
+            plant_name=f"Planta {n}",
+            price=10.0,
+            genus=rng.choice([None, "Monstera", "Ficus", "Aloe"]),
+            category=rng.choice([None, "plant", "pot"]),
+        )
+        for n in range(1, 301)
+    )
+    index = RelatedIndex(items)
+
+    def reference(item: InventoryItem) -> list[int]:
+        def relevance(candidate: InventoryItem) -> int:
+            if candidate.genus and candidate.genus == item.genus:
+                return 0
+            if candidate.store_id == item.store_id:
+                return 1
+            return 2
+
+        ranked = sorted(
+            (c for c in items if c.id != item.id and c.category == item.category),
+            key=relevance,
+        )
+        return [c.id for c in ranked[:RELATED_LIMIT]]
+
+    for item in items:
+        assert [c.id for c in index.related(item, RELATED_LIMIT)] == reference(item)
+
+
 def test_detail_and_related_both_carry_the_discount_shape():
     data = client.get(f"/api/catalog/{discounted_id}").json()
     assert data["item"]["original_price"] == 40.0
@@ -328,3 +382,548 @@ def test_pricing_is_not_swallowed_by_the_item_id_route():
 
 def test_pricing_ignores_junk_ids():
     assert client.get("/api/catalog/pricing?ids=abc,,-1").json() == []
+
+
+# --- snapshot cache ---------------------------------------------------------------
+
+
+class CountQueries:
+    """Records every SQL statement any engine runs while active."""
+
+    def __enter__(self):
+        self.statements: list[str] = []
+        event.listen(Engine, "before_cursor_execute", self.record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(Engine, "before_cursor_execute", self.record)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+def test_a_warm_catalog_is_served_without_touching_the_database():
+    client.get("/api/catalog")
+
+    with CountQueries() as queries:
+        assert client.get("/api/catalog").status_code == 200
+        assert client.get(f"/api/catalog/{monstera_id}").status_code == 200
+        assert client.get(f"/api/catalog/pricing?ids={monstera_id}").status_code == 200
+    assert queries.statements == []
+
+
+def test_a_committed_write_reaches_the_snapshot_on_the_next_refresh():
+    client.get("/api/catalog")
+    engine = get_test_engine()
+
+    def set_stock(stock: int) -> None:
+        with Session(engine) as session:
+            item = session.get(InventoryItem, monstera_id)
+            item.stock = stock
+            session.add(item)
+            session.commit()
+
+    set_stock(3)
+    try:
+        # Requests never rebuild: the old snapshot is served until the refresh.
+        with CountQueries() as queries:
+            assert find(client.get("/api/catalog").json()["items"], monstera_id)["stock"] == 12
+        assert queries.statements == []
+        # A cart is never priced from a snapshot the refresh hasn't caught up with.
+        assert client.get(f"/api/catalog/pricing?ids={monstera_id}").json()[0]["stock"] == 3
+
+        assert refresh_snapshot(engine) is True
+        assert find(client.get("/api/catalog").json()["items"], monstera_id)["stock"] == 3
+    finally:
+        set_stock(12)
+        refresh_snapshot(engine)
+    assert client.get(f"/api/catalog/{monstera_id}").json()["item"]["stock"] == 12
+
+
+def test_a_refresh_that_finds_the_same_rows_keeps_the_snapshot_and_its_caches(monkeypatch):
+    engine = get_test_engine()
+    with Session(engine) as session:
+        before = current_snapshot(session)
+    body = priced_full_catalog(before, datetime.utcnow())
+
+    def set_phone(phone) -> None:
+        with Session(engine) as session:
+            store = session.get(StoreProfile, before.items[0].store_id)
+            store.phone = phone
+            session.add(store)
+            session.commit()
+
+    # A write that changes nothing a shopper sees, then the max age running out.
+    set_phone("787-555-0199")
+    try:
+        assert refresh_snapshot(engine) is False
+        monkeypatch.setattr("app.snapshot.SNAPSHOT_MAX_AGE_SECONDS", 0)
+        assert refresh_snapshot(engine) is False
+    finally:
+        set_phone(None)
+
+    with Session(engine) as session:
+        assert current_snapshot(session) is before
+    assert priced_full_catalog(before, datetime.utcnow()) is body
+
+
+def test_cold_pricing_cost_stays_flat_as_the_catalog_grows():
+    """A cart re-price right after a write must not reload the whole catalog."""
+    engine = get_test_engine()
+    with Session(engine) as session:
+        store_id = session.get(InventoryItem, monstera_id).store_id
+        last_seeded = session.exec(text("SELECT max(id) FROM inventoryitem")).scalar_one()
+
+    def grow(count: int) -> None:
+        with Session(engine) as session:
+            session.execute(
+                insert(InventoryItem),
+                [
+                    {"store_id": store_id, "plant_name": f"Relleno {n}", "price": 5.0}
+                    for n in range(count)
+                ],
+            )
+            session.commit()
+
+    def cold_pricing_cost() -> tuple[int, int]:
+        loaded = []
+
+        def record(session, instance):
+            loaded.append(instance)
+
+        # Bulk inserts skip the cache hook; bumping by hand also makes sure
+        # the request sees no warm snapshot.
+        catalog_version.bump()
+        event.listen(Session, "loaded_as_persistent", record)
+        try:
+            with CountQueries() as queries:
+                response = client.get(f"/api/catalog/pricing?ids={monstera_id},{last_seeded}")
+        finally:
+            event.remove(Session, "loaded_as_persistent", record)
+        assert response.status_code == 200
+        return len(queries.statements), len(loaded)
+
+    try:
+        small = cold_pricing_cost()
+        grow(2000)
+        large = cold_pricing_cost()
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(InventoryItem).where(InventoryItem.id > last_seeded))
+            session.commit()
+        catalog_version.bump()
+
+    assert small == large
+    assert large[0] == 1
+
+
+# --- conditional GET --------------------------------------------------------------
+
+
+def test_catalog_revalidates_with_a_304_and_no_body():
+    first = client.get("/api/catalog")
+    etag = first.headers["etag"]
+    assert etag.startswith('"') and first.headers["cache-control"].startswith("max-age=")
+
+    again = client.get("/api/catalog", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+    assert again.headers["etag"] == etag
+
+    cart = client.get(f"/api/catalog/pricing?ids={monstera_id}")
+    cart_etag = cart.headers["etag"]
+    assert cart_etag != etag
+    again = client.get(
+        f"/api/catalog/pricing?ids={monstera_id}", headers={"If-None-Match": cart_etag}
+    )
+    assert again.status_code == 304
+
+
+def test_max_age_stops_at_the_next_discount_edge():
+    engine = get_test_engine()
+
+    def schedule_sale(starts_at) -> None:
+        with Session(engine) as session:
+            item = session.get(InventoryItem, monstera_id)
+            item.discount_percent = 20 if starts_at else 0
+            item.discount_starts_at = starts_at
+            session.add(item)
+            session.commit()
+        refresh_snapshot(engine)
+
+    schedule_sale(datetime.utcnow() + timedelta(seconds=10))
+    try:
+        for url in (
+            "/api/catalog",
+            f"/api/catalog/{monstera_id}",
+            f"/api/catalog/pricing?ids={monstera_id}",
+        ):
+            max_age = int(client.get(url).headers["cache-control"].removeprefix("max-age="))
+            assert 0 < max_age <= 10
+    finally:
+        schedule_sale(None)
+
+    # Nothing scheduled: capped rather than unbounded.
+    cache_control = client.get(f"/api/catalog/pricing?ids={monstera_id}").headers["cache-control"]
+    assert cache_control == f"max-age={PRICED_MAX_AGE_SECONDS}"
+
+
+def test_the_priced_catalog_is_reused_until_the_next_edge():
+    store = StoreProfile(id=1, name="Vivero", email="v@plantera.pr")
+    noon = datetime(2026, 7, 29, 12, 0, 0)
+    sale = InventoryItem(
+        id=1,
+        store_id=1,
+        plant_name="Ficus",
+        price=20.0,
+        discount_percent=50,
+        discount_starts_at=noon + timedelta(hours=1),
+    )
+    snapshot = build_snapshot(1, [sale], {1: store})
+
+    first = priced_full_catalog(snapshot, noon)
+    assert priced_full_catalog(snapshot, noon + timedelta(minutes=59)) is first
+    after = priced_full_catalog(snapshot, noon + timedelta(hours=1))
+    assert after is not first
+    assert json.loads(after.identity)["items"][0]["price"] == 10.0
+
+
+def test_concurrent_requests_encode_the_priced_catalog_once(monkeypatch):
+    store = StoreProfile(id=1, name="Vivero", email="v@plantera.pr")
+    item = InventoryItem(id=1, store_id=1, plant_name="Ficus", price=20.0)
+    snapshot = build_snapshot(1, [item], {1: store})
+    noon = datetime(2026, 7, 29, 12, 0, 0)
+
+    builds = []
+    list_full_catalog = catalog.list_full_catalog
+
+    def slow_listing(*args):
+        builds.append(1)
+        time.sleep(0.05)
+        return list_full_catalog(*args)
+
+    monkeypatch.setattr(catalog, "list_full_catalog", slow_listing)
+    bodies = []
+    threads = [
+        threading.Thread(target=lambda: bodies.append(priced_full_catalog(snapshot, noon)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert all(body is bodies[0] for body in bodies)
+
+
+@pytest.mark.parametrize("accept", ["br", "gzip", "identity", "gzip;q=0.5, br;q=0.1"])
+def test_the_catalog_is_served_pre_encoded(accept):
+    plain = client.get("/api/catalog", headers={"Accept-Encoding": "identity"})
+    response = client.get("/api/catalog", headers={"Accept-Encoding": accept})
+    expected = {"br": "br", "gzip": "gzip", "identity": None}.get(accept, "gzip")
+
+    assert response.headers.get("content-encoding") == expected
+    assert response.headers["vary"] == "Accept-Encoding"
+    # Different bytes, so a different strong tag for each coding.
+    assert response.headers["etag"] == variant_etag(plain.headers["etag"], expected or "identity")
+    # httpx decodes transparently, so this compares the decoded bytes.
+    assert response.content == plain.content
+    assert CatalogResponse.model_validate_json(plain.content).total == 7
+
+
+def test_if_none_match_is_judged_against_the_coding_served():
+    gzipped = client.get("/api/catalog", headers={"Accept-Encoding": "gzip"})
+    tag = gzipped.headers["etag"]
+    assert tag.endswith('-gzip"')
+
+    again = client.get("/api/catalog", headers={"Accept-Encoding": "gzip", "If-None-Match": tag})
+    assert again.status_code == 304
+    assert again.headers["etag"] == tag
+    # A gzip tag never validates the identity bytes.
+    plain = client.get(
+        "/api/catalog", headers={"Accept-Encoding": "identity", "If-None-Match": tag}
+    )
+    assert plain.status_code == 200
+    assert plain.headers["etag"] != tag
+
+
+def test_a_stale_etag_gets_the_full_body():
+    response = client.get("/api/catalog", headers={"If-None-Match": '"c-stale-0"'})
+    assert response.status_code == 200
+    assert response.json()["total"] == 7
+
+
+def test_the_etag_moves_when_the_catalog_does():
+    before = client.get("/api/catalog").headers["etag"]
+    engine = get_test_engine()
+
+    def set_price(price: float) -> None:
+        with Session(engine) as session:
+            item = session.get(InventoryItem, monstera_id)
+            item.price = price
+            session.add(item)
+            session.commit()
+        refresh_snapshot(engine)
+
+    set_price(43.0)
+    try:
+        assert client.get("/api/catalog").headers["etag"] != before
+    finally:
+        set_price(42.0)
+    assert client.get("/api/catalog").headers["etag"] == before
+
+
+def test_the_fingerprint_ignores_row_order_and_private_store_fields():
+    def rows(**store_fields):
+        stores = {
+            n: StoreProfile(id=n, name=f"Vivero {n}", email=f"v{n}@plantera.pr", **store_fields)
+            for n in (1, 2)
+        }
+        items = [
+            InventoryItem(
+                id=n,
+                store_id=1 + n % 2,
+                plant_name=f"Planta {n}",
+                price=10.0,
+                created_at=datetime(2026, 7, 1),
+                updated_at=datetime(2026, 7, 1),
+            )
+            for n in (1, 2, 3)
+        ]
+        return items, stores
+
+    items, stores = rows(password_hash="pbkdf2$1")
+    fingerprint = build_snapshot(1, items, stores).fingerprint
+
+    shuffled = build_snapshot(1, items[::-1], dict(reversed(stores.items())))
+    assert shuffled.fingerprint == fingerprint
+    rehashed = build_snapshot(1, *rows(password_hash="pbkdf2$2", phone="787-555-0100"))
+    assert rehashed.fingerprint == fingerprint
+    on_sale = build_snapshot(1, *rows(store_discount_percent=10))
+    assert on_sale.fingerprint != fingerprint
+
+
+# --- search -----------------------------------------------------------------------
+
+
+def test_search_ranks_and_prices_like_the_catalog():
+    response = client.get("/api/catalog/search?q=monstera")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 2
+    assert {item["id"] for item in data["items"]} == {monstera_id, adansonii_id}
+    assert data["items"][0]["price"] in (42.0, 38.0)
+
+
+def test_search_folds_accents_and_hides_what_the_shop_hides():
+    assert client.get("/api/catalog/search?q=TERRACOTA").json()["total"] == 1
+    assert client.get("/api/catalog/search?q=pausada").json()["total"] == 0
+    assert client.get("/api/catalog/search?q=oculta").json()["total"] == 0
+
+
+def test_search_limit_caps_items_not_total():
+    data = client.get("/api/catalog/search?q=a&limit=1").json()
+    assert len(data["items"]) == 1
+    assert data["total"] > 1
+
+
+def test_search_is_not_swallowed_by_the_item_id_route():
+    assert client.get("/api/catalog/search").status_code == 422
+
+
+def test_the_search_index_is_built_by_the_refresh_not_by_a_search(monkeypatch):
+    builds = []
+
+    def counted(*args):
+        builds.append(1)
+        return SearchIndex(*args)
+
+    engine = get_test_engine()
+
+    def set_name(name: str) -> None:
+        with Session(engine) as session:
+            item = session.get(InventoryItem, monstera_id)
+            item.plant_name = name
+            session.add(item)
+            session.commit()
+        refresh_snapshot(engine)
+
+    monkeypatch.setattr("app.snapshot.SearchIndex", counted)
+    set_name("Costilla de Adán")
+    try:
+        assert builds == [1]
+        for query in ("adan", "costilla", "maceta"):
+            assert client.get(f"/api/catalog/search?q={query}").json()["total"] >= 1
+        assert builds == [1]
+    finally:
+        set_name("Monstera Deliciosa")
+
+
+def test_fts5_search_ranks_by_bm25_and_follows_edits(monkeypatch):
+    engine = get_test_engine()
+    with engine.begin() as connection:
+        connection.execute(text(f"DROP TABLE IF EXISTS {fts.FTS_TABLE}"))
+    fts.ensure_fts_index(engine)
+    monkeypatch.setattr(fts, "SEARCH_BACKEND", "fts5")
+
+    data = client.get("/api/catalog/search?q=mons").json()
+    assert {item["id"] for item in data["items"]} == {monstera_id, adansonii_id}
+    assert data["total"] == 2
+    # Accents fold, and paused or hidden-vivero listings never surface.
+    assert client.get("/api/catalog/search?q=MACETA").json()["total"] == 1
+    assert client.get("/api/catalog/search?q=oculta").json()["total"] == 0
+
+    def rename(name: str) -> None:
+        with Session(engine) as session:
+            item = session.get(InventoryItem, monstera_id)
+            item.plant_name = name
+            session.add(item)
+            session.commit()
+
+    rename("Costilla de Adán")
+    try:
+        assert client.get("/api/catalog/search?q=adan").json()["total"] == 2
+        assert client.get("/api/catalog/search?q=deliciosa").json()["total"] == 0
+    finally:
+        rename("Monstera Deliciosa")
+
+
+def test_fts5_quotes_shopper_input_rather_than_obeying_it():
+    assert fts.match_expression('monstera OR "x') == '"monstera"* "or"* """x"*'
+
+
+# --- keyset paging ----------------------------------------------------------------
+
+
+def walk_pages(query: str = "", limit: int = 2) -> list[dict]:
+    """Follow next_cursor to the end, returning every item seen."""
+    seen: list[dict] = []
+    cursor = ""
+    while True:
+        response = client.get(f"/api/catalog?limit={limit}&cursor={cursor}{query}")
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= limit
+        seen.extend(page["items"])
+        if page["next_cursor"] is None:
+            return seen
+        cursor = page["next_cursor"]
+
+
+def test_paging_walks_the_whole_catalog_once_newest_first():
+    legacy = client.get("/api/catalog").json()
+    paged = walk_pages()
+    ids = [item["id"] for item in paged]
+
+    assert len(ids) == len(set(ids))
+    assert set(ids) == {item["id"] for item in legacy["items"]}
+    stamps = [item["created_at"] for item in paged]
+    assert stamps == sorted(stamps, reverse=True)
+
+
+def test_the_legacy_response_is_unchanged_without_paging_params():
+    data = client.get("/api/catalog").json()
+    assert "facets" in data
+    assert "next_cursor" not in data
+
+
+def test_last_page_has_no_cursor():
+    page = client.get("/api/catalog?limit=100").json()
+    assert page["next_cursor"] is None
+    assert len(page["items"]) == 7
+
+
+def test_paging_filters_on_genus_category_and_vivero():
+    assert {i["plant_name"] for i in walk_pages("&genus=Monstera")} == {
+        "Monstera Deliciosa",
+        "Monstera Adansonii",
+    }
+    assert [i["plant_name"] for i in walk_pages("&category=pot")] == ["Maceta de terracota"]
+
+    sale_store = find(client.get("/api/catalog").json()["items"], store_sale_id)["store_id"]
+    assert {i["id"] for i in walk_pages(f"&vivero={sale_store}")} == {store_sale_id, expired_id}
+
+
+def test_paging_filters_on_sale_and_effective_price():
+    on_sale = {item["id"] for item in walk_pages("&on_sale=true")}
+    assert on_sale == {discounted_id, store_sale_id, expired_id}
+
+    # The ficus lists at $40 but sells at $30, so the range judges $30.
+    cheap = {item["id"] for item in walk_pages("&min_price=25&max_price=30")}
+    assert discounted_id in cheap
+    assert monstera_id not in cheap
+
+
+def test_a_selective_max_price_costs_one_query_however_big_the_catalog():
+    engine = get_test_engine()
+    with Session(engine) as session:
+        store_id = session.get(InventoryItem, monstera_id).store_id
+        last_seeded = session.exec(text("SELECT max(id) FROM inventoryitem")).scalar_one()
+        # Newest first, so without a SQL bound every dear row is walked first.
+        now = datetime.utcnow()
+        dear = {"store_id": store_id, "plant_name": "Cara", "price": 50.0, "created_at": now}
+        cheap = {
+            "store_id": store_id,
+            "plant_name": "Rebajada",
+            "price": 10.0,
+            "discount_percent": 50,
+            "created_at": now - timedelta(days=400),
+        }
+        session.execute(insert(InventoryItem), [dear] * 3000 + [cheap])
+        session.commit()
+    try:
+        with CountQueries() as queries:
+            page = client.get("/api/catalog?max_price=5&limit=24").json()
+        assert len(queries.statements) == 1
+        # The bound is the discounted price, not the $10 list price.
+        assert [item["plant_name"] for item in page["items"]] == ["Rebajada"]
+    finally:
+        with Session(engine) as session:
+            session.execute(delete(InventoryItem).where(InventoryItem.id > last_seeded))
+            session.commit()
+        catalog_version.bump()
+
+
+def test_a_filter_alone_switches_to_paged_mode():
+    page = client.get("/api/catalog?genus=Monstera").json()
+    assert "next_cursor" in page
+    assert len(page["items"]) == 2
+
+
+def test_a_tampered_cursor_is_a_400_not_a_500():
+    assert client.get("/api/catalog?cursor=not-a-cursor").status_code == 400
+
+
+# --- feed -----------------------------------------------------------------------
+
+
+def test_feed_streams_every_visible_listing_as_ndjson(monkeypatch):
+    # Smaller than the catalog, so the walk takes several batches.
+    monkeypatch.setattr(feed, "FEED_BATCH_SIZE", 2)
+    response = client.get("/api/catalog/feed")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    catalog = client.get("/api/catalog").json()["items"]
+    assert sorted(rows, key=lambda row: row["id"]) == sorted(catalog, key=lambda row: row["id"])
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+
+
+def test_feed_as_csv_has_a_header_and_flat_cells(monkeypatch):
+    monkeypatch.setattr(feed, "FEED_BATCH_SIZE", 3)
+    response = client.get("/api/catalog/feed?format=csv")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 7
+    discounted = next(row for row in rows if int(row["id"]) == discounted_id)
+    assert discounted["discount_percent"] == "25"
+    plain = next(row for row in rows if int(row["id"]) == monstera_id)
+    assert plain["original_price"] == ""
+
+
+def test_feed_rejects_an_unknown_format():
+    assert client.get("/api/catalog/feed?format=xml").status_code == 422
@@ -0,0 +1,42 @@
+import gzip
+
+import brotli
+import pytest
+
+from app.compression import EncodedBody, accepted_encoding
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, "identity"),
+        ("", "identity"),
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("GZIP", "gzip"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("br;q=0, gzip;q=0", "identity"),
+        ("*", "br"),
+        ("*;q=0.5, br;q=0", "gzip"),
+        ("identity;q=0, *;q=0", "identity"),
+        ("br;q=junk, gzip", "gzip"),
+        ("deflate", "identity"),
+    ],
+)
+def test_accepted_encoding_honours_q_values_and_preference(header, expected):
+    assert accepted_encoding(header) == expected
+
+
+def test_every_variant_decodes_to_the_same_body():
+    body = EncodedBody(b'{"items": []}' * 100)
+    assert gzip.decompress(body.variants["gzip"]) == body.identity
+    assert brotli.decompress(body.variants["br"]) == body.identity
+    assert len(body.variants["br"]) < len(body.identity)
+
+
+def test_the_response_carries_the_encoding_and_vary():
+    response = EncodedBody(b"{}").response("gzip", {"ETag": '"x"'})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == '"x"'
+    assert response.media_type == "application/json"
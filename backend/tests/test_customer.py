@@ -5,9 +5,25 @@ from typing import Generator
 from fastapi.testclient import TestClient
 from sqlmodel import Session, SQLModel, create_engine, select
 
-from app.auth import get_session as auth_get_session
+from app import kdf, signed_tokens
+from app.auth import (
+    ABSOLUTE_TTL_DAYS,
+    SESSION_SWEEP_GRACE,
+    expiry_ceiling,
+    flush_session_slides,
+    get_session as auth_get_session,
+    sweep_expired_sessions,
+)
 from app.main import app, get_session
-from app.models import CustomerSession, InventoryItem, StoreProfile
+from app.models import CustomerAccount, CustomerSession, InventoryItem, StoreProfile
+from app.signed_tokens import (
+    TOKEN_HEADER,
+    TokenClaims,
+    is_signed,
+    issue_token,
+    new_token_id,
+    read_token,
+)
 
 
 def get_test_engine():
@@ -335,6 +351,7 @@ def test_sliding_window_writes_once_then_is_suppressed():
         stale = row.expires_at
 
     assert client.get("/api/customers/me", headers=auth(token)).status_code == 200
+    flush_session_slides(engine)
     with Session(engine) as session:
         slid = (
             session.exec(select(CustomerSession).where(CustomerSession.token == token))
@@ -345,6 +362,7 @@ def test_sliding_window_writes_once_then_is_suppressed():
 
     # Second request lands inside TOUCH_INTERVAL_SECONDS, so nothing is written.
     assert client.get("/api/customers/me", headers=auth(token)).status_code == 200
+    flush_session_slides(engine)
     with Session(engine) as session:
         again = (
             session.exec(select(CustomerSession).where(CustomerSession.token == token))
@@ -378,6 +396,38 @@ def test_touch_forces_a_write_inside_the_guard_window():
     assert after >= before
 
 
+def test_the_sweeper_deletes_only_long_expired_sessions_in_batches():
+    token = register("sweep@plantera.pr")
+    engine = get_test_engine()
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        live = session.exec(select(CustomerSession).where(CustomerSession.token == token)).one()
+        stale = [
+            CustomerSession(
+                customer_id=live.customer_id,
+                token=f"sweep-stale-{n}",
+                expires_at=now - timedelta(days=1),
+            )
+            for n in range(5)
+        ]
+        recent = CustomerSession(
+            customer_id=live.customer_id,
+            token="sweep-recent",
+            expires_at=now - SESSION_SWEEP_GRACE + timedelta(minutes=1),
+        )
+        session.add_all([*stale, recent])
+        session.commit()
+
+    swept = sweep_expired_sessions(engine, now, batch_size=2)
+    assert swept["customersession"] == 5
+
+    with Session(engine) as session:
+        tokens = set(session.exec(select(CustomerSession.token)).all())
+    assert token in tokens
+    assert "sweep-recent" in tokens
+    assert not any(t.startswith("sweep-stale-") for t in tokens)
+
+
 def test_logout_revokes_and_is_idempotent():
     token = register("logout@plantera.pr")
     assert client.post("/api/customers/logout", headers=auth(token)).status_code == 204
@@ -386,6 +436,95 @@ def test_logout_revokes_and_is_idempotent():
     assert client.post("/api/customers/logout", headers=auth(token)).status_code == 204
 
 
+def test_login_rehashes_a_password_stored_at_another_cost(monkeypatch):
+    register("rehash@plantera.pr")
+    engine = get_test_engine()
+
+    def stored_iterations() -> int:
+        with Session(engine) as session:
+            customer = session.exec(
+                select(CustomerAccount).where(CustomerAccount.email == "rehash@plantera.pr")
+            ).one()
+            return int(customer.password_hash.split("$")[1])
+
+    assert stored_iterations() == kdf.hash_iterations
+    monkeypatch.setattr(kdf, "hash_iterations", kdf.hash_iterations * 2)
+    login("rehash@plantera.pr")
+    assert stored_iterations() == kdf.hash_iterations
+    # Still the same password.
+    login("rehash@plantera.pr")
+
+
+# --- signed tokens --------------------------------------------------------------
+
+
+def test_signed_tokens_work_without_session_rows_and_revoke(monkeypatch):
+    monkeypatch.setattr(signed_tokens, "SIGNING_KEY", "test-signing-key")
+    token = register("signed@plantera.pr")
+    other = login("signed@plantera.pr")
+    assert is_signed(token)
+    customer_id = read_token(token).owner_id
+
+    engine = get_test_engine()
+    with Session(engine) as session:
+        rows = session.exec(
+            select(CustomerSession).where(CustomerSession.customer_id == customer_id)
+        ).all()
+    assert rows == []
+
+    assert client.get("/api/customers/me", headers=auth(token)).status_code == 200
+    assert client.get("/api/customers/me", headers=auth(other)).status_code == 200
+    # A customer token never opens the vendor side.
+    assert client.get("/api/vendor/me", headers=auth(token)).status_code == 401
+
+    changed = client.post(
+        "/api/customers/change-password",
+        headers=auth(token),
+        json={"current_password": "secret123", "new_password": "newsecret123"},
+    )
+    assert changed.status_code == 204
+    fresh = changed.headers[TOKEN_HEADER]
+    # Every older token is cut off, the caller's included; its replacement works.
+    assert client.get("/api/customers/me", headers=auth(token)).status_code == 401
+    assert client.get("/api/customers/me", headers=auth(other)).status_code == 401
+    assert client.get("/api/customers/me", headers=auth(fresh)).status_code == 200
+
+    assert client.post("/api/customers/logout", headers=auth(fresh)).status_code == 204
+    assert client.get("/api/customers/me", headers=auth(fresh)).status_code == 401
+
+
+def test_a_signed_session_slides_by_reissue_up_to_the_absolute_cap(monkeypatch):
+    monkeypatch.setattr(signed_tokens, "SIGNING_KEY", "test-signing-key")
+    register("signedslide@plantera.pr")
+    customer_id = read_token(login("signedslide@plantera.pr")).owner_id
+    now = datetime.utcnow()
+    near = TokenClaims(
+        "customer",
+        customer_id,
+        now - timedelta(hours=1),
+        now + timedelta(minutes=5),
+        new_token_id(),
+    )
+
+    response = client.get("/api/customers/me", headers=auth(issue_token(near)))
+    assert response.status_code == 200
+    slid = read_token(response.headers[TOKEN_HEADER])
+    assert slid.token_id == near.token_id
+    assert slid.expires_at > near.expires_at
+
+    # Inside the write threshold nothing is reissued, unless touched.
+    quiet = client.get("/api/customers/me", headers=auth(issue_token(slid)))
+    assert TOKEN_HEADER not in quiet.headers
+    touched = client.post("/api/customers/session/touch", headers=auth(issue_token(slid)))
+    assert touched.status_code == 200
+    assert TOKEN_HEADER in touched.headers
+
+    # Near the absolute ceiling the window can't grow past it.
+    old = near._replace(created_at=now - timedelta(days=ABSOLUTE_TTL_DAYS, minutes=-10))
+    capped = client.get("/api/customers/me", headers=auth(issue_token(old)))
+    assert read_token(capped.headers[TOKEN_HEADER]).expires_at == expiry_ceiling(old.created_at)
+
+
 def test_orders_is_empty_until_checkout_exists():
     token = register("orders@plantera.pr")
     response = client.get("/api/customers/orders", headers=auth(token))
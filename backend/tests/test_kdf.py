@@ -0,0 +1,126 @@
+import os
+import threading
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import kdf
+from app.kdf import KdfPool, KdfSaturated
+from app.main import app
+from app.security import (
+    CALIBRATION_STEP,
+    MIN_PBKDF2_ITERATIONS,
+    calibrate_iterations,
+    hash_password,
+    needs_rehash,
+    verify_password,
+)
+
+
+def test_the_pool_hashes_and_verifies_in_worker_processes():
+    pool = KdfPool(workers=1, max_queue=2)
+    try:
+        stored = pool.run(hash_password, "secret123")
+        assert pool.run(verify_password, "secret123", stored) is True
+        assert pool.run(verify_password, "wrong", stored) is False
+    finally:
+        pool.shutdown()
+
+    metrics = pool.metrics()
+    assert metrics["completed"] == 3
+    assert metrics["in_flight"] == 0
+    assert metrics["compute_seconds_total"] > 0
+
+
+def test_a_full_queue_fails_fast_with_a_503():
+    pool = KdfPool(workers=0, max_queue=0)
+    started, release = threading.Event(), threading.Event()
+
+    def hold() -> None:
+        started.set()
+        release.wait(5)
+
+    busy = threading.Thread(target=pool.run, args=(hold,))
+    busy.start()
+    started.wait(5)
+    try:
+        with pytest.raises(HTTPException) as rejected:
+            pool.run(hash_password, "secret123")
+    finally:
+        release.set()
+        busy.join()
+
+    assert rejected.value.status_code == 503
+    assert rejected.value.headers["Retry-After"]
+    assert pool.metrics()["rejected"] == 1
+    # The slot is free again once the running call finishes.
+    assert pool.run(verify_password, "x", "not-a-hash") is False
+
+
+def test_metrics_are_served():
+    body = TestClient(app).get("/metrics").json()
+    assert {"completed", "rejected", "wait_seconds_total", "compute_seconds_total"} <= set(
+        body["kdf"]
+    )
+
+
+def test_calibration_scales_to_the_target_and_keeps_a_floor():
+    fast = calibrate_iterations(0.001)
+    slow = calibrate_iterations(0.5)
+    assert fast == MIN_PBKDF2_ITERATIONS
+    assert slow > fast
+    assert slow % CALIBRATION_STEP == 0
+
+
+def test_a_hash_is_replaced_only_when_its_cost_is_well_off():
+    stored = hash_password("secret123", iterations=200_000)
+    assert not needs_rehash(stored, 200_000)
+    assert not needs_rehash(stored, 220_000)
+    assert needs_rehash(stored, 400_000)
+    assert needs_rehash(stored, 100_000)
+    assert needs_rehash("bcrypt$whatever", 200_000)
+
+
+@pytest.mark.parametrize(
+    "setting,expected",
+    [("0", MIN_PBKDF2_ITERATIONS), ("1000", MIN_PBKDF2_ITERATIONS), ("250000", 250_000)],
+)
+def test_a_fixed_cost_is_held_to_the_floor(monkeypatch, setting, expected):
+    monkeypatch.setattr(kdf, "hash_iterations", kdf.hash_iterations)
+    monkeypatch.setattr(kdf, "PASSWORD_HASH_ITERATIONS", setting)
+    assert kdf.configure_hashing() == expected
+
+
+def test_a_malformed_fixed_cost_stops_startup(monkeypatch):
+    monkeypatch.setattr(kdf, "hash_iterations", kdf.hash_iterations)
+    monkeypatch.setattr(kdf, "PASSWORD_HASH_ITERATIONS", "lots")
+    with pytest.raises(RuntimeError):
+        kdf.configure_hashing()
+
+
+def test_a_saturated_pool_skips_the_rehash_instead_of_failing(monkeypatch):
+    class Owner:
+        password_hash = hash_password("secret123", iterations=MIN_PBKDF2_ITERATIONS)
+
+    def saturated(password):
+        raise KdfSaturated()
+
+    monkeypatch.setattr(kdf, "hash_iterations", 4 * MIN_PBKDF2_ITERATIONS)
+    monkeypatch.setattr(kdf, "hash_password", saturated)
+    stored = Owner.password_hash
+    assert kdf.rehash_if_outdated(Owner, "secret123") is False
+    assert Owner.password_hash == stored
+
+
+def test_a_dead_worker_is_replaced_rather_than_breaking_every_later_call():
+    pool = KdfPool(workers=1, max_queue=2)
+    try:
+        # The worker exits mid-call, and so does the one started for the retry.
+        with pytest.raises(KdfSaturated):
+            pool.run(os._exit, 1)
+        assert pool.metrics()["restarts"] == 2
+        stored = pool.run(hash_password, "secret123")
+        assert pool.run(verify_password, "secret123", stored) is True
+    finally:
+        pool.shutdown()
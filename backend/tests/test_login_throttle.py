@@ -0,0 +1,59 @@
+import pytest
+from fastapi import HTTPException
+
+from app.login_throttle import LoginThrottle, TokenBuckets
+
+
+def test_a_bucket_drains_and_refills_over_time():
+    buckets = TokenBuckets(capacity=2, per_second=0.5, max_keys=10)
+    buckets.add("a", -1, now=0)
+    buckets.add("a", -1, now=0)
+    assert buckets.tokens("a", now=0) == 0
+    assert buckets.seconds_until_token("a", now=0) == 2
+    assert buckets.tokens("a", now=1) == 0.5
+    assert buckets.tokens("a", now=100) == 2
+
+
+def test_buckets_stay_bounded_and_drop_refilled_keys():
+    buckets = TokenBuckets(capacity=1, per_second=1, max_keys=3)
+    for n in range(10):
+        buckets.add(f"key-{n}", -1, now=0)
+    assert len(buckets) == 3
+
+    # Everything has refilled by t=5, so the next write clears the lot.
+    buckets.add("fresh", -1, now=5)
+    assert len(buckets) == 1
+
+
+def test_the_email_bucket_throttles_before_the_address_one():
+    throttle = LoginThrottle()
+    for _ in range(throttle.by_email.capacity):
+        throttle.check("Ana@Plantera.pr", "10.0.0.1", now=0)
+
+    with pytest.raises(HTTPException) as rejected:
+        throttle.check("ana@plantera.pr ", "10.0.0.2", now=0)
+    assert rejected.value.status_code == 429
+    assert int(rejected.value.headers["Retry-After"]) >= 1
+
+    # Another account from the same address still gets through.
+    throttle.check("otro@plantera.pr", "10.0.0.1", now=0)
+    metrics = throttle.metrics()
+    assert metrics["throttled_email"] == 1
+    assert metrics["allowed"] == throttle.by_email.capacity + 1
+
+
+def test_one_address_guessing_many_emails_is_throttled():
+    throttle = LoginThrottle()
+    for n in range(throttle.by_address.capacity):
+        throttle.check(f"user{n}@plantera.pr", "10.0.0.9", now=0)
+    with pytest.raises(HTTPException):
+        throttle.check("another@plantera.pr", "10.0.0.9", now=0)
+    assert throttle.metrics()["throttled_ip"] == 1
+
+
+def test_a_successful_login_gives_its_tokens_back():
+    throttle = LoginThrottle()
+    for _ in range(throttle.by_email.capacity * 3):
+        throttle.check("ana@plantera.pr", "10.0.0.1", now=0)
+        throttle.succeeded("ana@plantera.pr", "10.0.0.1", now=0)
+    assert throttle.metrics()["tracked_emails"] == 0
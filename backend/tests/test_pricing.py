@@ -1,11 +1,19 @@
 """Pure unit tests for the discount rules. No TestClient, no database."""
 
+import random
 from datetime import datetime, timedelta
 
 import pytest
 
+from app.batch_pricing import PriceColumns
 from app.models import InventoryItem, StoreProfile
-from app.pricing import apply_percent, resolve_pricing, window_open
+from app.pricing import (
+    apply_percent,
+    discount_edges,
+    next_price_change,
+    resolve_pricing,
+    window_open,
+)
 
 NOW = datetime(2026, 7, 29, 12, 0, 0)
 HOUR = timedelta(hours=1)
@@ -70,6 +78,50 @@ def test_window_is_closed_outside_its_bounds():
     assert window_open(None, NOW - timedelta(seconds=1), NOW) is False
 
 
+def test_edges_fall_where_the_window_actually_flips():
+    """Open *at* starts_at; closed only once past ends_at."""
+    starts, ends = discount_edges(10, NOW, NOW + HOUR)
+    assert window_open(NOW, NOW + HOUR, starts) is True
+    assert window_open(NOW, NOW + HOUR, starts - timedelta(microseconds=1)) is False
+    assert window_open(NOW, NOW + HOUR, ends - timedelta(microseconds=1)) is True
+    assert window_open(NOW, NOW + HOUR, ends) is False
+
+
+def test_a_zero_percent_or_open_ended_window_has_no_edges():
+    assert discount_edges(0, NOW, NOW + HOUR) == []
+    assert discount_edges(10, None, None) == []
+
+
+def test_next_price_change_is_the_nearest_edge_still_ahead():
+    rows = [
+        (make_item(percent=10, starts=NOW - HOUR, ends=NOW + 3 * HOUR), make_store()),
+        (make_item(), make_store(percent=15, starts=NOW + 2 * HOUR)),
+    ]
+    assert next_price_change(rows, NOW) == NOW + 2 * HOUR
+    assert next_price_change(rows, NOW + 2 * HOUR) == NOW + 3 * HOUR + timedelta(microseconds=1)
+
+
+def test_nothing_ahead_means_no_price_change():
+    rows = [
+        (make_item(percent=10, ends=NOW - HOUR), None),
+        (make_item(percent=0, starts=NOW + HOUR), make_store(percent=20)),
+    ]
+    assert next_price_change(rows, NOW) is None
+    assert next_price_change([], NOW) is None
+
+
+def test_pricing_holds_until_the_next_change():
+    """The contract a cache relies on: no price moves before the reported edge."""
+    rows = [
+        (make_item(percent=30, starts=NOW + HOUR, ends=NOW + 2 * HOUR), make_store(percent=10)),
+    ]
+    edge = next_price_change(rows, NOW)
+    before = [resolve_pricing(item, store, NOW) for item, store in rows]
+    just_before = edge - timedelta(microseconds=1)
+    assert [resolve_pricing(item, store, just_before) for item, store in rows] == before
+    assert [resolve_pricing(item, store, edge) for item, store in rows] != before
+
+
 # --- precedence -----------------------------------------------------------------
 
 
@@ -132,3 +184,55 @@ def test_a_discount_that_rounds_away_is_not_advertised():
     """A struck price identical to the sale price reads as broken."""
     pricing = resolve_pricing(make_item(price=0.01, percent=1), make_store(), NOW)
     assert pricing == (0.01, None, None, None)
+
+
+# --- batch ----------------------------------------------------------------------
+
+
+def batch_resolve(rows, now):
+    return PriceColumns.from_rows(rows).resolve(now).pricings()
+
+
+@pytest.mark.parametrize("price,percent,expected", ROUNDING_VECTORS)
+def test_batch_pricing_meets_the_shared_rounding_vectors(price, percent, expected):
+    (pricing,) = batch_resolve([(make_item(price=price, percent=percent), None)], NOW)
+    assert pricing.price == expected
+
+
+def test_batch_pricing_keeps_precedence_and_the_rounded_away_rule():
+    rows = [
+        (make_item(), make_store()),
+        (make_item(percent=10), make_store(percent=25)),
+        (make_item(percent=40, starts=NOW + HOUR), make_store(percent=10)),
+        (make_item(percent=40, ends=NOW - HOUR), make_store(percent=10)),
+        (make_item(), make_store(percent=25, ends=NOW - HOUR)),
+        (make_item(percent=15), None),
+        (make_item(price=0.01, percent=1), make_store()),
+        (make_item(percent=10, starts=NOW, ends=NOW), make_store()),
+    ]
+    assert batch_resolve(rows, NOW) == [resolve_pricing(item, store, NOW) for item, store in rows]
+
+
+def test_batch_pricing_matches_resolve_pricing_row_for_row():
+    rng = random.Random(11)
+
+    def bound():
+        return rng.choice([None, NOW - HOUR, NOW, NOW + HOUR, NOW - timedelta(microseconds=1)])
+
+    rows = []
+    for _ in range(500):
+        item = make_item(
+            price=rng.randint(1, 50_000) / 100,
+            percent=rng.choice([0, 1, 5, 15, 33, 50, 90]),
+            starts=bound(),
+            ends=bound(),
+        )
+        store = rng.choice(
+            [None, make_store(percent=rng.choice([0, 10, 25]), starts=bound(), ends=bound())]
+        )
+        rows.append((item, store))
+
+    for now in (NOW, NOW + HOUR, NOW - HOUR + timedelta(microseconds=1)):
+        assert batch_resolve(rows, now) == [
+            resolve_pricing(item, store, now) for item, store in rows
+        ]
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.models import Promotion
+from app.promotion_schedule import PromotionSchedule
+from app.promotions import MAX_SLOTS, rank_promotions, tier_rotation
+
+START = datetime(2026, 7, 28, 14, 20, 0)
+END = START + timedelta(days=1)
+
+
+def make_promotion(promo_id: int, priority: int, starts_at: datetime, ends_at: datetime):
+    return Promotion(
+        id=promo_id,
+        store_id=1,
+        headline_es=f"Promo {promo_id}",
+        headline_en=f"Promo {promo_id}",
+        starts_at=starts_at,
+        ends_at=ends_at,
+        priority=priority,
+    )
+
+
+def schedule_of(promos: list[Promotion]) -> PromotionSchedule:
+    return PromotionSchedule(promos, START, END, tier_rotation, MAX_SLOTS)
+
+
+def test_an_empty_schedule_never_changes():
+    schedule = schedule_of([])
+    # Nothing live, so the hours merge into one stretch.
+    assert schedule.ranked_at(START) == ()
+    assert schedule.next_change(START) == END
+
+
+def test_a_window_opens_at_its_start_and_closes_a_tick_after_its_end():
+    opens = datetime(2026, 7, 28, 14, 30, 0)
+    closes = datetime(2026, 7, 28, 14, 40, 0)
+    promo = make_promotion(1, 0, opens, closes)
+    schedule = schedule_of([promo])
+
+    assert schedule.ranked_at(START) == ()
+    assert schedule.next_change(START) == opens
+    assert schedule.ranked_at(opens) == (promo,)
+    # Inclusive end: still live at 14:40:00 exactly, gone one tick later.
+    assert schedule.ranked_at(closes) == (promo,)
+    assert schedule.next_change(opens) == closes + timedelta(microseconds=1)
+    assert schedule.ranked_at(closes + timedelta(microseconds=1)) == ()
+
+
+def test_a_tier_with_several_promotions_rotates_on_the_hour():
+    promos = [make_promotion(promo_id, 10, START - timedelta(days=1), END) for promo_id in (1, 2)]
+    schedule = schedule_of(promos)
+
+    assert schedule.next_change(START) == datetime(2026, 7, 28, 15, 0, 0)
+    assert schedule.ranked_at(START)[0].id != schedule.ranked_at(datetime(2026, 7, 28, 15))[0].id
+
+
+def test_moments_outside_the_horizon_are_refused():
+    schedule = schedule_of([])
+    assert not schedule.covers(END)
+    with pytest.raises(ValueError):
+        schedule.ranked_at(START - timedelta(microseconds=1))
+
+
+@pytest.mark.parametrize("count", [300, 1000])
+def test_the_schedule_matches_filtering_and_ranking_at_every_moment(count):
+    rng = random.Random(16)
+    promos = []
+    for promo_id in range(1, count + 1):
+        starts_at = START + timedelta(minutes=rng.randint(-2000, 1500))
+        ends_at = starts_at + timedelta(minutes=rng.randint(0, 900))
+        promos.append(make_promotion(promo_id, rng.choice([0, 10, 20, 30]), starts_at, ends_at))
+    schedule = schedule_of(promos)
+
+    moments = [START + timedelta(seconds=rng.randint(0, 86_399)) for _ in range(300)]
+    moments += [promo.ends_at for promo in promos if schedule.covers(promo.ends_at)]
+    for moment in moments:
+        live = [promo for promo in promos if promo.starts_at <= moment <= promo.ends_at]
+        expected = rank_promotions(live, moment)[:MAX_SLOTS]
+        assert [p.id for p in schedule.ranked_at(moment)] == [p.id for p in expected]
+        # Nothing the carousel shows changes before next_change.
+        change = schedule.next_change(moment)
+        assert moment < change <= END
+        before = change - timedelta(microseconds=1)
+        assert [p.id for p in schedule.ranked_at(before)] == [p.id for p in expected]
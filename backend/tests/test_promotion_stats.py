@@ -0,0 +1,96 @@
+from datetime import datetime, timedelta
+
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from app.models import (
+    Promotion,
+    PromotionStatsDaily,
+    PromotionStatsHourly,
+    PromotionStatsMonthly,
+    StoreProfile,
+)
+from app.promotion_events import flush_promotion_events, pending_events
+from app.promotion_stats import GRAINS, load_series, rollup_promotion_stats
+
+NOW = datetime(2026, 7, 31, 23, 30, 0)
+
+
+def get_test_engine():
+    return create_engine(
+        "sqlite:///./test_promotion_stats.db", connect_args={"check_same_thread": False}
+    )
+
+
+def setup_module(module):
+    engine = get_test_engine()
+    SQLModel.metadata.drop_all(engine)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        store = StoreProfile(name="Vivero Activo", email="activo@plantera.pr")
+        session.add(store)
+        session.commit()
+        session.refresh(store)
+        promo = Promotion(
+            store_id=store.id,
+            headline_es="Oferta",
+            headline_en="Sale",
+            ends_at=NOW + timedelta(days=30),
+        )
+        session.add(promo)
+        session.commit()
+        session.refresh(promo)
+        module.promotion_id = promo.id
+    pending_events.drain()
+
+
+def teardown_module(module):
+    SQLModel.metadata.drop_all(get_test_engine())
+
+
+promotion_id = 0
+
+
+def rows(model) -> list[tuple[datetime, int, int]]:
+    with Session(get_test_engine()) as session:
+        found = session.exec(select(model).order_by(model.period_start)).all()
+        return [(row.period_start, row.impressions, row.clicks) for row in found]
+
+
+def test_flushes_add_to_hourly_buckets_and_rollups_sum_them():
+    engine = get_test_engine()
+    late = NOW.replace(minute=0)
+    # Two hours on the 31st, one on the 30th, across two flushes.
+    pending_events.add(promotion_id, impressions=5, clicks=1, at=NOW)
+    pending_events.add(promotion_id, impressions=2, at=NOW - timedelta(hours=1))
+    pending_events.add(promotion_id, impressions=4, clicks=2, at=NOW - timedelta(days=1))
+    flush_promotion_events(engine)
+    pending_events.add(promotion_id, impressions=1, clicks=1, at=NOW)
+    flush_promotion_events(engine)
+
+    assert rows(PromotionStatsHourly) == [
+        (late - timedelta(days=1), 4, 2),
+        (late - timedelta(hours=1), 2, 0),
+        (late, 6, 2),
+    ]
+    with Session(engine) as session:
+        promo = session.get(Promotion, promotion_id)
+        assert (promo.impressions, promo.clicks) == (12, 4)
+
+    for _ in range(2):  # rerunning a rollup changes nothing
+        rollup_promotion_stats(engine, NOW)
+        assert rows(PromotionStatsDaily) == [
+            (datetime(2026, 7, 30), 4, 2),
+            (datetime(2026, 7, 31), 8, 2),
+        ]
+        assert rows(PromotionStatsMonthly) == [(datetime(2026, 7, 1), 12, 4)]
+
+
+def test_series_reads_only_the_requested_range_with_ctr():
+    engine = get_test_engine()
+    rollup_promotion_stats(engine, NOW)
+    with Session(engine) as session:
+        series = load_series(session, [promotion_id], GRAINS["day"], datetime(2026, 7, 31, 12), NOW)
+    # The start is truncated to its day, so the 31st is included whole.
+    (point,) = series[promotion_id]
+    assert point.period_start == datetime(2026, 7, 31)
+    assert (point.impressions, point.clicks, point.ctr) == (8, 2, 0.25)
@@ -1,13 +1,21 @@
+import asyncio
+import json
 from datetime import datetime, timedelta
 from typing import Generator
 
+import pytest
+from fastapi import HTTPException, Request
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
 from sqlmodel import Session, SQLModel, create_engine
 
 from app.auth import get_session as auth_get_session
 from app.main import app, get_session
-from app.models import Promotion, StoreProfile
-from app.promotions import rank_promotions
+from app.models import InventoryItem, Promotion, StoreProfile
+from app.promotion_events import flush_promotion_events, pending_events
+from app.promotions import MAX_BEACON_BYTES, rank_promotions, read_beacon, refresh_schedule
 
 
 def get_test_engine():
@@ -81,6 +89,9 @@ def setup_module(module):
         module.store_id = store.id
         module.live_high_id = live_high.id
 
+    # Without the lifespan running, tests refresh the schedule themselves.
+    refresh_schedule(engine, datetime.utcnow())
+
 
 def teardown_module(module):
     app.dependency_overrides.clear()
@@ -155,25 +166,130 @@ def test_rotation_never_demotes_a_higher_priority_promotion():
     assert seconds == {2, 3}
 
 
+def per_promotion(deltas) -> dict[int, list[int]]:
+    """Pending deltas summed over their hours."""
+    totals: dict[int, list[int]] = {}
+    for (promotion_id, _hour), (impressions, clicks) in deltas.items():
+        total = totals.setdefault(promotion_id, [0, 0])
+        total[0] += impressions
+        total[1] += clicks
+    return totals
+
+
 def test_event_endpoint_increments_the_right_counter():
     engine = get_test_engine()
+    pending_events.drain()
 
-    assert (
-        client.post(
-            f"/api/promotions/{live_high_id}/event", json={"type": "impression"}
-        ).status_code
-        == 204
-    )
-    assert (
-        client.post(f"/api/promotions/{live_high_id}/event", json={"type": "click"}).status_code
-        == 204
-    )
+    for event_type in ("impression", "impression", "click"):
+        response = client.post(f"/api/promotions/{live_high_id}/event", json={"type": event_type})
+        assert response.status_code == 204
+
+    # Buffered: nothing reaches the row until the flush.
+    with Session(engine) as session:
+        assert session.get(Promotion, live_high_id).impressions == 0
 
+    assert flush_promotion_events(engine) == 1
     with Session(engine) as session:
         promo = session.get(Promotion, live_high_id)
-        assert promo.impressions == 1
+        assert promo.impressions == 2
         assert promo.clicks == 1
 
+    # Counted, so later events for this promotion add to the row.
+    client.post(f"/api/promotions/{live_high_id}/event", json={"type": "click"})
+    flush_promotion_events(engine)
+    with Session(engine) as session:
+        assert session.get(Promotion, live_high_id).clicks == 2
+
+
+def test_a_known_promotion_event_never_touches_the_database():
+    client.post(f"/api/promotions/{live_high_id}/event", json={"type": "impression"})
+
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        for _ in range(5):
+            client.post(f"/api/promotions/{live_high_id}/event", json={"type": "impression"})
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    assert statements == []
+    pending_events.drain()
+
+
+def test_a_failed_flush_keeps_the_counts_for_the_next_one():
+    pending_events.drain()
+    pending_events.add(live_high_id, impressions=3)
+    # A database without the table: the UPDATE fails.
+    broken = create_engine("sqlite://")
+    with pytest.raises(OperationalError):
+        flush_promotion_events(broken)
+
+    pending_events.add(live_high_id, impressions=1)
+    assert per_promotion(pending_events.drain()) == {live_high_id: [4, 0]}
+
+
+def test_beacon_applies_a_batch_as_grouped_increments():
+    pending_events.drain()
+    events = [{"promotion_id": live_high_id, "type": "impression"}] * 4 + [
+        {"promotion_id": live_high_id, "type": "click"},
+        {"promotion_id": 999999, "type": "impression"},
+    ]
+    # sendBeacon with a string body arrives as text/plain.
+    response = client.post(
+        "/api/promotions/events",
+        content=json.dumps(events),
+        headers={"Content-Type": "text/plain;charset=UTF-8"},
+    )
+    assert response.status_code == 204
+    # One delta per promotion; the unknown id is dropped, not fatal.
+    assert per_promotion(pending_events.drain()) == {live_high_id: [4, 1]}
+
+
+@pytest.mark.parametrize(
+    "body,status",
+    [
+        ("not json", 400),
+        ('{"promotion_id": 1, "type": "click"}', 400),
+        ('[{"promotion_id": 1}]', 400),
+        ('[{"promotion_id": 1, "type": "purchase"}]', 400),
+        (json.dumps([{"promotion_id": 1, "type": "click"}] * 101), 413),
+        ("[" + " " * 20_000 + "]", 413),
+    ],
+)
+def test_beacon_rejects_a_bad_batch_whole(body, status):
+    pending_events.drain()
+    response = client.post("/api/promotions/events", content=body)
+    assert response.status_code == status
+    assert not pending_events.drain()
+
+
+def test_beacon_size_is_checked_before_the_body_is_buffered():
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {"type": "http.request", "body": b" " * 1024, "more_body": True}
+
+    # Chunked, no Content-Length: refused once the limit is passed, not at
+    # the end of a body that never ends.
+    request = Request({"type": "http", "method": "POST", "headers": []}, receive)
+    with pytest.raises(HTTPException) as rejected:
+        asyncio.run(read_beacon(request))
+    assert rejected.value.status_code == 413
+    assert len(received) == MAX_BEACON_BYTES // 1024 + 1
+
+    pending_events.drain()
+    declared = client.post(
+        "/api/promotions/events",
+        content=b"[]",
+        headers={"Content-Length": str(MAX_BEACON_BYTES + 1)},
+    )
+    assert declared.status_code == 413
+    assert not pending_events.drain()
+
 
 def test_event_endpoint_rejects_unknown_types_and_ids():
     assert (
@@ -181,3 +297,91 @@ def test_event_endpoint_rejects_unknown_types_and_ids():
         == 400
     )
     assert client.post("/api/promotions/999999/event", json={"type": "click"}).status_code == 404
+
+
+def test_promotions_revalidate_with_a_304():
+    etag = client.get("/api/promotions").headers["etag"]
+    response = client.get("/api/promotions", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_event_counters_do_not_move_the_promotions_etag():
+    """Impressions are not content; counting one must not bust every cache."""
+    before = client.get("/api/promotions").headers["etag"]
+    client.post(f"/api/promotions/{live_high_id}/event", json={"type": "impression"})
+    assert client.get("/api/promotions").headers["etag"] == before
+
+
+# --- cached ranking ---------------------------------------------------------------
+
+
+def count_statements(run) -> int:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        run()
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def test_a_warm_ranking_makes_no_queries():
+    client.get("/api/promotions")
+    assert count_statements(lambda: client.get("/api/promotions")) == 0
+
+
+def edit(model, row_id, **fields) -> None:
+    with Session(get_test_engine()) as session:
+        row = session.get(model, row_id)
+        for name, value in fields.items():
+            setattr(row, name, value)
+        session.add(row)
+        session.commit()
+
+
+def refresh() -> bool:
+    return refresh_schedule(get_test_engine(), datetime.utcnow())
+
+
+def test_editing_a_promotion_or_its_store_rebuilds_the_ranking():
+    assert client.get("/api/promotions").json()[0]["headline_es"] == "Prioridad alta"
+    edit(Promotion, live_high_id, headline_es="Editada")
+    try:
+        assert refresh()
+        assert client.get("/api/promotions").json()[0]["headline_es"] == "Editada"
+    finally:
+        edit(Promotion, live_high_id, headline_es="Prioridad alta")
+        refresh()
+
+    edit(StoreProfile, store_id, name="Vivero Renombrado")
+    try:
+        assert refresh()
+        assert client.get("/api/promotions").json()[0]["store_name"] == "Vivero Renombrado"
+    finally:
+        edit(StoreProfile, store_id, name="Vivero Activo")
+        refresh()
+
+
+def test_requests_keep_the_old_schedule_until_the_refresh_swaps_it():
+    refresh()
+    edit(Promotion, live_high_id, headline_es="Editada")
+    try:
+        responses = []
+        assert count_statements(lambda: responses.append(client.get("/api/promotions"))) == 0
+        assert responses[0].json()[0]["headline_es"] == "Prioridad alta"
+    finally:
+        edit(Promotion, live_high_id, headline_es="Prioridad alta")
+        refresh()
+
+
+def test_inventory_edits_leave_the_schedule_alone():
+    refresh()
+    with Session(get_test_engine()) as session:
+        session.add(InventoryItem(store_id=store_id, plant_name="Helecho", price=12.0))
+        session.commit()
+    assert not refresh()
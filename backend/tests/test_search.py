@@ -0,0 +1,98 @@
+"""Pure unit tests for catalog search. No TestClient, no database.
+
+The catalog and expectations mirror `frontend/__tests__/search.test.ts`, so
+the server ranks exactly as the browser did.
+"""
+
+from app.models import InventoryItem, StoreProfile
+from app.search import SearchIndex, normalize, score_field
+
+VERDE = StoreProfile(id=1, name="Vivero Verde Valle", email="verde@plantera.pr")
+BORIKEN = StoreProfile(id=2, name="Jardines Borikén", email="boriken@plantera.pr")
+STORES = {VERDE.id: VERDE, BORIKEN.id: BORIKEN}
+
+
+def item(item_id: int, plant_name: str, store_id: int = 1, **overrides) -> InventoryItem:
+    return InventoryItem(
+        id=item_id, store_id=store_id, plant_name=plant_name, price=20, **overrides
+    )
+
+
+CATALOG = [
+    item(1, "Monstera Deliciosa", genus="Monstera", tags="tropical, interior"),
+    item(2, "Sábila", genus="Aloe", description="Suculenta medicinal."),
+    item(
+        3,
+        "Maceta de terracota",
+        store_id=2,
+        category="pot",
+        description="Clásica con drenaje, ideal para monstera pequeña.",
+    ),
+    item(4, "Calathea Lancifolia", genus="Calathea", tags="sombra, grande"),
+]
+
+INDEX = SearchIndex(CATALOG, STORES)
+
+
+def ids(query: str) -> list[int]:
+    return [found.id for found, _score in INDEX.search(query).hits]
+
+
+def test_normalize_folds_accents_lowercases_and_trims():
+    assert normalize("Sábila") == "sabila"
+    assert normalize("Jardines Borikén") == "jardines boriken"
+    assert normalize("  MONSTERA  ") == "monstera"
+
+
+def test_finds_accented_names_and_viveros_from_unaccented_input():
+    assert ids("sabila") == [2]
+    assert ids("boriken") == [3]
+
+
+def test_every_token_must_match_somewhere():
+    assert ids("calathea grande") == [4]
+    assert ids("calathea terracota") == []
+
+
+def test_tokens_need_not_be_contiguous():
+    assert ids("deliciosa monstera") == [1]
+
+
+def test_a_name_match_outranks_a_description_match():
+    assert ids("monstera") == [1, 3]
+
+
+def test_matches_mid_word_like_the_browser():
+    assert ids("stera") == [1, 3]
+    assert ids("ab") == [2]
+
+
+def test_a_blank_or_unmatched_query_returns_nothing():
+    assert ids("   ") == []
+    assert ids("orquidea") == []
+
+
+def test_prefix_bonuses_round_half_up_like_math_round():
+    # Vivero weight 3 at a word start is 4.5, which Math.round takes to 5.
+    assert score_field("jardines boriken", "boriken", 3) == 5
+    assert score_field("boriken", "boriken", 3) == 6
+    assert score_field("xboriken", "boriken", 3) == 3
+
+
+def test_featured_stock_breaks_a_tie():
+    plain = item(10, "Pothos")
+    featured = item(11, "Pothos", is_featured=True)
+    index = SearchIndex([plain, featured], STORES)
+    assert [found.id for found, _ in index.search("pothos").hits] == [11, 10]
+
+
+def test_a_limit_keeps_the_best_hits_and_the_full_total():
+    catalog = [item(20 + n, f"Pothos {n}", is_featured=n == 7) for n in range(12)]
+    index = SearchIndex(catalog, STORES)
+    ranked = index.search("pothos")
+
+    top = index.search("pothos", limit=3)
+    assert top.total == ranked.total == 12
+    assert top.hits == ranked.hits[:3]
+    # A name prefix is worth twice the name weight; featured adds one.
+    assert [(found.id, score) for found, score in top.hits] == [(27, 21), (20, 20), (21, 20)]
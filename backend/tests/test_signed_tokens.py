@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import signed_tokens
+from app.models import SessionRevocation
+from app.signed_tokens import (
+    RevocationList,
+    TokenClaims,
+    is_signed,
+    issue_token,
+    new_token_id,
+    read_token,
+)
+
+NOW = datetime(2026, 7, 28, 12, 0, 0, 123456)
+
+
+@pytest.fixture(autouse=True)
+def signing_key(monkeypatch):
+    monkeypatch.setattr(signed_tokens, "SIGNING_KEY", "test-signing-key")
+
+
+def claims(**overrides) -> TokenClaims:
+    fields = {
+        "kind": "customer",
+        "owner_id": 7,
+        "created_at": NOW,
+        "expires_at": NOW + timedelta(minutes=62),
+        "token_id": new_token_id(),
+    }
+    fields.update(overrides)
+    return TokenClaims(**fields)
+
+
+def test_a_token_round_trips_to_the_microsecond():
+    original = claims()
+    token = issue_token(original)
+    assert is_signed(token)
+    assert read_token(token) == original
+
+
+@pytest.mark.parametrize(
+    "tamper",
+    [
+        lambda token: token.replace(".7.", ".8.", 1),
+        lambda token: token[:-2] + ("AA" if not token.endswith("AA") else "BB"),
+        lambda token: token.rpartition(".")[0],
+        lambda token: "st1.garbage",
+    ],
+)
+def test_a_tampered_token_is_refused(tamper):
+    assert read_token(tamper(issue_token(claims()))) is None
+
+
+def test_another_key_or_no_key_refuses_every_token(monkeypatch):
+    token = issue_token(claims())
+    monkeypatch.setattr(signed_tokens, "SIGNING_KEY", "another-key")
+    assert read_token(token) is None
+    monkeypatch.setattr(signed_tokens, "SIGNING_KEY", "")
+    assert read_token(token) is None
+
+
+def test_revocation_by_token_id_covers_every_reissue():
+    revoked = RevocationList()
+    first = claims()
+    slid = first._replace(expires_at=first.expires_at + timedelta(minutes=30))
+    revoked.add(
+        SessionRevocation(kind="customer", owner_id=7, token_id=first.token_id, expires_at=NOW)
+    )
+    assert revoked.is_revoked(first)
+    assert revoked.is_revoked(slid)
+    assert not revoked.is_revoked(claims())
+
+
+def test_an_owner_cutoff_revokes_only_that_owners_older_tokens():
+    revoked = RevocationList()
+    revoked.add(SessionRevocation(kind="customer", owner_id=7, revoked_before=NOW, expires_at=NOW))
+    assert revoked.is_revoked(claims(created_at=NOW - timedelta(seconds=1)))
+    assert not revoked.is_revoked(claims(created_at=NOW))
+    assert not revoked.is_revoked(claims(owner_id=8, created_at=NOW - timedelta(seconds=1)))
+    assert not revoked.is_revoked(claims(kind="vendor", created_at=NOW - timedelta(seconds=1)))
+
+
+def test_a_reload_keeps_revocations_made_while_it_read():
+    revoked = RevocationList()
+    before = SessionRevocation(kind="customer", owner_id=7, token_id="before", expires_at=NOW)
+    revoked.add(before)
+
+    since = revoked.mark()
+    # Revoked here after the reload read the table, before it swapped.
+    during = claims()
+    revoked.add(
+        SessionRevocation(kind="customer", owner_id=7, token_id=during.token_id, expires_at=NOW)
+    )
+    revoked.replace([before], since)
+    assert revoked.is_revoked(during)
+    assert revoked.is_revoked(claims()._replace(token_id="before"))
+
+    # A reload that began after it trusts the table alone: swept, it's gone.
+    revoked.replace([], revoked.mark())
+    assert not revoked.is_revoked(during)
@@ -3,12 +3,25 @@ from pathlib import Path
 from typing import Generator
 
 from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlmodel import Session, SQLModel, create_engine, select
 
-from app.auth import SESSION_HEADER
+from app import vendor
+from app.auth import SESSION_HEADER, flush_session_slides, revoke_other_sessions
+from app.login_throttle import LOGIN_EMAIL_BURST, login_throttle
 from app.main import app, get_session
-from app.models import InventoryItem, Order, OrderItem, StoreProfile, VendorSession
+from app.models import (
+    InventoryItem,
+    Order,
+    OrderItem,
+    Promotion,
+    PromotionStatsDaily,
+    StoreProfile,
+    VendorSession,
+)
 from app.security import hash_password
+from app.session_cache import session_cache
 from app.vendor import get_session as vendor_get_session
 
 
@@ -106,6 +119,25 @@ def test_login_rejects_bad_password():
     assert response.status_code == 401
 
 
+def test_repeated_bad_logins_get_a_429_before_any_hashing(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(vendor, "verify_password", lambda *args: hashed.append(args) or False)
+    login_throttle.clear()
+    try:
+        statuses = [
+            client.post(
+                "/api/vendor/login",
+                json={"email": "test@plantera.pr", "password": "guess"},
+            ).status_code
+            for _ in range(LOGIN_EMAIL_BURST + 2)
+        ]
+    finally:
+        login_throttle.clear()
+
+    assert statuses == [401] * LOGIN_EMAIL_BURST + [429, 429]
+    assert len(hashed) == LOGIN_EMAIL_BURST
+
+
 def test_login_returns_token_and_profile():
     response = client.post(
         "/api/vendor/login",
@@ -155,6 +187,7 @@ def test_activity_slides_the_window_but_not_on_every_request():
         stale = row.expires_at
 
     assert client.get("/api/vendor/me", headers=auth(token)).status_code == 200
+    flush_session_slides(engine)
     with Session(engine) as session:
         row = session.exec(select(VendorSession).where(VendorSession.token == token)).one()
         slid = row.expires_at
@@ -162,11 +195,39 @@ def test_activity_slides_the_window_but_not_on_every_request():
 
     # Immediately again: inside TOUCH_INTERVAL_SECONDS, so no second write.
     assert client.get("/api/vendor/me", headers=auth(token)).status_code == 200
+    flush_session_slides(engine)
     with Session(engine) as session:
         row = session.exec(select(VendorSession).where(VendorSession.token == token)).one()
         assert row.expires_at == slid
 
 
+def test_a_slide_is_advertised_at_once_but_written_at_the_flush():
+    token = login()
+    engine = get_test_engine()
+    with Session(engine) as session:
+        row = session.exec(select(VendorSession).where(VendorSession.token == token)).one()
+        row.expires_at = datetime.utcnow() + timedelta(minutes=5)
+        session.add(row)
+        session.commit()
+        stale = row.expires_at
+
+    response = client.get("/api/vendor/me", headers=auth(token))
+    advertised = datetime.fromisoformat(response.headers[SESSION_HEADER].removesuffix("Z"))
+    assert advertised > stale
+
+    def stored() -> datetime:
+        with Session(engine) as session:
+            return (
+                session.exec(select(VendorSession).where(VendorSession.token == token))
+                .one()
+                .expires_at
+            )
+
+    assert stored() == stale
+    flush_session_slides(engine)
+    assert stored() == advertised
+
+
 def test_inventory_crud_and_ownership():
     token = login()
 
@@ -253,6 +314,8 @@ def test_orders_pagination_and_month_filter():
 def test_change_password_flow():
     token = login()
     other_token = login()
+    # Resolved once, so the revocation below has a cached session to drop.
+    assert client.get("/api/vendor/me", headers=auth(other_token)).status_code == 200
 
     wrong = client.post(
         "/api/vendor/change-password",
@@ -394,6 +457,128 @@ def test_logout_revokes_session():
     assert client.get("/api/vendor/me", headers=auth(token)).status_code == 401
 
 
+# --- cached sessions ------------------------------------------------------------
+
+
+def count_statements(run) -> int:
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", record)
+    try:
+        run()
+    finally:
+        event.remove(Engine, "before_cursor_execute", record)
+    return len(statements)
+
+
+def test_a_warm_session_authenticates_without_queries():
+    token = login()
+    assert client.get("/api/vendor/me", headers=auth(token)).status_code == 200
+
+    responses = []
+    assert (
+        count_statements(
+            lambda: responses.append(client.get("/api/vendor/me", headers=auth(token)))
+        )
+        == 0
+    )
+    assert responses[0].status_code == 200
+    assert responses[0].json()["email"] == "test@plantera.pr"
+
+
+def test_a_cold_session_resolves_in_one_query():
+    token = login()
+    session_cache.clear()
+
+    responses = []
+    assert (
+        count_statements(
+            lambda: responses.append(client.get("/api/vendor/me", headers=auth(token)))
+        )
+        == 1
+    )
+    assert responses[0].status_code == 200
+
+
+def test_deactivating_a_store_drops_its_cached_sessions():
+    token = login()
+    assert client.get("/api/vendor/me", headers=auth(token)).status_code == 200
+
+    engine = get_test_engine()
+
+    def set_active(is_active: bool) -> None:
+        with Session(engine) as session:
+            store = session.get(StoreProfile, store_id)  # noqa: F821 - set in setup_module
+            store.is_active = is_active
+            session.add(store)
+            session.commit()
+
+    set_active(False)
+    try:
+        # Rejected by the lookup itself: one query, and no store to hydrate.
+        responses = []
+        assert (
+            count_statements(
+                lambda: responses.append(client.get("/api/vendor/me", headers=auth(token)))
+            )
+            == 1
+        )
+        assert responses[0].status_code == 401
+    finally:
+        set_active(True)
+    assert client.get("/api/vendor/me", headers=auth(token)).status_code == 200
+
+
+def test_a_profile_edit_is_seen_by_the_next_cached_request():
+    token = login()
+    client.get("/api/vendor/me", headers=auth(token))
+    renamed = client.patch("/api/vendor/me", headers=auth(token), json={"name": "Vivero Nuevo"})
+    assert renamed.status_code == 200
+    try:
+        assert client.get("/api/vendor/me", headers=auth(token)).json()["name"] == "Vivero Nuevo"
+    finally:
+        client.patch("/api/vendor/me", headers=auth(token), json={"name": "Vivero Test"})
+
+
+def test_revoking_other_sessions_is_one_delete_and_drops_cached_tokens():
+    keep, other = login(), login()
+    assert client.get("/api/vendor/me", headers=auth(other)).status_code == 200
+
+    engine = get_test_engine()
+    with Session(engine) as session:
+        others = len(
+            session.exec(
+                select(VendorSession)
+                .where(VendorSession.store_id == store_id)  # noqa: F821 - set in setup_module
+                .where(VendorSession.token != keep)
+            ).all()
+        )
+        removed = []
+        assert (
+            count_statements(
+                lambda: removed.append(
+                    revoke_other_sessions(
+                        session,
+                        VendorSession,
+                        VendorSession.store_id,
+                        store_id,  # noqa: F821 - set in setup_module
+                        keep,
+                    )
+                )
+            )
+            == 1
+        )
+    assert removed == [others]
+
+    # Nothing else wrote the store, so only the explicit forget stops the
+    # cached copy of `other` from answering.
+    assert client.get("/api/vendor/me", headers=auth(other)).status_code == 401
+    assert client.get("/api/vendor/me", headers=auth(keep)).status_code == 200
+
+
 # --- discounts ------------------------------------------------------------------
 
 
@@ -463,3 +648,52 @@ def test_store_wide_discount_is_bounded():
         json={"store_discount_percent": 91},
     )
     assert response.status_code == 422
+
+
+def test_promotion_analytics_reads_daily_rows_for_this_vivero_only():
+    engine = get_test_engine()
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    with Session(engine) as session:
+        other_id = session.exec(
+            select(StoreProfile.id).where(StoreProfile.email == "otro@plantera.pr")
+        ).one()
+        mine = Promotion(
+            store_id=store_id,  # noqa: F821 - set in setup_module
+            headline_es="Mía",
+            headline_en="Mine",
+            ends_at=today,
+        )
+        theirs = Promotion(
+            store_id=other_id, headline_es="Ajena", headline_en="Theirs", ends_at=today
+        )
+        session.add(mine)
+        session.add(theirs)
+        session.commit()
+        session.refresh(mine)
+        session.refresh(theirs)
+        for promo, clicks in ((mine, 5), (theirs, 9)):
+            session.add(
+                PromotionStatsDaily(
+                    promotion_id=promo.id,
+                    period_start=today - timedelta(days=1),
+                    impressions=50,
+                    clicks=clicks,
+                )
+            )
+        session.commit()
+        mine_id = mine.id
+
+    token = login()
+    response = client.get("/api/vendor/promotions/analytics?grain=day", headers=auth(token))
+    assert response.status_code == 200
+    body = response.json()
+    assert [promo["promotion_id"] for promo in body["promotions"]] == [mine_id]
+    (point,) = body["promotions"][0]["points"]
+    assert (point["impressions"], point["clicks"], point["ctr"]) == (50, 5, 0.1)
+
+    too_long = client.get(
+        "/api/vendor/promotions/analytics?grain=hour&start=2026-01-01T00:00:00&end=2026-03-01T00:00:00",
+        headers=auth(token),
+    )
+    assert too_long.status_code == 400
+    assert client.get("/api/vendor/promotions/analytics").status_code == 401
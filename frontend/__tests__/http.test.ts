@@ -125,6 +125,19 @@ describe('request', () => {
     expect(seen).toEqual([['window-token', '2026-07-28T12:20:00.000Z']]);
   });
 
+  it('adopts a reissued session token', async () => {
+    const store = createTokenStore('reissued-token');
+    store.set('old');
+    vi.stubGlobal(
+      'fetch',
+      vi.fn().mockResolvedValue(respond(200, {}, { 'X-Session-Token': 'st1.new' })),
+    );
+
+    await request(store, '/api/x');
+
+    expect(store.get()).toBe('st1.new');
+  });
+
   it('ignores a malformed expiry header rather than corrupting the clock', async () => {
     const store = createTokenStore('bad-window-token');
     const seen: string[] = [];
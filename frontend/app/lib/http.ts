@@ -12,6 +12,9 @@ export const API_BASE_URL =
 /** Server-reported session expiry, so the idle timer can correct its own clock. */
 const SESSION_HEADER = 'X-Session-Expires-At';
 
+/** A replacement token: how a signed session slides, or survives a password change. */
+const TOKEN_HEADER = 'X-Session-Token';
+
 export class ApiError extends Error {
   status: number;
 
@@ -92,7 +95,14 @@ function publishSessionWindow(store: TokenStore, response: Response) {
   sessionWindowListeners.forEach((fn) => fn(store.key, expiresAt));
 }
 
+function adoptReissuedToken(store: TokenStore, response: Response) {
+  // Also needs CORS expose_headers. Set before the 401 check below can clear.
+  const token = response.headers.get(TOKEN_HEADER);
+  if (token && response.ok) store.set(token);
+}
+
 async function handle<T>(store: TokenStore, response: Response): Promise<T> {
+  adoptReissuedToken(store, response);
   publishSessionWindow(store, response);
 
   if (response.status === 401) {